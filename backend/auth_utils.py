@@ -8,7 +8,10 @@ SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkeywhichshouldbechangedsce")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Maliyet değişirse eski hash'ler girişte yeni maliyetle güncellenir (verify_and_update)
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -30,32 +33,129 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from collections import OrderedDict
+from typing import Optional, Tuple
+from database import get_async_db
+import time
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/token")
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends()):
-    # Note: Using manual SessionLocal here to avoid circular dependencies and ensure cleanup
-    from database import SessionLocal
-    from models import User
-    
-    db = SessionLocal()
-    credentials_exception = HTTPException(
+# Doğrulanmış token ve kullanıcı önbellekleri (worker başına, bellekte)
+TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+USER_CACHE_SIZE = int(os.getenv("AUTH_USER_CACHE_SIZE", "10000"))
+# Kullanıcı kaydı en fazla bu kadar eski olabilir (saniye)
+USER_CACHE_TTL = int(os.getenv("AUTH_USER_CACHE_TTL", "60"))
+
+# token -> (email, exp)
+_token_cache: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+# email -> (yüklenme zamanı, kullanıcı)
+_user_cache: "OrderedDict[str, Tuple[float, object]]" = OrderedDict()
+
+_USER_FIELDS = ('id', 'name', 'email', 'work_start_time', 'home_location', 'work_location')
+
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def _put(cache: OrderedDict, key, value, max_size: int):
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > max_size:
+        cache.popitem(last=False)
+
+def _verify_token(token: str) -> str:
+    """
+    Token'ın imzasını doğrular ve subject'ini (email) döndürür. Aynı token için
+    imza kontrolü süresi dolana kadar tekrar yapılmaz.
+    """
+    cached = _token_cache.get(token)
+    if cached is not None:
+        email, exp = cached
+        if exp > time.time():
+            return email
+        _token_cache.pop(token, None)
+    
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-        
-        user = db.query(User).filter(User.email == email).first()
-        if user is None:
-            raise credentials_exception
-        return user
     except JWTError:
-        raise credentials_exception
-    finally:
-        db.close()
+        raise _credentials_exception()
+    email: str = payload.get("sub")
+    if email is None:
+        raise _credentials_exception()
+    
+    exp = payload.get("exp")
+    if exp is not None:
+        _put(_token_cache, token, (email, float(exp)), TOKEN_CACHE_SIZE)
+    return email
+
+def _cached_user(email: str):
+    cached = _user_cache.get(email)
+    if cached is None:
+        return None
+    loaded_at, user = cached
+    if time.monotonic() - loaded_at > USER_CACHE_TTL:
+        _user_cache.pop(email, None)
+        return None
+    return user
+
+def _remember_user(user):
+    """
+    Kullanıcının session'dan bağımsız bir kopyasını saklar; şifre hash'i
+    önbelleğe alınmaz.
+    """
+    from models import User
+    principal = User(**{field: getattr(user, field) for field in _USER_FIELDS})
+    _put(_user_cache, user.email, (time.monotonic(), principal), USER_CACHE_SIZE)
+    return principal
+
+def invalidate_user_cache(email: Optional[str] = None):
+    """Kullanıcı güncellendiğinde/silindiğinde çağrılır; email verilmezse hepsini temizler"""
+    if email is None:
+        _user_cache.clear()
+    else:
+        _user_cache.pop(email, None)
+
+async def _load_user(email: str, db: AsyncSession):
+    from models import User
+    
+    user = _cached_user(email)
+    if user is not None:
+        return user
+    user = (await db.execute(select(User).where(User.email == email))).scalars().first()
+    if user is None:
+        raise _credentials_exception()
+    return _remember_user(user)
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    # Önbellekte yoksa isteğin kendi session'ı kullanılır; ayrı bir bağlantı açılmaz
+    email = _verify_token(token)
+    return await _load_user(email, db)
+
+# Yönetim endpoint'lerine erişebilen kullanıcılar (virgülle ayrılmış email listesi)
+ADMIN_EMAILS = {e.strip().lower() for e in os.getenv("ADMIN_EMAILS", "").split(",") if e.strip()}
+
+async def get_current_admin(current_user = Depends(get_current_user)):
+    """Sadece ADMIN_EMAILS'teki kullanıcılar; liste boşsa yönetim endpoint'leri kapalıdır"""
+    if (current_user.email or "").lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin privileges required")
+    return current_user
+
+async def get_user_from_token(token: str):
+    """
+    Uzun ömürlü bağlantılar (SSE) için: token'ı doğrular ve kullanıcıyı kısa
+    ömürlü bir session ile getirir; bağlantı boyunca DB bağlantısı tutulmaz.
+    EventSource header gönderemediği için token query parametresiyle gelir.
+    """
+    from database import AsyncSessionLocal
+    
+    email = _verify_token(token)
+    user = _cached_user(email)
+    if user is not None:
+        return user
+    async with AsyncSessionLocal() as db:
+        return await _load_user(email, db)
@@ -0,0 +1,86 @@
+"""
+API gecikme (latency) yük testi
+Verilen endpoint'lere N eşzamanlı istemciyle belirli bir süre istek atar ve
+endpoint bazında p50/p95/p99 gecikme ile istek/sn raporlar.
+Sync ve async veritabanı katmanını aynı yük altında karşılaştırmak için
+değişiklik öncesi ve sonrası ayrı ayrı çalıştırılır.
+
+Kullanım: python benchmark_api_latency.py [--base-url http://localhost:8000] [--clients 200] [--duration 30]
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+import numpy as np
+
+DEFAULT_PATHS = [
+    "/api/v1/market-analysis/current-rates",
+    "/api/v1/market-analysis/current-events",
+    "/api/v1/market-analysis/top-impact-events",
+    "/api/v1/market-analysis/upcoming-events",
+    "/api/v1/market-analysis/historical-correlation",
+    "/api/v1/transport/routes",
+]
+
+
+async def client_loop(client, paths, deadline, offset, latencies, errors):
+    i = offset
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            response = await client.get(path)
+            ok = response.status_code < 500
+        except httpx.HTTPError:
+            ok = False
+        elapsed = time.perf_counter() - started
+        if ok:
+            latencies[path].append(elapsed)
+        else:
+            errors[path] += 1
+
+
+async def run(base_url, paths, clients, duration):
+    latencies = {p: [] for p in paths}
+    errors = {p: 0 for p in paths}
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(
+            client_loop(client, paths, deadline, i, latencies, errors) for i in range(clients)
+        ))
+
+    print(f"{clients} istemci, {duration} sn\n")
+    print(f"{'endpoint':<48} {'istek':>7} {'hata':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    all_latencies = []
+    for path in paths:
+        values = np.array(latencies[path]) * 1000
+        all_latencies.extend(values)
+        if len(values):
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        else:
+            p50 = p95 = p99 = float('nan')
+        print(f"{path:<48} {len(values):>7} {errors[path]:>5} {p50:>8.1f} {p95:>8.1f} {p99:>8.1f}")
+
+    if all_latencies:
+        p50, p99 = np.percentile(all_latencies, [50, 99])
+        print(f"\nToplam: {len(all_latencies) / duration:.0f} istek/sn, p50 {p50:.1f} ms, p99 {p99:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--path", action="append", help="Test edilecek endpoint (tekrarlanabilir)")
+    args = parser.parse_args()
+
+    asyncio.run(run(args.base_url, args.path or DEFAULT_PATHS, args.clients, args.duration))
+
+
+if __name__ == "__main__":
+    main()
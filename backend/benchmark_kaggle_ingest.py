@@ -0,0 +1,59 @@
+"""
+Kaggle dataset yükleme benchmark'ı
+Eski satır satır yükleme (parse_and_store_dataset) ile toplu yüklemeyi
+(bulk_store_dataset) aynı veri üzerinde karşılaştırır ve satır/sn raporlar.
+Eklenen satırlar ayrı bir kaynak etiketiyle yazılır ve sonunda silinir.
+
+Kullanım: python benchmark_kaggle_ingest.py [--rows 5000] [--workers 4]
+"""
+
+import argparse
+import os
+import time
+
+from services.kaggle_service import (
+    load_kaggle_dataset, parse_and_store_dataset, bulk_store_dataset, delete_dataset_source
+)
+
+BENCHMARK_SOURCE = "benchmark_ingest"
+
+
+def run(label, func):
+    delete_dataset_source(BENCHMARK_SOURCE)
+    started = time.perf_counter()
+    stored = func()
+    elapsed = time.perf_counter() - started
+    delete_dataset_source(BENCHMARK_SOURCE)
+    rate = stored / elapsed if elapsed > 0 else 0
+    print(f"{label:<28} {stored:>8} satır  {elapsed:>8.2f} sn  {rate:>10.0f} satır/sn")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=None, help="Sadece ilk N satırı kullan")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--skip-legacy", action="store_true", help="Eski yolu çalıştırma")
+    args = parser.parse_args()
+
+    df = load_kaggle_dataset()
+    if df is None:
+        print("Dataset yüklenemedi.")
+        return
+    if args.rows:
+        df = df.head(args.rows)
+
+    print(f"{len(df)} satır üzerinde benchmark\n")
+    legacy = None
+    if not args.skip_legacy:
+        legacy = run("parse_and_store_dataset", lambda: parse_and_store_dataset(df, source=BENCHMARK_SOURCE))
+    bulk = run("bulk (1 süreç)", lambda: bulk_store_dataset(df, source=BENCHMARK_SOURCE))
+    parallel = run(f"bulk ({args.workers} süreç)",
+                   lambda: bulk_store_dataset(df, source=BENCHMARK_SOURCE, workers=args.workers))
+
+    if legacy:
+        print(f"\nHızlanma: {bulk / legacy:.1f}x (tek süreç), {parallel / legacy:.1f}x (paralel)")
+
+
+if __name__ == "__main__":
+    main()
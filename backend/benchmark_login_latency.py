@@ -0,0 +1,92 @@
+"""
+Giriş patlaması altında gecikme testi
+Önce sadece hafif bir endpoint'e istek atarak taban gecikmeyi ölçer, sonra
+aynı yükü eşzamanlı /auth/token (bcrypt) istekleriyle birlikte tekrarlar.
+bcrypt event loop'ta çalışıyorsa ikinci ölçümde hafif endpoint'in p99'u
+giriş süresi kadar artar; hash havuzuyla taban değerine yakın kalmalıdır.
+
+Kullanım: python benchmark_login_latency.py [--base-url http://localhost:8000] [--logins 50] [--duration 20]
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+import numpy as np
+
+PROBE_PATH = "/api/v1/transport/routes"
+EMAIL = "benchmark-login@example.com"
+PASSWORD = "benchmark-password"
+
+
+async def probe_loop(client, deadline, latencies):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            response = await client.get(PROBE_PATH)
+            if response.status_code < 500:
+                latencies.append(time.perf_counter() - started)
+        except httpx.HTTPError:
+            pass
+
+
+async def login_loop(client, deadline, latencies, statuses):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            response = await client.post("/api/v1/auth/token", data={"username": EMAIL, "password": PASSWORD})
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - started)
+        except httpx.HTTPError:
+            statuses['error'] = statuses.get('error', 0) + 1
+
+
+def report(name, values):
+    values = np.array(values) * 1000
+    if not len(values):
+        print(f"{name:<28} istek yok")
+        return
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    print(f"{name:<28} {len(values):>7} {p50:>8.1f} {p95:>8.1f} {p99:>8.1f}")
+
+
+async def run(base_url, probes, logins, duration):
+    limits = httpx.Limits(max_connections=probes + logins, max_keepalive_connections=probes + logins)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        # Test kullanıcısı (zaten varsa 400 döner)
+        await client.post("/api/v1/auth/register", json={"email": EMAIL, "password": PASSWORD, "name": "benchmark"})
+
+        baseline = []
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(probe_loop(client, deadline, baseline) for _ in range(probes)))
+
+        under_burst, login_latencies, statuses = [], [], {}
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(
+            *(probe_loop(client, deadline, under_burst) for _ in range(probes)),
+            *(login_loop(client, deadline, login_latencies, statuses) for _ in range(logins))
+        )
+
+    print(f"{probes} probe istemcisi, {logins} giriş istemcisi, {duration} sn\n")
+    print(f"{'ölçüm':<28} {'istek':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    report(f"{PROBE_PATH} (taban)", baseline)
+    report(f"{PROBE_PATH} (giriş yükü)", under_burst)
+    report("/auth/token", login_latencies)
+    print(f"\nGiriş yanıt kodları: {statuses}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--probes", type=int, default=20)
+    parser.add_argument("--logins", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=20)
+    args = parser.parse_args()
+
+    asyncio.run(run(args.base_url, args.probes, args.logins, args.duration))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,179 @@
 import os
-from sqlalchemy import create_engine
+import threading
+import time
+from collections import deque
+from sqlalchemy import create_engine, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://menager_user:menager_password@db:5432/menager_db")
 
-engine = create_engine(DATABASE_URL)
+_url = make_url(DATABASE_URL)
+# Sürücü belirtilmemişse requirements'taki psycopg2 kullanılsın
+if _url.drivername == "postgresql":
+    _url = _url.set(drivername="postgresql+psycopg2")
+SYNC_DATABASE_URL = _url.render_as_string(hide_password=False)
+# Async route handler'lar için aynı veritabanına asyncpg sürücüsüyle bağlanılır
+ASYNC_DATABASE_URL = os.getenv(
+    "ASYNC_DATABASE_URL",
+    _url.set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+)
+
+
+def _env_bool(name, default):
+    return os.getenv(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+
+# API trafiği (sync + async engine'lerin her biri için ayrı havuz)
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", True)
+STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))
+
+# Scheduler, backfill ve toplu yükleme işleri; API havuzundan bağımsız
+BATCH_POOL_SIZE = int(os.getenv("DB_BATCH_POOL_SIZE", "3"))
+BATCH_MAX_OVERFLOW = int(os.getenv("DB_BATCH_MAX_OVERFLOW", "2"))
+BATCH_POOL_TIMEOUT = float(os.getenv("DB_BATCH_POOL_TIMEOUT", "60"))
+BATCH_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_BATCH_STATEMENT_TIMEOUT_MS", "0"))
+
+# Bekleme süresi yüzdelikleri için tutulan son örnek sayısı
+POOL_WAIT_SAMPLES = 1000
+
+
+class PoolMetrics:
+    """Bir bağlantı havuzunun checkout sayısı, bekleme süreleri ve zaman aşımları"""
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._recent = deque(maxlen=POOL_WAIT_SAMPLES)
+
+    def record_wait(self, seconds):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            self._recent.append(seconds)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self, pool):
+        with self._lock:
+            recent = sorted(self._recent)
+            checkouts, timeouts = self.checkouts, self.timeouts
+            wait_total, wait_max = self.wait_total, self.wait_max
+
+        def percentile(p):
+            if not recent:
+                return None
+            return round(recent[min(len(recent) - 1, int(p / 100 * len(recent)))] * 1000, 2)
+
+        return {
+            'name': self.name,
+            'pool_size': pool.size(),
+            'max_overflow': pool._max_overflow,
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': max(pool.overflow(), 0),
+            'checkouts': checkouts,
+            'timeouts': timeouts,
+            'wait_avg_ms': round(wait_total / checkouts * 1000, 2) if checkouts else None,
+            'wait_max_ms': round(wait_max * 1000, 2),
+            'wait_p50_ms': percentile(50),
+            'wait_p99_ms': percentile(99)
+        }
+
+
+class _MeteredPoolMixin:
+    """Havuzdan bağlantı alma (checkout) süresini ölçer"""
+    metrics = None
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            if self.metrics:
+                self.metrics.record_timeout()
+            raise
+        if self.metrics:
+            self.metrics.record_wait(time.perf_counter() - started)
+        return connection
+
+    def recreate(self):
+        # engine.dispose() yeni havuz oluşturur; metrikler korunur
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+class MeteredQueuePool(_MeteredPoolMixin, QueuePool):
+    pass
+
+
+class MeteredAsyncQueuePool(_MeteredPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def _create_engine(name, pool_size, max_overflow, pool_timeout, statement_timeout_ms):
+    connect_args = {}
+    if statement_timeout_ms:
+        connect_args['options'] = f"-c statement_timeout={statement_timeout_ms}"
+    new_engine = create_engine(
+        SYNC_DATABASE_URL,
+        poolclass=MeteredQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+        pool_recycle=POOL_RECYCLE,
+        pool_pre_ping=POOL_PRE_PING,
+        connect_args=connect_args
+    )
+    new_engine.pool.metrics = PoolMetrics(name)
+    return new_engine
+
+
+def _create_async_engine(name, pool_size, max_overflow, pool_timeout, statement_timeout_ms):
+    connect_args = {}
+    if statement_timeout_ms:
+        connect_args['server_settings'] = {'statement_timeout': str(statement_timeout_ms)}
+    new_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        poolclass=MeteredAsyncQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+        pool_recycle=POOL_RECYCLE,
+        pool_pre_ping=POOL_PRE_PING,
+        connect_args=connect_args
+    )
+    new_engine.sync_engine.pool.metrics = PoolMetrics(name)
+    return new_engine
+
+
+engine = _create_engine("api", POOL_SIZE, MAX_OVERFLOW, POOL_TIMEOUT, STATEMENT_TIMEOUT_MS)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = _create_async_engine("api_async", POOL_SIZE, MAX_OVERFLOW, POOL_TIMEOUT, STATEMENT_TIMEOUT_MS)
+# Commit sonrası nesneler response'ta kullanılabilsin diye expire edilmez
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+# Scheduler job'ları ve toplu yüklemeler API isteklerinin bağlantılarını tüketmesin
+batch_engine = _create_engine("batch", BATCH_POOL_SIZE, BATCH_MAX_OVERFLOW, BATCH_POOL_TIMEOUT,
+                              BATCH_STATEMENT_TIMEOUT_MS)
+BatchSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=batch_engine)
+
 Base = declarative_base()
 
 def get_db():
@@ -16,3 +182,12 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def get_pool_stats():
+    """Tüm bağlantı havuzlarının anlık durumu ve checkout bekleme metrikleri"""
+    pools = [engine.pool, async_engine.sync_engine.pool, batch_engine.pool]
+    return [pool.metrics.snapshot(pool) for pool in pools]
@@ -20,15 +20,32 @@ async def startup_event():
     # Ensure tables exist (Basic check, though seed script is better for this)
     Base.metadata.create_all(bind=engine)
     
+    # Hypertable, OHLC continuous aggregates, compression and retention (requires TimescaleDB)
+    try:
+        from services.timescale_service import setup_timescale
+        setup_timescale()
+    except Exception as e:
+        print(f"TimescaleDB setup skipped: {e}")
+    
+    # Dış servisler için paylaşılan HTTP bağlantı havuzu
+    from services.http_client import http_client
+    await http_client.startup()
+    
     start_scheduler()
 
-from routers import api, auth, etkinlik, market_analysis, transport, notifications
+@app.on_event("shutdown")
+async def shutdown_event():
+    from services.http_client import http_client
+    await http_client.shutdown()
+
+from routers import api, auth, etkinlik, market_analysis, transport, notifications, admin
 app.include_router(auth.router, prefix="/api/v1/auth", tags=["auth"])
 app.include_router(api.router, prefix="/api/v1")
 app.include_router(etkinlik.router, prefix="/api/v1")
 app.include_router(market_analysis.router, prefix="/api/v1")
 app.include_router(transport.router, prefix="/api/v1")
 app.include_router(notifications.router, prefix="/api/v1")
+app.include_router(admin.router, prefix="/api/v1")
 
 @app.get("/")
 async def root():
@@ -0,0 +1,19 @@
+import os
+import redis
+import redis.asyncio as aioredis
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+# Redis erişilemezse istekler uzun süre beklemesin
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "1"))
+
+# Scheduler thread'leri ve senkron servisler için
+redis_client = redis.from_url(
+    REDIS_URL, decode_responses=True,
+    socket_timeout=REDIS_SOCKET_TIMEOUT, socket_connect_timeout=REDIS_SOCKET_TIMEOUT
+)
+
+# Async route handler'lar için (event loop'u bloklamaz)
+async_redis_client = aioredis.from_url(
+    REDIS_URL, decode_responses=True,
+    socket_timeout=REDIS_SOCKET_TIMEOUT, socket_connect_timeout=REDIS_SOCKET_TIMEOUT
+)
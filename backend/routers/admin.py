@@ -0,0 +1,53 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from database import get_db, get_pool_stats
+from auth_utils import get_current_admin
+from services.timescale_service import get_storage_stats
+from services.hashing_service import hashing_service
+from services.http_client import http_client
+
+# Tüm yönetim endpoint'leri iç metrikleri açtığı için sadece adminlere açık
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    dependencies=[Depends(get_current_admin)]
+)
+
+@router.get("/storage")
+def get_market_data_storage(db: Session = Depends(get_db)):
+    """market_data hypertable'ının chunk boyutları ve sıkıştırma oranları"""
+    try:
+        return {
+            'success': True,
+            'data': get_storage_stats(db)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/db-pool")
+def get_db_pool_metrics():
+    """API ve batch bağlantı havuzlarının doluluk, checkout bekleme ve zaman aşımı metrikleri"""
+    return {
+        'success': True,
+        'data': get_pool_stats()
+    }
+
+
+@router.get("/hashing")
+def get_hashing_metrics():
+    """Şifre hash havuzunun kuyruk derinliği, bekleme süresi ve reddedilen istek sayısı"""
+    return {
+        'success': True,
+        'data': hashing_service.stats()
+    }
+
+
+@router.get("/http-clients")
+def get_http_client_metrics():
+    """Dış servis hostlarının circuit breaker durumları"""
+    return {
+        'success': True,
+        'data': http_client.stats()
+    }
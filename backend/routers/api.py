@@ -1,16 +1,48 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Query
+from typing import Optional
+from datetime import datetime
 from services import transit_service, finance_service, budget_service
 
 router = APIRouter()
 
 @router.get("/transit/alarm-recommendation")
 async def get_alarm(user_id: int = 1):
-    return transit_service.recommend_alarm(user_id)
+    return await transit_service.recommend_alarm(user_id)
 
 @router.get("/finance/correlation")
-async def get_correlation(asset1: str = "USDTRY", asset2: str = "XAUUSD"):
-    return finance_service.analyze_correlation(asset1, asset2)
+def get_correlation(
+    asset1: str = "USDTRY",
+    asset2: str = "XAUUSD",
+    mode: str = "pearson",
+    resolution: str = "1d",
+    window: int = Query(30, ge=2, le=5000),
+    lags: str = "0,1,2,3,5,10",
+    returns: bool = False,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+):
+    try:
+        lag_values = tuple(int(l) for l in lags.split(",") if l.strip())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="lags must be a comma-separated list of integers")
+    return finance_service.analyze_correlation(
+        asset1, asset2, mode=mode, resolution=resolution, window=window,
+        lags=lag_values, returns=returns, start=start, end=end
+    )
+
+@router.get("/finance/correlation-matrix")
+def get_correlation_matrix(
+    symbols: Optional[str] = None,
+    resolution: str = "1d",
+    returns: bool = False,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+):
+    symbol_list = [s.strip() for s in symbols.split(",") if s.strip()] if symbols else None
+    return finance_service.analyze_correlation_matrix(
+        symbol_list, resolution=resolution, returns=returns, start=start, end=end
+    )
 
 @router.get("/budget/simulation")
-async def get_simulation(goal_id: int = 1, sacrifice: str = "Cigarettes"):
+def get_simulation(goal_id: int = 1, sacrifice: str = "Cigarettes"):
     return budget_service.simulate_goal_achievement(goal_id, sacrifice)
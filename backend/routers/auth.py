@@ -4,12 +4,14 @@ from fastapi import APIRouter, Depends, HTTPException, status
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.security import OAuth2PasswordRequestForm
 from datetime import timedelta
 import models
-from database import get_db
-from auth_utils import verify_password, get_password_hash, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
+from database import get_async_db
+from auth_utils import create_access_token, invalidate_user_cache, ACCESS_TOKEN_EXPIRE_MINUTES
+from services.hashing_service import hashing_service
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -24,23 +26,29 @@ class Token(BaseModel):
     token_type: str
 
 @router.post("/register", response_model=Token)
-def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     logger.info(f"Attempting to register user: {user.email}")
     try:
-        db_user = db.query(models.User).filter(models.User.email == user.email).first()
+        db_user = (await db.execute(
+            select(models.User).where(models.User.email == user.email)
+        )).scalars().first()
         if db_user:
             logger.warning(f"Registration failed: Email {user.email} already registered")
             raise HTTPException(status_code=400, detail="Email already registered")
+        # Hash kuyruğunda beklerken DB bağlantısı havuza geri verilir
+        await db.rollback()
         
-        hashed_password = get_password_hash(user.password)
+        # bcrypt event loop'u bloklamasın diye sınırlı hash havuzunda
+        hashed_password = await hashing_service.hash(user.password)
         new_user = models.User(
             email=user.email,
             hashed_password=hashed_password,
             name=user.name
         )
         db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
+        await db.commit()
+        await db.refresh(new_user)
+        invalidate_user_cache(new_user.email)
         
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
         access_token = create_access_token(
@@ -55,14 +63,28 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @router.post("/token", response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.email == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    user = (await db.execute(
+        select(models.User.id, models.User.email, models.User.hashed_password)
+        .where(models.User.email == form_data.username)
+    )).first()
+    # Hash kuyruğunda beklerken DB bağlantısı havuza geri verilir
+    await db.rollback()
+    verified, new_hash = False, None
+    if user:
+        verified, new_hash = await hashing_service.verify_and_update(form_data.password, user.hashed_password)
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash:
+        # BCRYPT_ROUNDS değişmiş: hash yeni maliyetle güncellenir
+        await db.execute(
+            update(models.User).where(models.User.id == user.id).values(hashed_password=new_hash)
+        )
+        await db.commit()
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user.email}, expires_delta=access_token_expires
@@ -1,5 +1,4 @@
-
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from services import etkinlik_service
 
 router = APIRouter(
@@ -8,5 +7,6 @@ router = APIRouter(
 )
 
 @router.get("/events")
-async def read_events(limit: int = 10):
-    return await etkinlik_service.get_events(limit=limit)
+async def read_events(limit: int = Query(10, ge=1, le=100), skip: int = Query(0, ge=0)):
+    # Redis önbelleği üzerinden; upstream'e TTL penceresi başına tek istek gider
+    return await etkinlik_service.get_events_cached(limit=limit, skip=skip)
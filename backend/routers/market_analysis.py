@@ -3,14 +3,21 @@ Market Analysis Router - API Endpoints
 Piyasa analizi, güncel kurlar ve olay tahminleri için endpoint'ler
 """
 
-from fastapi import APIRouter, HTTPException
-from services.finance_service import get_current_rates, get_market_analysis
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from services.finance_service import get_current_rates, get_market_analysis, current_rates_snapshot, RATES_CHANNEL
+from services.broadcast_service import broadcaster
 from services.news_service import news_service
 from services.prediction_service import prediction_service
 from services.trading_economics_service import trading_economics_service
-import pandas as pd
-from database import SessionLocal
+from services.timescale_service import get_ohlc, AGGREGATE_RESOLUTIONS, DEFAULT_MAX_POINTS
+from services.cache_service import cached_endpoint, invalidate_async
+from database import get_async_db
 from models import CurrentEvent, HistoricalEvent, MarketEventCorrelation, UpcomingEvent, MarketSummary
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+import datetime
 import json
 from typing import List, Optional
 
@@ -21,12 +28,13 @@ router = APIRouter(
 
 
 @router.get("/current-rates")
-async def get_rates():
+@cached_endpoint("current_rates")
+async def get_rates(db: AsyncSession = Depends(get_async_db)):
     """
-    Güncel altın ve dolar kurlarını döndürür
+    Takip edilen tüm sembollerin (varsayılan: altın ve dolar) güncel kurlarını döndürür
     """
     try:
-        rates_data = await get_current_rates(['GOLD', 'USDTRY'])
+        rates_data = await get_current_rates(db=db)
         
         return {
             'success': True,
@@ -36,18 +44,33 @@ async def get_rates():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/stream/current-rates")
+async def stream_current_rates():
+    """
+    Güncel kurları server-sent events ile akıtır.
+    Bağlanınca son durum, sonra her piyasa verisi güncellemesinde yeni liste gönderilir.
+    """
+    return StreamingResponse(
+        broadcaster.stream(RATES_CHANNEL, initial=current_rates_snapshot),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.get("/current-events")
-async def get_current_events(limit: int = 10):
+@cached_endpoint("current_events")
+async def get_current_events(limit: int = 10, db: AsyncSession = Depends(get_async_db)):
     """
     Analiz edilmiş güncel olayları döndürür
     """
-    db = SessionLocal()
     try:
-        events = db.query(CurrentEvent).filter(
-            CurrentEvent.analyzed == 1
-        ).order_by(
-            CurrentEvent.predicted_impact.desc()
-        ).limit(limit).all()
+        events = (await db.execute(
+            select(CurrentEvent).where(
+                CurrentEvent.analyzed == 1
+            ).order_by(
+                CurrentEvent.predicted_impact.desc()
+            ).limit(limit)
+        )).scalars().all()
         
         events_data = []
         for event in events:
@@ -69,17 +92,16 @@ async def get_current_events(limit: int = 10):
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        db.close()
 
 
 @router.get("/full-analysis")
-async def get_full_analysis():
+@cached_endpoint("full_analysis")
+async def get_full_analysis(db: AsyncSession = Depends(get_async_db)):
     """
     Komple piyasa analizi: kurlar + olaylar + tahminler + özet
     """
     try:
-        analysis = await get_market_analysis()
+        analysis = await get_market_analysis(db)
         
         return {
             'success': True,
@@ -93,14 +115,14 @@ async def get_full_analysis():
 async def get_historical_correlation(
     category: Optional[str] = None,
     symbol: Optional[str] = 'GOLD',
-    limit: int = 10
+    limit: int = 10,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Geçmiş olay-piyasa korelasyonlarını döndürür
     """
-    db = SessionLocal()
     try:
-        query = db.query(
+        query = select(
             HistoricalEvent, MarketEventCorrelation
         ).join(
             MarketEventCorrelation,
@@ -108,14 +130,14 @@ async def get_historical_correlation(
         )
         
         if category:
-            query = query.filter(HistoricalEvent.category == category)
+            query = query.where(HistoricalEvent.category == category)
         
         if symbol:
-            query = query.filter(MarketEventCorrelation.symbol == symbol)
+            query = query.where(MarketEventCorrelation.symbol == symbol)
         
-        results = query.order_by(
+        results = (await db.execute(query.order_by(
             HistoricalEvent.event_date.desc()
-        ).limit(limit).all()
+        ).limit(limit))).all()
         
         data = []
         for event, correlation in results:
@@ -139,27 +161,30 @@ async def get_historical_correlation(
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        db.close()
+
+
+def _predict_both_markets(event: CurrentEvent) -> dict:
+    # Benzerlik indeksi ve korelasyon deposu senkron; thread havuzunda çalışır
+    predictions = {}
+    similar_events = prediction_service.find_similar_events(event, limit=10)
+    for symbol in ['GOLD', 'USDTRY']:
+        predictions[symbol] = prediction_service.predict_impact(event, symbol, similar_events=similar_events)
+    return predictions
 
 
 @router.post("/analyze-event")
-async def analyze_specific_event(event_id: int):
+async def analyze_specific_event(event_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Belirli bir olayı analiz eder ve tahmin yapar
     """
-    db = SessionLocal()
     try:
-        event = db.query(CurrentEvent).filter(CurrentEvent.id == event_id).first()
+        event = await db.get(CurrentEvent, event_id)
         
         if not event:
             raise HTTPException(status_code=404, detail="Event not found")
         
         # Her iki piyasa için tahmin
-        predictions = {}
-        for symbol in ['GOLD', 'USDTRY']:
-            pred = prediction_service.predict_impact(event, symbol)
-            predictions[symbol] = pred
+        predictions = await asyncio.to_thread(_predict_both_markets, event)
         
         # En yüksek etkiyi kaydet
         max_impact = max(predictions['GOLD']['predicted_impact'], 
@@ -167,7 +192,8 @@ async def analyze_specific_event(event_id: int):
         
         event.predicted_impact = max_impact
         event.analyzed = 1
-        db.commit()
+        await db.commit()
+        await invalidate_async('current_events', 'top_impact_events', 'full_analysis')
         
         return {
             'success': True,
@@ -182,17 +208,22 @@ async def analyze_specific_event(event_id: int):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        db.close()
 
 
 @router.get("/top-impact-events")
-async def get_top_impact(limit: int = 5):
+@cached_endpoint("top_impact_events")
+async def get_top_impact(limit: int = 5, db: AsyncSession = Depends(get_async_db)):
     """
     En yüksek etkili olayları döndürür
     """
     try:
-        events = prediction_service.get_top_impact_events(limit)
+        events = (await db.execute(
+            select(CurrentEvent).where(
+                CurrentEvent.analyzed == 1
+            ).order_by(
+                CurrentEvent.predicted_impact.desc()
+            ).limit(limit)
+        )).scalars().all()
         
         data = []
         for event in events:
@@ -220,29 +251,83 @@ async def refresh_news():
     Haberleri manuel olarak yeniler ve analiz eder
     """
     try:
-        # Haberleri çek
-        count = news_service.update_all_news()
+        # Haberleri çek (ağ ve DB işleri senkron; event loop'u bloklamasın)
+        count = await asyncio.to_thread(news_service.update_all_news)
         
         # Analiz et
-        analyzed = prediction_service.analyze_all_pending_events()
+        analyzed = await asyncio.to_thread(prediction_service.analyze_all_pending_events)
+        await invalidate_async('current_events', 'top_impact_events', 'full_analysis')
         
         return {
             'success': True,
             'news_fetched': count,
-            'events_analyzed': analyzed
+            'events_analyzed': analyzed,
+            'analysis_stats': prediction_service.last_run_stats
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/analysis-stats")
+async def get_analysis_stats():
+    """
+    Son toplu olay analizinin verimlilik istatistiklerini döndürür (olay/sn)
+    """
+    return {
+        'success': True,
+        'data': prediction_service.last_run_stats
+    }
+
+
+def _as_utc(value: datetime.datetime) -> datetime.datetime:
+    """Saat dilimi olmayan değerler UTC kabul edilir; karşılaştırma için hepsi aware UTC olur"""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=datetime.timezone.utc)
+    return value.astimezone(datetime.timezone.utc)
+
+
+@router.get("/ohlc")
+async def get_ohlc_series(
+    symbol: str = 'XAUUSD',
+    start: Optional[datetime.datetime] = None,
+    end: Optional[datetime.datetime] = None,
+    max_points: int = Query(DEFAULT_MAX_POINTS, ge=1, le=20000),
+    resolution: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Önceden toplanmış (1h/1d/1w) OHLC serisini döndürür.
+    Çözünürlük verilmezse aralık ve nokta bütçesine göre otomatik seçilir.
+    """
+    if resolution is not None and resolution not in AGGREGATE_RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"resolution must be one of {list(AGGREGATE_RESOLUTIONS)}")
+    
+    end = _as_utc(end) if end else datetime.datetime.now(datetime.timezone.utc)
+    start = _as_utc(start) if start else end - datetime.timedelta(days=365)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    
+    try:
+        return {
+            'success': True,
+            'data': await db.run_sync(get_ohlc, symbol, start, end, max_points, resolution)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/upcoming-events")
-async def get_upcoming_events(limit: int = 5):
+@cached_endpoint("upcoming_events")
+async def get_upcoming_events(limit: int = 5, db: AsyncSession = Depends(get_async_db)):
     """
     Beklenen gelecek olayları ve AI tavsiyelerini döndürür
     """
-    db = SessionLocal()
     try:
-        events = db.query(UpcomingEvent).order_by(
-            UpcomingEvent.event_date.asc()
-        ).limit(limit).all()
+        events = (await db.execute(
+            select(UpcomingEvent).order_by(
+                UpcomingEvent.event_date.asc()
+            ).limit(limit)
+        )).scalars().all()
         
         data = []
         for event in events:
@@ -262,8 +347,6 @@ async def get_upcoming_events(limit: int = 5):
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        db.close()
 
 @router.get("/market-pulse")
 async def get_market_pulse():
@@ -271,7 +354,7 @@ async def get_market_pulse():
     Piyasa Nabzı - Özet ve Önemli Veriler
     """
     try:
-        pulse = trading_economics_service.generate_market_pulse()
+        pulse = await asyncio.to_thread(trading_economics_service.generate_market_pulse)
         return {
             'success': True,
             'data': pulse
@@ -294,18 +377,20 @@ async def get_scenarios():
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/summary")
-async def get_latest_summary():
+@cached_endpoint("summary")
+async def get_latest_summary(db: AsyncSession = Depends(get_async_db)):
     """
     En son oluşturulan piyasa özetini döndürür
     """
-    db = SessionLocal()
     try:
-        summary = db.query(MarketSummary).order_by(MarketSummary.created_at.desc()).first()
+        summary = (await db.execute(
+            select(MarketSummary).order_by(MarketSummary.created_at.desc()).limit(1)
+        )).scalars().first()
         
         if not summary:
-            # Özet yoksa hemen bir tane oluşturmayı dene
+            # Özet yoksa hemen bir tane oluşturmayı dene (LLM çağrısı senkron)
             from services.summary_service import summary_service
-            summary = summary_service.generate_hourly_summary()
+            summary = await asyncio.to_thread(summary_service.generate_hourly_summary)
             
         if not summary:
             return {
@@ -328,5 +413,3 @@ async def get_latest_summary():
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        db.close()
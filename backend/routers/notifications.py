@@ -1,7 +1,8 @@
-from fastapi import APIRouter, Depends
-from typing import List
-from services.notification_service import get_pending_notifications, clear_old_notifications
-from auth_utils import get_current_user
+from fastapi import APIRouter, Depends, Header, Query
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+from services.notification_service import get_pending_notifications_async, notification_stream
+from auth_utils import get_current_user, get_user_from_token
 from models import User
 
 router = APIRouter()
@@ -9,12 +10,27 @@ router = APIRouter()
 @router.get("/notifications", tags=["notifications"])
 async def get_notifications(current_user: User = Depends(get_current_user)):
     """Kullanıcının bekleyen bildirimlerini getir"""
-    notifications = get_pending_notifications(current_user.id)
-    
-    # Eski bildirimleri temizle
-    clear_old_notifications(current_user.id)
+    # Kuyruk kullanıcı başına sınırlı ve süreli; ayrıca temizlemeye gerek yok
+    notifications = await get_pending_notifications_async(current_user.id)
     
     return {
         "notifications": notifications,
         "count": len(notifications)
     }
+
+@router.get("/notifications/stream", tags=["notifications"])
+async def stream_notifications(
+    token: str = Query(...),
+    last_id: Optional[str] = Query(None),
+    last_event_id: Optional[str] = Header(None)
+):
+    """
+    Kullanıcının bildirimlerini server-sent events ile anında iletir.
+    Yeniden bağlanırken Last-Event-ID header'ı (veya last_id) ile kaldığı yerden devam eder.
+    """
+    current_user = await get_user_from_token(token)
+    return StreamingResponse(
+        notification_stream(current_user.id, last_event_id or last_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
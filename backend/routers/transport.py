@@ -1,18 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from pydantic import BaseModel
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
 
-from database import get_db
+from database import get_async_db
 from models import TransportRoute, UserTransportAlarm, User
 from auth_utils import get_current_user
 from services.transport_service import (
     calculate_next_bus,
+    next_departures,
+    departures_in_window,
+    to_local_naive,
+    MAX_LOOKAHEAD_DAYS,
     get_user_alarms_with_next_buses,
     should_trigger_alarm
 )
+from services.alarm_scheduler import alarm_scheduler
+from services.cache_service import cached_response, delete_cached, make_key
 
 router = APIRouter()
 
@@ -49,21 +56,36 @@ class AlarmResponse(BaseModel):
     class Config:
         from_attributes = True
 
+def _user_alarms_key(user_id: int, minute: datetime = None) -> str:
+    # Sonraki otobüs dakika hassasiyetinde; anahtar dakika değişince kendiliğinden yenilenir
+    minute = minute or datetime.now()
+    return make_key('user_alarms', {'user_id': user_id, 'minute': minute.strftime('%Y-%m-%dT%H:%M')})
+
+async def _user_alarms_response(user_id: int, db: AsyncSession):
+    return await cached_response(
+        'user_alarms', _user_alarms_key(user_id),
+        lambda: db.run_sync(get_user_alarms_with_next_buses, user_id)
+    )
+
+async def _alarms_changed(alarm_id: int, user_id: int):
+    await delete_cached(_user_alarms_key(user_id))
+    await alarm_scheduler.alarm_changed(alarm_id)
+
 @router.get("/transport/routes", tags=["transport"])
 async def get_routes(
     departure: Optional[str] = None,
     arrival: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Tüm otobüs hatlarını listele"""
-    query = db.query(TransportRoute)
+    query = select(TransportRoute)
     
     if departure:
-        query = query.filter(TransportRoute.departure_location.ilike(f"%{departure}%"))
+        query = query.where(TransportRoute.departure_location.ilike(f"%{departure}%"))
     if arrival:
-        query = query.filter(TransportRoute.arrival_location.ilike(f"%{arrival}%"))
+        query = query.where(TransportRoute.arrival_location.ilike(f"%{arrival}%"))
     
-    routes = query.all()
+    routes = (await db.execute(query)).scalars().all()
     
     result = []
     for route in routes:
@@ -87,9 +109,9 @@ async def get_routes(
     return result
 
 @router.get("/transport/routes/{route_id}", tags=["transport"])
-async def get_route(route_id: int, db: Session = Depends(get_db)):
+async def get_route(route_id: int, db: AsyncSession = Depends(get_async_db)):
     """Belirli bir hattın detaylarını getir"""
-    route = db.query(TransportRoute).filter(TransportRoute.id == route_id).first()
+    route = await db.get(TransportRoute, route_id)
     if not route:
         raise HTTPException(status_code=404, detail="Route not found")
     
@@ -114,23 +136,78 @@ async def get_route(route_id: int, db: Session = Depends(get_db)):
         "next_bus": next_bus
     }
 
+def _format_departures(departures: List[datetime], current_time: datetime) -> List[dict]:
+    return [{
+        "departure": departure.isoformat(),
+        "minutes_until_departure": int((departure - current_time).total_seconds() / 60)
+    } for departure in departures]
+
+@router.get("/transport/routes/{route_id}/next-departures", tags=["transport"])
+async def get_next_departures(
+    route_id: int,
+    count: int = Query(5, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Hattın şu andan sonraki ilk `count` kalkışı (gerekirse sonraki günler dahil)"""
+    route = await db.get(TransportRoute, route_id)
+    if not route:
+        raise HTTPException(status_code=404, detail="Route not found")
+    
+    current_time = datetime.now()
+    return {
+        "route_id": route.id,
+        "route_number": route.route_number,
+        "departures": _format_departures(next_departures(route, count, current_time), current_time)
+    }
+
+@router.get("/transport/routes/{route_id}/departures", tags=["transport"])
+async def get_departures_in_window(
+    route_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Belirli bir zaman aralığındaki kalkışlar (varsayılan: önümüzdeki 2 saat)"""
+    route = await db.get(TransportRoute, route_id)
+    if not route:
+        raise HTTPException(status_code=404, detail="Route not found")
+    
+    current_time = datetime.now()
+    # ISO sorgudaki saat dilimli değerler (örn. ...Z) yerel saate çevrilir
+    start = to_local_naive(start) if start else current_time
+    end = to_local_naive(end) if end else start + timedelta(hours=2)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    if end - start > timedelta(days=MAX_LOOKAHEAD_DAYS):
+        raise HTTPException(status_code=400, detail=f"window must be at most {MAX_LOOKAHEAD_DAYS} days")
+    
+    return {
+        "route_id": route.id,
+        "route_number": route.route_number,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "departures": _format_departures(departures_in_window(route, start, end), current_time)
+    }
+
 @router.post("/transport/alarms", tags=["transport"])
 async def create_alarm(
     alarm_data: AlarmCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Yeni alarm oluştur"""
     # Route var mı kontrol et
-    route = db.query(TransportRoute).filter(TransportRoute.id == alarm_data.route_id).first()
+    route = await db.get(TransportRoute, alarm_data.route_id)
     if not route:
         raise HTTPException(status_code=404, detail="Route not found")
     
     # Aynı rota için zaten alarm var mı kontrol et
-    existing_alarm = db.query(UserTransportAlarm).filter(
-        UserTransportAlarm.user_id == current_user.id,
-        UserTransportAlarm.route_id == alarm_data.route_id
-    ).first()
+    existing_alarm = (await db.execute(
+        select(UserTransportAlarm).where(
+            UserTransportAlarm.user_id == current_user.id,
+            UserTransportAlarm.route_id == alarm_data.route_id
+        ).limit(1)
+    )).scalars().first()
     
     if existing_alarm:
         raise HTTPException(status_code=400, detail="Alarm already exists for this route")
@@ -145,8 +222,9 @@ async def create_alarm(
     )
     
     db.add(new_alarm)
-    db.commit()
-    db.refresh(new_alarm)
+    await db.commit()
+    await db.refresh(new_alarm)
+    await _alarms_changed(new_alarm.id, current_user.id)
     
     return {
         "id": new_alarm.id,
@@ -159,24 +237,25 @@ async def create_alarm(
 @router.get("/transport/alarms", tags=["transport"])
 async def get_alarms(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Kullanıcının aktif alarmlarını getir"""
-    alarms_data = get_user_alarms_with_next_buses(db, current_user.id)
-    return alarms_data
+    return await _user_alarms_response(current_user.id, db)
 
 @router.put("/transport/alarms/{alarm_id}", tags=["transport"])
 async def update_alarm(
     alarm_id: int,
     alarm_data: AlarmUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Alarm güncelle"""
-    alarm = db.query(UserTransportAlarm).filter(
-        UserTransportAlarm.id == alarm_id,
-        UserTransportAlarm.user_id == current_user.id
-    ).first()
+    alarm = (await db.execute(
+        select(UserTransportAlarm).where(
+            UserTransportAlarm.id == alarm_id,
+            UserTransportAlarm.user_id == current_user.id
+        )
+    )).scalars().first()
     
     if not alarm:
         raise HTTPException(status_code=404, detail="Alarm not found")
@@ -191,8 +270,9 @@ async def update_alarm(
     
     alarm.updated_at = datetime.utcnow()
     
-    db.commit()
-    db.refresh(alarm)
+    await db.commit()
+    await db.refresh(alarm)
+    await _alarms_changed(alarm.id, current_user.id)
     
     return {
         "id": alarm.id,
@@ -206,27 +286,29 @@ async def update_alarm(
 async def delete_alarm(
     alarm_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Alarm sil"""
-    alarm = db.query(UserTransportAlarm).filter(
-        UserTransportAlarm.id == alarm_id,
-        UserTransportAlarm.user_id == current_user.id
-    ).first()
+    alarm = (await db.execute(
+        select(UserTransportAlarm).where(
+            UserTransportAlarm.id == alarm_id,
+            UserTransportAlarm.user_id == current_user.id
+        )
+    )).scalars().first()
     
     if not alarm:
         raise HTTPException(status_code=404, detail="Alarm not found")
     
-    db.delete(alarm)
-    db.commit()
+    await db.delete(alarm)
+    await db.commit()
+    await _alarms_changed(alarm_id, current_user.id)
     
     return {"message": "Alarm deleted successfully"}
 
 @router.get("/transport/next-buses", tags=["transport"])
 async def get_next_buses(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Kullanıcının alarmlarına göre gelecek otobüsleri getir"""
-    alarms_data = get_user_alarms_with_next_buses(db, current_user.id)
-    return alarms_data
+    return await _user_alarms_response(current_user.id, db)
@@ -1,79 +1,49 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from database import SessionLocal
-from models import MarketData
+from database import BatchSessionLocal
+import asyncio
 import datetime
-import random
-import yfinance as yf
-import pandas as pd
 
 scheduler = AsyncIOScheduler()
 
 async def fetch_market_data():
     """
     Fetch real market data using yfinance and update both history and current rates.
+    Network and database work run off the event loop so API requests keep being served.
     """
     print("Fetching live market data...")
-    db = SessionLocal()
     try:
-        from models import CurrentMarketRate
-        
-        # Map symbols for internal use and yfinance
-        symbol_map = {
-            "USDTRY": "USDTRY=X",
-            "GOLD": "GC=F" 
-        }
+        from services.market_data_service import fetch_quotes
         
+        quotes = await fetch_quotes()
         now = datetime.datetime.utcnow()
         
-        for app_symbol, yf_symbol in symbol_map.items():
-            try:
-                ticker = yf.Ticker(yf_symbol)
-                # Get 2 days of data to calculate daily change
-                data = ticker.history(period="2d")
-                
-                if not data.empty:
-                    current_price = data['Close'].iloc[-1]
-                    previous_close = data['Close'].iloc[-2] if len(data) > 1 else current_price
-                    
-                    daily_change = current_price - previous_close
-                    daily_change_percent = (daily_change / previous_close) * 100 if previous_close > 0 else 0
-                    
-                    # 1. Update MarketData (History)
-                    new_history = MarketData(
-                        time=now,
-                        symbol="XAUUSD" if app_symbol == "GOLD" else app_symbol,
-                        price=float(current_price),
-                        volume=0
-                    )
-                    db.add(new_history)
-                    
-                    # 2. Update CurrentMarketRate (Live View)
-                    rate = db.query(CurrentMarketRate).filter_by(symbol=app_symbol).first()
-                    if rate:
-                        rate.price = float(current_price)
-                        rate.daily_change = float(daily_change)
-                        rate.daily_change_percent = float(daily_change_percent)
-                        rate.previous_close = float(previous_close)
-                        rate.last_updated = now
-                    else:
-                        rate = CurrentMarketRate(
-                            symbol=app_symbol,
-                            name="Altın (Ons/USD)" if app_symbol == "GOLD" else "Dolar/TL",
-                            price=float(current_price),
-                            daily_change=float(daily_change),
-                            daily_change_percent=float(daily_change_percent),
-                            previous_close=float(previous_close),
-                            last_updated=now
-                        )
-                        db.add(rate)
-                        
-            except Exception as e:
-                print(f"Error updating {app_symbol}: {e}")
+        await asyncio.to_thread(_store_market_quotes, quotes, now)
         
-        db.commit()
-        print("Market data and current rates updated successfully.")
+        # Yeni tick'ler geldi, önbelleklenmiş korelasyonlar ve yanıtlar artık eski
+        from services.correlation_engine import correlation_engine
+        from services.cache_service import invalidate_async
+        correlation_engine.invalidate()
+        await invalidate_async('current_rates', 'full_analysis')
+        
+        # Bağlı tüm istemcilere tek yayın
+        from services.finance_service import publish_current_rates
+        await publish_current_rates()
+        print(f"Market data and current rates updated successfully ({len(quotes)} symbols).")
     except Exception as e:
         print(f"Error in fetch_market_data: {e}")
+
+
+def _store_market_quotes(quotes, now):
+    from services.market_data_service import store_quotes
+    
+    db = BatchSessionLocal()
+    try:
+        # 1. MarketData (History) + 2. CurrentMarketRate (Live View), sabit sayıda ifade
+        store_quotes(db, quotes, now)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
     finally:
         db.close()
 
@@ -95,6 +65,9 @@ async def update_news_and_analyze():
         analyzed = prediction_service.analyze_all_pending_events()
         print(f"{analyzed} olay analiz edildi.")
         
+        from services.cache_service import invalidate_async
+        await invalidate_async('current_events', 'top_impact_events', 'full_analysis')
+        
     except Exception as e:
         print(f"News update/analysis error: {e}")
 
@@ -107,50 +80,39 @@ async def update_economic_calendar():
     try:
         from services.investing_service import investing_service
         count = investing_service.update_upcoming_events()
+        
+        from services.cache_service import invalidate_async
+        await invalidate_async('upcoming_events')
         print(f"Economic calendar updated: {count} events processed.")
     except Exception as e:
         print(f"Economic calendar update error: {e}")
 
 
-async def check_transport_alarms():
+async def resync_transport_alarms():
     """
-    Aktif ulaşım alarmlarını kontrol eder ve gerekirse bildirim gönderir
+    Alarm zamanlayıcısını DB ile eşitler; kaçan değişiklik mesajları ve
+    seed script'i gibi API dışından yapılan hat güncellemeleri için
     """
-    print("Checking transport alarms...")
-    db = SessionLocal()
     try:
-        from models import UserTransportAlarm, TransportRoute
-        from services.transport_service import should_trigger_alarm
-        from services.notification_service import send_alarm_notification
-        
-        # Tüm aktif alarmları al
-        active_alarms = db.query(UserTransportAlarm).filter(
-            UserTransportAlarm.alarm_enabled == 1
-        ).all()
-        
-        for alarm in active_alarms:
-            # Route bilgisini al
-            route = db.query(TransportRoute).filter(
-                TransportRoute.id == alarm.route_id
-            ).first()
-            
-            if not route:
-                continue
-            
-            # Alarm tetiklenmeli mi kontrol et
-            should_trigger, alarm_data = should_trigger_alarm(alarm, route)
-            
-            if should_trigger:
-                # Bildirim gönder
-                send_alarm_notification(alarm.user_id, alarm_data)
-                print(f"Alarm triggered for user {alarm.user_id}: Route {route.route_number}")
-        
-        print(f"Checked {len(active_alarms)} active alarms.")
-        
+        from services.alarm_scheduler import alarm_scheduler
+        if alarm_scheduler.running:
+            await alarm_scheduler.resync()
+        else:
+            # Açılışta başlatılamadıysa veya görevler durduysa yeniden başlat
+            await alarm_scheduler.start()
     except Exception as e:
-        print(f"Transport alarm check error: {e}")
-    finally:
-        db.close()
+        print(f"Transport alarm resync error: {e}")
+
+
+async def warm_etkinlik_events():
+    """
+    Dashboard'un istediği etkinlik sayfasını önbellekte taze tutar
+    """
+    try:
+        from services.etkinlik_service import warm_events_cache
+        await warm_events_cache()
+    except Exception as e:
+        print(f"Etkinlik cache refresh error: {e}")
 
 
 async def generate_hourly_market_summary():
@@ -161,6 +123,9 @@ async def generate_hourly_market_summary():
     try:
         from services.summary_service import summary_service
         summary_service.generate_hourly_summary()
+        
+        from services.cache_service import invalidate_async
+        await invalidate_async('summary')
         print("Hourly market summary generated.")
     except Exception as e:
         print(f"Summary generation error: {e}")
@@ -173,12 +138,15 @@ def start_scheduler():
     # News ve analysis - her 2 saatte bir (daha az sıklıkla)
     scheduler.add_job(update_news_and_analyze, 'interval', hours=2)
     
-    # Transport alarms - her 1 dakikada bir kontrol
-    scheduler.add_job(check_transport_alarms, 'interval', minutes=1)
+    # Transport alarms - olay güdümlü zamanlayıcı, saatte bir DB ile eşitlenir
+    scheduler.add_job(resync_transport_alarms, 'interval', hours=1)
     
     # Ekonomik takvim - günde bir kez
     scheduler.add_job(update_economic_calendar, 'interval', hours=24)
     
+    # Etkinlik.io ilk sayfası - önbellek süresi (5 dk) dolmadan yenilenir
+    scheduler.add_job(warm_etkinlik_events, 'interval', minutes=4)
+    
     # Piyasa Özeti - her saat başı
     scheduler.add_job(generate_hourly_market_summary, 'interval', hours=1)
     
@@ -194,8 +162,15 @@ def start_scheduler():
 
     scheduler.add_job(generate_hourly_market_summary, trigger='date', 
                      run_date=datetime.datetime.now() + datetime.timedelta(seconds=20))
+
+    scheduler.add_job(warm_etkinlik_events, trigger='date',
+                     run_date=datetime.datetime.now() + datetime.timedelta(seconds=3))
+
+    from services.alarm_scheduler import alarm_scheduler
+    scheduler.add_job(alarm_scheduler.start, trigger='date',
+                     run_date=datetime.datetime.now() + datetime.timedelta(seconds=1))
     
     scheduler.start()
-    print("Scheduler started with market data (5min), news analysis (2hours), summary generation (1hour), and transport alarms (1min) jobs")
+    print("Scheduler started with market data (5min), news analysis (2hours), summary generation (1hour), and transport alarm resync (1hour) jobs")
 
 
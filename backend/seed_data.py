@@ -1,8 +1,9 @@
 import random
 import datetime
-from sqlalchemy import text
 from database import engine, SessionLocal, Base
 from models import User, Expense, Goal, MarketData
+from services.market_data_service import insert_market_data
+from services.timescale_service import setup_timescale, refresh_continuous_aggregates
 
 def init_db():
     # Drop all tables first to ensure clean slate (OPTIONAL, good for dev)
@@ -11,15 +12,13 @@ def init_db():
     # Create tables
     Base.metadata.create_all(bind=engine)
     
-    # Convert market_data to hypertable (TimescaleDB specific)
-    # We use execute with raw SQL. We capture exception if it already exists.
-    with engine.connect() as conn:
-        try:
-            conn.execute(text("SELECT create_hypertable('market_data', 'time', if_not_exists => TRUE);"))
-            print("Converted market_data to hypertable.")
-        except Exception as e:
-            print(f"Hypertable creation info: {e}")
-        conn.commit()
+    # Convert market_data to hypertable (TimescaleDB specific) and
+    # create the 1h/1d/1w OHLC continuous aggregates on top of it.
+    try:
+        setup_timescale()
+        print("Converted market_data to hypertable with continuous aggregates and compression.")
+    except Exception as e:
+        print(f"Hypertable creation info: {e}")
 
 def seed_users(db):
     if db.query(User).first():
@@ -60,22 +59,29 @@ def seed_market_data(db):
             change_percent = random.uniform(-0.02, 0.025) # Slightly bullish trend
             price[symbol] = price[symbol] * (1 + change_percent)
             
-            data_buffer.append(MarketData(
-                time=current_date,
-                symbol=symbol,
-                price=round(price[symbol], 2),
-                volume=random.randint(1000, 50000)
-            ))
+            data_buffer.append({
+                'time': current_date,
+                'symbol': symbol,
+                'price': round(price[symbol], 2),
+                'volume': random.randint(1000, 50000)
+            })
             
         # Bulk insert every 1000 days to save memory
         if len(data_buffer) > 5000:
-            db.bulk_save_objects(data_buffer)
+            insert_market_data(db, data_buffer)
             db.commit()
             data_buffer = []
 
     if data_buffer:
-        db.bulk_save_objects(data_buffer)
+        insert_market_data(db, data_buffer)
         db.commit()
+    
+    # Backfill refresh policy aralıklarının dışında kaldığı için görünümleri elle yenile
+    # (TimescaleDB yoksa init_db'de görünümler oluşturulmamıştır)
+    try:
+        refresh_continuous_aggregates()
+    except Exception as e:
+        print(f"Continuous aggregate refresh skipped: {e}")
         
     print("Market data seeded.")
 
@@ -0,0 +1,337 @@
+"""
+Alarm Scheduler - Ulaşım alarmları için olay güdümlü zamanlayıcı
+Her alarmın bir sonraki tetiklenme zamanı (kalkış - durağa varış - ek bildirim
+süresi) derlenmiş sefer tablosundan bir kez hesaplanır ve bir min-heap'e
+konur. Döngü en yakın zamana kadar uyur, sadece vakti gelen alarmları
+tetikler ve onları bir sonraki kalkışa göre yeniden planlar.
+Alarm veya hat değişince Redis pub/sub ile tüm worker'lara
+haber verilir ve sadece etkilenen alarmlar yeniden planlanır; eski heap kayıtları
+sürüm numarasıyla geçersiz sayılır (lazy deletion).
+"""
+
+from database import BatchSessionLocal
+from models import UserTransportAlarm, TransportRoute
+from services.transport_service import next_departures, build_alarm_data
+from services.broadcast_service import broadcaster
+from datetime import datetime, timedelta
+import asyncio
+import heapq
+import itertools
+import logging
+from typing import Dict, List, Optional, Tuple
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Alarm değişikliklerinin yayınlandığı kanal
+ALARM_CHANGES_CHANNEL = "transport:alarm_changed"
+# Saat değişikliği vb. durumlara karşı en uzun uyku (saniye)
+MAX_SLEEP = 300
+
+
+class AlarmEntry:
+    """Heap'te tutulan alarmın tetiklenme için gereken alanları"""
+    __slots__ = ('alarm_id', 'user_id', 'route_id', 'travel_time', 'notify_before',
+                 'version', 'departure', 'fire_at', 'last_fired')
+
+    def __init__(self, alarm_id, user_id, route_id, travel_time, notify_before):
+        self.alarm_id = alarm_id
+        self.user_id = user_id
+        self.route_id = route_id
+        self.travel_time = travel_time or 0
+        self.notify_before = notify_before or 0
+        self.version = 0
+        self.departure: Optional[datetime] = None
+        self.fire_at: Optional[datetime] = None
+        # Bildirimi gönderilmiş son kalkış; yeniden planlamada aynı kalkış tekrar uyarılmaz
+        self.last_fired: Optional[datetime] = None
+
+    @property
+    def lead(self) -> timedelta:
+        return timedelta(minutes=self.travel_time + self.notify_before)
+
+
+def _load_all() -> Tuple[List[Tuple], Dict[int, TransportRoute]]:
+    """Tüm açık alarmları ve hatlarını tek sorguda yükler"""
+    db = BatchSessionLocal()
+    try:
+        rows = db.query(
+            UserTransportAlarm.id, UserTransportAlarm.user_id, UserTransportAlarm.route_id,
+            UserTransportAlarm.travel_time_to_stop, UserTransportAlarm.notification_minutes_before,
+            TransportRoute
+        ).join(
+            TransportRoute, TransportRoute.id == UserTransportAlarm.route_id
+        ).filter(
+            UserTransportAlarm.alarm_enabled == 1
+        ).all()
+        routes = {row[5].id: row[5] for row in rows}
+        db.expunge_all()
+        return [tuple(row[:5]) for row in rows], routes
+    finally:
+        db.close()
+
+
+def _load_one(alarm_id: int) -> Tuple[Optional[Tuple], Optional[TransportRoute]]:
+    db = BatchSessionLocal()
+    try:
+        row = db.query(
+            UserTransportAlarm.id, UserTransportAlarm.user_id, UserTransportAlarm.route_id,
+            UserTransportAlarm.travel_time_to_stop, UserTransportAlarm.notification_minutes_before,
+            TransportRoute
+        ).join(
+            TransportRoute, TransportRoute.id == UserTransportAlarm.route_id
+        ).filter(
+            UserTransportAlarm.id == alarm_id,
+            UserTransportAlarm.alarm_enabled == 1
+        ).first()
+        if row is None:
+            return None, None
+        db.expunge_all()
+        return tuple(row[:5]), row[5]
+    finally:
+        db.close()
+
+
+def _load_route_alarms(route_id: int) -> Tuple[List[Tuple], Optional[TransportRoute]]:
+    db = BatchSessionLocal()
+    try:
+        route = db.get(TransportRoute, route_id)
+        rows = db.query(
+            UserTransportAlarm.id, UserTransportAlarm.user_id, UserTransportAlarm.route_id,
+            UserTransportAlarm.travel_time_to_stop, UserTransportAlarm.notification_minutes_before
+        ).filter(
+            UserTransportAlarm.route_id == route_id,
+            UserTransportAlarm.alarm_enabled == 1
+        ).all()
+        db.expunge_all()
+        return [tuple(row) for row in rows], route
+    finally:
+        db.close()
+
+
+def _send_notifications(notifications: List[Tuple[int, int, Dict]]) -> int:
+    """Her kalkış için sadece bir kez (tüm worker'lar ve yeniden başlatmalar arasında) gönderir"""
+    from services.notification_service import queue_alarm_notifications
+    return queue_alarm_notifications(notifications)
+
+
+class AlarmScheduler:
+
+    def __init__(self):
+        self._heap: List[Tuple[datetime, int, int, int]] = []
+        self._entries: Dict[int, AlarmEntry] = {}
+        self._routes: Dict[int, TransportRoute] = {}
+        self._counter = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self.fired_count = 0
+
+    # --- planlama ---
+
+    def _plan(self, entry: AlarmEntry, after: datetime, not_before: datetime):
+        """
+        Alarmı `after`dan sonraki ilk kalkış için planlar. Bildirim, önceki
+        kalkış geçmeden (not_before) gönderilmez; eski davranıştaki gibi her
+        zaman "bir sonraki otobüs" için uyarılır.
+        """
+        entry.version += 1
+        route = self._routes.get(entry.route_id)
+        departures = next_departures(route, 1, after) if route is not None else []
+        if not departures:
+            entry.departure = entry.fire_at = None
+            return
+        entry.departure = departures[0]
+        entry.fire_at = max(entry.departure - entry.lead, not_before)
+        heapq.heappush(self._heap, (entry.fire_at, next(self._counter), entry.alarm_id, entry.version))
+
+    def _wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _replan(self, entry: AlarmEntry, now: datetime):
+        """Yeni/yeniden yüklenen alarmı planlar; önceki kaydın durumunu devralır"""
+        previous = self._entries.get(entry.alarm_id)
+        if previous is not None:
+            entry.version = previous.version
+            entry.last_fired = previous.last_fired
+        self._entries[entry.alarm_id] = entry
+        after = max(now, entry.last_fired) if entry.last_fired else now
+        self._plan(entry, after, after)
+
+    def schedule(self, alarm_row: Tuple, route: TransportRoute, now: datetime = None):
+        """Tek bir alarmı (yeniden) planlar; eski heap kaydı sürümüyle geçersizleşir"""
+        self._routes[route.id] = route
+        self._replan(AlarmEntry(*alarm_row), now or datetime.now())
+        self._wake()
+
+    def remove(self, alarm_id: int):
+        # Heap'teki kayıt sözlükte karşılığı olmadığı için atlanacak
+        if self._entries.pop(alarm_id, None) is not None:
+            self._wake()
+
+    def _rebuild(self, rows: List[Tuple], routes: Dict[int, TransportRoute]):
+        now = datetime.now()
+        previous_entries = self._entries
+        self._routes = routes
+        self._entries = {}
+        self._heap = []
+        for row in rows:
+            entry = AlarmEntry(*row)
+            previous = previous_entries.get(entry.alarm_id)
+            if previous is not None:
+                self._entries[entry.alarm_id] = previous
+            self._replan(entry, now)
+        self._wake()
+        logger.info(f"Alarm scheduler: {len(self._entries)} alarm planlandı")
+
+    async def resync(self):
+        """Tüm alarmları DB'den yeniden yükler (hat değişiklikleri ve kaçan mesajlar için)"""
+        rows, routes = await asyncio.to_thread(_load_all)
+        self._rebuild(rows, routes)
+
+    async def reload_alarm(self, alarm_id: int):
+        """Sadece verilen alarmı DB'den okuyup yeniden planlar (silindiyse/kapandıysa çıkarır)"""
+        row, route = await asyncio.to_thread(_load_one, alarm_id)
+        if row is None:
+            self.remove(alarm_id)
+        else:
+            self.schedule(row, route)
+
+    async def reload_route(self, route_id: int):
+        """Hattın sefer tablosu değişince sadece o hattaki alarmları yeniden planlar"""
+        rows, route = await asyncio.to_thread(_load_route_alarms, route_id)
+        current = {row[0] for row in rows} if route is not None else set()
+        stale = [e.alarm_id for e in self._entries.values() if e.route_id == route_id and e.alarm_id not in current]
+        for alarm_id in stale:
+            self.remove(alarm_id)
+        if route is None:
+            self._routes.pop(route_id, None)
+            return
+        now = datetime.now()
+        for row in rows:
+            self.schedule(row, route, now)
+
+    async def _handle_change(self, message: str):
+        kind, _, object_id = message.partition(':')
+        if kind == 'route':
+            await self.reload_route(int(object_id))
+        else:
+            await self.reload_alarm(int(object_id))
+
+    async def _notify(self, message: str):
+        try:
+            await broadcaster.publish(ALARM_CHANGES_CHANNEL, message)
+        except Exception as e:
+            logger.warning(f"Alarm değişikliği yayınlanamadı, sadece yerel planlanıyor: {e!r}")
+            await self._handle_change(message)
+
+    async def alarm_changed(self, alarm_id: int):
+        """API'de alarm değişince çağrılır; tüm worker'lardaki zamanlayıcılara duyurur"""
+        await self._notify(f"alarm:{alarm_id}")
+
+    async def route_changed(self, route_id: int):
+        """Hat saatleri/günleri değişince çağrılır"""
+        await self._notify(f"route:{route_id}")
+
+    # --- döngü ---
+
+    def _pop_due(self, now: datetime) -> List[AlarmEntry]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, alarm_id, version = heapq.heappop(self._heap)
+            entry = self._entries.get(alarm_id)
+            if entry is None or entry.version != version:
+                continue
+            due.append(entry)
+        return due
+
+    async def _fire_due(self):
+        now = datetime.now()
+        due = self._pop_due(now)
+
+        notifications = []
+        for entry in due:
+            minutes_until_bus = int((entry.departure - now).total_seconds() / 60)
+            if minutes_until_bus > 0:
+                route = self._routes[entry.route_id]
+                notifications.append((entry.alarm_id, entry.user_id, build_alarm_data(
+                    route, entry.departure, minutes_until_bus, entry.travel_time
+                )))
+            # Bir sonraki kalkış, bu kalkış geçtikten sonra uyarılır
+            entry.last_fired = entry.departure
+            self._plan(entry, entry.departure, entry.departure)
+
+        if notifications:
+            try:
+                self.fired_count += await asyncio.to_thread(_send_notifications, notifications)
+            except Exception as e:
+                logger.error(f"Alarm bildirimi hatası: {e!r}")
+
+    async def _run(self):
+        while True:
+            try:
+                await self._fire_due()
+            except Exception as e:
+                # Döngü ölürse hiçbir alarm tetiklenmez; hata loglanıp devam edilir
+                logger.exception(f"Alarm döngüsü hatası: {e!r}")
+
+            if self._heap:
+                delay = min((self._heap[0][0] - datetime.now()).total_seconds(), MAX_SLEEP)
+            else:
+                delay = MAX_SLEEP
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _listen_changes(self):
+        try:
+            queue = await broadcaster.subscribe(ALARM_CHANGES_CHANNEL)
+        except Exception as e:
+            # Değişiklikler saatlik resync ile yine de yakalanır
+            logger.warning(f"Alarm değişiklik kanalı dinlenemiyor: {e!r}")
+            return
+        try:
+            while True:
+                message = await queue.get()
+                try:
+                    await self._handle_change(message)
+                except Exception as e:
+                    logger.error(f"Alarm değişikliği işlenemedi ({message}): {e!r}")
+        finally:
+            await broadcaster.unsubscribe(ALARM_CHANGES_CHANNEL, queue)
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks) and not any(task.done() for task in self._tasks)
+
+    async def start(self):
+        """
+        Döngü ve değişiklik dinleyicisini başlatır. Açılıştaki resync başarısız
+        olduysa veya görevlerden biri durduysa saatlik iş tekrar çağırır.
+        """
+        if self.running:
+            return
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        await self.resync()
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = [
+            asyncio.create_task(self._run()),
+            asyncio.create_task(self._listen_changes())
+        ]
+
+    def stats(self) -> Dict:
+        return {
+            'scheduled_alarms': len(self._entries),
+            'heap_size': len(self._heap),
+            'next_fire_at': self._heap[0][0].isoformat() if self._heap else None,
+            'fired_count': self.fired_count
+        }
+
+
+# Global instance
+alarm_scheduler = AlarmScheduler()
@@ -0,0 +1,146 @@
+"""
+Broadcast Service - Redis pub/sub üzerinden çok worker'lı canlı yayın
+Her uvicorn worker'ı Redis'e tek bir pub/sub bağlantısıyla abone olur ve
+gelen mesajı o worker'daki bağlı istemcilerin kuyruklarına dağıtır.
+Mesaj bir kez serileştirilip yayınlanır; istemci başına DB sorgusu veya
+serileştirme yapılmaz. Kanalın son mesajı Redis'te saklanabilir, böylece
+yeni bağlanan istemci beklemeden güncel durumu alır.
+"""
+
+from redis_client import async_redis_client
+import asyncio
+import json
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Set
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Yavaş bir istemci için biriktirilecek en fazla mesaj; dolarsa en eskisi atılır
+CLIENT_QUEUE_SIZE = 32
+# Bağlantının açık kalması için yorum satırı gönderme aralığı (saniye)
+HEARTBEAT_INTERVAL = 15
+# Pub/sub bağlantısı koptuğunda tekrar deneme aralığı (saniye)
+RECONNECT_DELAY = 1
+# Saklanan son mesajın ömrü (saniye)
+RETAIN_TTL = 24 * 60 * 60
+
+
+def _last_key(channel: str) -> str:
+    return f"broadcast:last:{channel}"
+
+
+def sse_event(data: str, event: Optional[str] = None, event_id: Optional[str] = None) -> str:
+    """Server-sent events formatında tek bir mesaj üretir"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.extend(f"data: {line}" for line in data.splitlines() or [""])
+    return "\n".join(lines) + "\n\n"
+
+
+def dumps(data) -> str:
+    """Yayınlanacak veriyi tek seferde JSON'a çevirir"""
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+class Broadcaster:
+
+    def __init__(self):
+        self._queues: Dict[str, Set[asyncio.Queue]] = {}
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    async def publish(self, channel: str, payload: str, retain: bool = False) -> int:
+        """Mesajı tüm worker'lara yayınlar; retain ise kanalın son mesajı olarak saklar"""
+        if retain:
+            await async_redis_client.set(_last_key(channel), payload, ex=RETAIN_TTL)
+        return await async_redis_client.publish(channel, payload)
+
+    async def last(self, channel: str) -> Optional[str]:
+        """Kanalda saklanan son mesaj"""
+        try:
+            return await async_redis_client.get(_last_key(channel))
+        except Exception as e:
+            logger.warning(f"Son yayın okunamadı ({channel}): {e!r}")
+            return None
+
+    async def subscribe(self, channel: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        async with self._lock:
+            if self._pubsub is None:
+                self._pubsub = async_redis_client.pubsub(ignore_subscribe_messages=True)
+            if channel not in self._queues:
+                await self._pubsub.subscribe(channel)
+                self._queues[channel] = set()
+            self._queues[channel].add(queue)
+            if self._listener is None or self._listener.done():
+                self._listener = asyncio.create_task(self._listen())
+        return queue
+
+    async def unsubscribe(self, channel: str, queue: asyncio.Queue):
+        async with self._lock:
+            queues = self._queues.get(channel)
+            if queues is None:
+                return
+            queues.discard(queue)
+            if not queues:
+                del self._queues[channel]
+                try:
+                    await self._pubsub.unsubscribe(channel)
+                except Exception as e:
+                    logger.warning(f"Abonelik kapatılamadı ({channel}): {e!r}")
+
+    async def _listen(self):
+        """Worker başına tek görev: Redis'ten gelen mesajları yerel kuyruklara dağıtır"""
+        while self._queues:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Pub/sub bağlantı hatası, yeniden denenecek: {e!r}")
+                await asyncio.sleep(RECONNECT_DELAY)
+                continue
+
+            if message is None or message.get('type') != 'message':
+                continue
+            for queue in list(self._queues.get(message['channel'], ())):
+                self._deliver(queue, message['data'])
+
+    @staticmethod
+    def _deliver(queue: asyncio.Queue, payload: str):
+        if queue.full():
+            # Yavaş istemci: en eski mesajı at, en güncel durumu kaçırmasın
+            queue.get_nowait()
+        queue.put_nowait(payload)
+
+    async def stream(self, channel: str,
+                     initial: Optional[Callable[[], Awaitable[Optional[str]]]] = None) -> AsyncIterator[str]:
+        """
+        Kanalı SSE olarak akıtır: önce başlangıç durumu (varsa), sonra her yeni
+        mesaj; mesaj gelmeyen aralıklarda heartbeat gönderilir.
+        Başlangıç durumu abone olduktan sonra okunur, aradaki yayın kaçmaz.
+        """
+        queue = await self.subscribe(channel)
+        try:
+            if initial is not None:
+                payload = await initial()
+                if payload is not None:
+                    yield sse_event(payload)
+            while True:
+                try:
+                    payload = await asyncio.wait_for(queue.get(), HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                yield sse_event(payload)
+        finally:
+            await self.unsubscribe(channel, queue)
+
+
+# Global instance
+broadcaster = Broadcaster()
@@ -0,0 +1,145 @@
+"""
+Cache Service - API yanıtları için Redis tabanlı read-through önbellek
+Endpoint yanıtları JSON olarak serileştirilip saklanır; isabet durumunda
+veritabanına gidilmeden ve yeniden serileştirilmeden döndürülür.
+TTL'ler ilgili verinin scheduler'daki yenilenme aralığına göre seçildi;
+yeni veri yazıldığında namespace açıkça temizlenir.
+Redis'e ulaşılamazsa önbellek devre dışı kalır ve istekler doğrudan işlenir.
+"""
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+from redis_client import async_redis_client
+import datetime
+import functools
+import json
+import logging
+import time
+from typing import Awaitable, Callable
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "cache"
+
+# Namespace -> TTL (saniye)
+CACHE_TTLS = {
+    'current_rates': 5 * 60,        # fetch_market_data: 5 dakika
+    'full_analysis': 5 * 60,        # kurlar + olaylar, en sık yenilenen veriye göre
+    'current_events': 2 * 60 * 60,  # update_news_and_analyze: 2 saat
+    'top_impact_events': 2 * 60 * 60,
+    'upcoming_events': 24 * 60 * 60,  # update_economic_calendar: 24 saat
+    'summary': 60 * 60,             # generate_hourly_market_summary: 1 saat
+    'user_alarms': 60               # kullanıcı başına, dakika sınırına göre anahtarlanır
+}
+
+# Redis hatasından sonra bu süre boyunca önbellek atlanır (saniye)
+FAILURE_BACKOFF = 30
+
+_disabled_until = 0.0
+
+_KEY_TYPES = (str, int, float, bool, type(None), datetime.date, datetime.datetime)
+
+
+def _available() -> bool:
+    return time.monotonic() >= _disabled_until
+
+
+def _mark_failure(error: Exception):
+    global _disabled_until
+    if _available():
+        logger.warning(f"Redis önbelleği devre dışı ({FAILURE_BACKOFF} sn): {error!r}")
+    _disabled_until = time.monotonic() + FAILURE_BACKOFF
+
+
+def _index_key(namespace: str) -> str:
+    return f"{KEY_PREFIX}:{namespace}:keys"
+
+
+def make_key(namespace: str, params: dict) -> str:
+    """Sadece basit tipteki parametrelerden (session vb. hariç) deterministik anahtar üretir"""
+    simple = {k: v for k, v in params.items() if isinstance(v, _KEY_TYPES)}
+    return f"{KEY_PREFIX}:{namespace}:{json.dumps(simple, sort_keys=True, default=str)}"
+
+
+async def get_cached(key: str):
+    if not _available():
+        return None
+    try:
+        return await async_redis_client.get(key)
+    except Exception as e:
+        _mark_failure(e)
+        return None
+
+
+async def set_cached(namespace: str, key: str, payload: str, ttl: int):
+    if not _available():
+        return
+    try:
+        async with async_redis_client.pipeline(transaction=False) as pipe:
+            pipe.set(key, payload, ex=ttl)
+            # Namespace temizlenirken silinecek anahtarlar
+            pipe.sadd(_index_key(namespace), key)
+            pipe.expire(_index_key(namespace), ttl)
+            await pipe.execute()
+    except Exception as e:
+        _mark_failure(e)
+
+
+async def invalidate_async(*namespaces: str):
+    """Verilen namespace'lerdeki tüm önbellek kayıtlarını siler"""
+    try:
+        for namespace in namespaces:
+            index = _index_key(namespace)
+            keys = await async_redis_client.smembers(index)
+            await async_redis_client.delete(index, *keys)
+    except Exception as e:
+        logger.warning(f"Önbellek temizlenemedi {namespaces}: {e!r}")
+
+
+async def delete_cached(*keys: str):
+    """Tek tek anahtarları siler (örn. kullanıcıya özel kayıtlar)"""
+    if not keys:
+        return
+    try:
+        await async_redis_client.delete(*keys)
+    except Exception as e:
+        logger.warning(f"Önbellek kaydı silinemedi {keys}: {e!r}")
+
+
+def _json_response(payload: str, status: str) -> Response:
+    return Response(content=payload, media_type="application/json", headers={"X-Cache": status})
+
+
+async def cached_response(namespace: str, key: str, compute: Callable[[], Awaitable]) -> Response:
+    """
+    Anahtar önbellekteyse yanıtı doğrudan döndürür, değilse compute() sonucunu
+    serileştirip saklar. Sadece başarılı ('success' False olmayan) yanıtlar saklanır.
+    """
+    payload = await get_cached(key)
+    if payload is not None:
+        return _json_response(payload, "HIT")
+
+    result = await compute()
+    if isinstance(result, Response):
+        return result
+
+    payload = json.dumps(jsonable_encoder(result), ensure_ascii=False, separators=(",", ":"))
+    if not (isinstance(result, dict) and result.get('success') is False):
+        await set_cached(namespace, key, payload, CACHE_TTLS[namespace])
+    return _json_response(payload, "MISS")
+
+
+def cached_endpoint(namespace: str):
+    """
+    Async endpoint'in yanıtını namespace TTL'i ile önbellekler.
+    Sadece başarılı ('success' False olmayan) yanıtlar saklanır.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await cached_response(
+                namespace, make_key(namespace, kwargs), lambda: func(*args, **kwargs)
+            )
+        return wrapper
+    return decorator
@@ -0,0 +1,216 @@
+"""
+Correlation Engine - Piyasa sembolleri arasında korelasyon hesapları
+Zaman olarak hizalanmış seriler önceden toplanmış (continuous aggregate)
+görünümlerden parametreli sorguyla çekilir ve NumPy ile hesaplanır:
+tek katsayı, kayan pencere, gecikmeli (lag) ve N×N matris.
+Sonuçlar (semboller, pencere, çözünürlük, ...) anahtarıyla önbelleklenir ve
+yeni tick geldiğinde temizlenir.
+"""
+
+from database import engine
+from sqlalchemy import text, bindparam
+from services.timescale_service import AGGREGATE_RESOLUTIONS
+import numpy as np
+import datetime
+import threading
+import logging
+from typing import Dict, Optional, Sequence, Tuple
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 'raw' ham market_data tablosunu, diğerleri OHLC görünümlerinin kapanışını kullanır
+RESOLUTIONS = ['raw'] + list(AGGREGATE_RESOLUTIONS)
+MODES = ['pearson', 'rolling', 'lagged']
+DEFAULT_RESOLUTION = '1d'
+DEFAULT_WINDOW = 30
+DEFAULT_LAGS = (0, 1, 2, 3, 5, 10)
+# Önbellekte tutulacak en fazla sonuç
+MAX_CACHE_ENTRIES = 256
+
+
+def _clean(value) -> Optional[float]:
+    """NaN/inf değerleri JSON'a uygun None'a çevirir"""
+    if value is None or not np.isfinite(value):
+        return None
+    return round(float(value), 4)
+
+
+def pearson(x: np.ndarray, y: np.ndarray) -> float:
+    if len(x) < 2:
+        return float('nan')
+    x = x - x.mean()
+    y = y - y.mean()
+    denominator = np.sqrt((x * x).sum() * (y * y).sum())
+    return float((x * y).sum() / denominator) if denominator > 0 else float('nan')
+
+
+def rolling_pearson(x: np.ndarray, y: np.ndarray, window: int) -> np.ndarray:
+    """Tüm pencereler için korelasyonu kümülatif toplamlarla tek geçişte hesaplar"""
+    if len(x) < window or window < 2:
+        return np.empty(0)
+
+    def window_sums(values):
+        cumulative = np.concatenate([[0.0], np.cumsum(values)])
+        return cumulative[window:] - cumulative[:-window]
+
+    # Sayısal kararlılık için ortalamadan arındır
+    x = x - x.mean()
+    y = y - y.mean()
+    sx, sy = window_sums(x), window_sums(y)
+    sxx, syy, sxy = window_sums(x * x), window_sums(y * y), window_sums(x * y)
+
+    covariance = sxy - sx * sy / window
+    variance_x = sxx - sx * sx / window
+    variance_y = syy - sy * sy / window
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return covariance / np.sqrt(variance_x * variance_y)
+
+
+def lagged_pearson(x: np.ndarray, y: np.ndarray, lags: Sequence[int]) -> Dict[int, float]:
+    """Pozitif lag: y, x'i `lag` adım geriden takip ediyor mu?"""
+    result = {}
+    for lag in lags:
+        if lag >= 0:
+            result[lag] = pearson(x[:len(x) - lag], y[lag:])
+        else:
+            result[lag] = pearson(x[-lag:], y[:len(y) + lag])
+    return result
+
+
+def to_returns(matrix: np.ndarray) -> np.ndarray:
+    """Fiyat serilerini basit getiri serilerine çevirir"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.diff(matrix, axis=0) / matrix[:-1]
+
+
+class CorrelationEngine:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache: Dict[Tuple, Dict] = {}
+
+    def invalidate(self):
+        """Yeni tick yazıldığında çağrılır"""
+        with self._lock:
+            self._cache.clear()
+
+    def _cached(self, key: Tuple, compute):
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key]
+        result = compute()
+        with self._lock:
+            if len(self._cache) >= MAX_CACHE_ENTRIES:
+                self._cache.pop(next(iter(self._cache)))
+            self._cache[key] = result
+        return result
+
+    def load_aligned_series(self, symbols: Sequence[str], resolution: str = DEFAULT_RESOLUTION,
+                            start: Optional[datetime.datetime] = None,
+                            end: Optional[datetime.datetime] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Sembollerin ortak zaman noktalarındaki fiyatlarını döndürür.
+
+        Returns:
+            (times: [T], prices: [T x N]) - sütun sırası `symbols` ile aynı
+        """
+        if resolution == 'raw':
+            table, time_col, price_col = 'market_data', 'time', 'price'
+        else:
+            table, time_col, price_col = AGGREGATE_RESOLUTIONS[resolution]['view'], 'bucket', 'close'
+
+        query = text(f"""
+            SELECT {time_col} AS t, symbol, {price_col} AS price
+            FROM {table}
+            WHERE symbol IN :symbols
+              AND (CAST(:start AS TIMESTAMPTZ) IS NULL OR {time_col} >= CAST(:start AS TIMESTAMPTZ))
+              AND (CAST(:end AS TIMESTAMPTZ) IS NULL OR {time_col} <= CAST(:end AS TIMESTAMPTZ))
+            ORDER BY {time_col} ASC
+        """).bindparams(bindparam('symbols', expanding=True))
+
+        # Aynı sembol birden fazla kez istenebilir (örn. asset1 == asset2): her sembol
+        # bir kez çekilir, tekrar eden semboller aynı sütunu paylaşır
+        unique_symbols = list(dict.fromkeys(symbols))
+        with engine.connect() as conn:
+            rows = conn.execute(query, {'symbols': unique_symbols, 'start': start, 'end': end}).fetchall()
+
+        if not rows:
+            return np.empty(0, dtype=object), np.empty((0, len(symbols)))
+
+        column_of = {s: i for i, s in enumerate(unique_symbols)}
+        times, time_index = np.unique(np.array([r[0] for r in rows], dtype=object), return_inverse=True)
+        prices = np.full((len(times), len(unique_symbols)), np.nan)
+        prices[time_index, [column_of[r[1]] for r in rows]] = [r[2] for r in rows]
+        prices = prices[:, [column_of[s] for s in symbols]]
+
+        # Sadece tüm sembollerin verisi olan zaman noktalarını tut
+        complete = ~np.isnan(prices).any(axis=1)
+        return times[complete], prices[complete]
+
+    def correlate(self, asset1: str, asset2: str, mode: str = 'pearson',
+                  resolution: str = DEFAULT_RESOLUTION, window: int = DEFAULT_WINDOW,
+                  lags: Sequence[int] = DEFAULT_LAGS, returns: bool = False,
+                  start: Optional[datetime.datetime] = None,
+                  end: Optional[datetime.datetime] = None) -> Dict:
+        key = ('pair', asset1, asset2, mode, resolution, window, tuple(lags), returns, start, end)
+        return self._cached(key, lambda: self._correlate(
+            asset1, asset2, mode, resolution, window, lags, returns, start, end
+        ))
+
+    def _correlate(self, asset1, asset2, mode, resolution, window, lags, returns, start, end) -> Dict:
+        times, prices = self.load_aligned_series([asset1, asset2], resolution, start, end)
+        if returns and len(prices) > 1:
+            prices, times = to_returns(prices), times[1:]
+        x, y = prices[:, 0], prices[:, 1]
+
+        result = {
+            'mode': mode,
+            'resolution': resolution,
+            'returns_based': returns,
+            'data_points': len(times),
+            'correlation_score': _clean(pearson(x, y))
+        }
+
+        if mode == 'rolling':
+            series = rolling_pearson(x, y, window)
+            result['window'] = window
+            result['rolling'] = [
+                {'time': t.isoformat(), 'correlation': _clean(c)}
+                for t, c in zip(times[window - 1:], series)
+            ]
+        elif mode == 'lagged':
+            result['lags'] = [
+                {'lag': lag, 'correlation': _clean(c)}
+                for lag, c in lagged_pearson(x, y, lags).items()
+            ]
+        return result
+
+    def correlation_matrix(self, symbols: Sequence[str], resolution: str = DEFAULT_RESOLUTION,
+                           returns: bool = False, start: Optional[datetime.datetime] = None,
+                           end: Optional[datetime.datetime] = None) -> Dict:
+        key = ('matrix', tuple(symbols), resolution, returns, start, end)
+        return self._cached(key, lambda: self._correlation_matrix(symbols, resolution, returns, start, end))
+
+    def _correlation_matrix(self, symbols, resolution, returns, start, end) -> Dict:
+        times, prices = self.load_aligned_series(symbols, resolution, start, end)
+        if returns and len(prices) > 1:
+            prices = to_returns(prices)
+
+        if len(prices) < 2:
+            matrix = np.full((len(symbols), len(symbols)), np.nan)
+        else:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                matrix = np.atleast_2d(np.corrcoef(prices, rowvar=False))
+
+        return {
+            'symbols': list(symbols),
+            'resolution': resolution,
+            'returns_based': returns,
+            'data_points': len(prices),
+            'matrix': [[_clean(v) for v in row] for row in matrix]
+        }
+
+
+# Global instance
+correlation_engine = CorrelationEngine()
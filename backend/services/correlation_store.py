@@ -0,0 +1,205 @@
+"""
+Correlation Store - Olay-piyasa korelasyonlarının bellek içi kopyası
+MarketEventCorrelation tablosunu toplu yükleyip (event_id, symbol) bazında
+NumPy dizileri olarak tutar; tahmin sırasında veritabanına gidilmez.
+"""
+
+from database import BatchSessionLocal
+from models import MarketEventCorrelation
+from sqlalchemy import func
+import numpy as np
+import threading
+import time
+import logging
+from typing import Dict, List, Sequence
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# DB'de değişiklik olup olmadığını en fazla bu sıklıkta kontrol et (saniye)
+REFRESH_INTERVAL = 60
+
+
+class CorrelationStore:
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._symbols: Dict[str, int] = {}
+        self._symbol_names: List[str] = []
+        self._set_arrays([])
+        self._count = 0
+        self._max_id = 0
+        self._last_check = 0.0
+        self._loaded = False
+
+    def _set_arrays(self, rows):
+        """(id, event_id, symbol, percent_change, strength, days_after, before, after) satırlarından dizileri kurar"""
+        self._symbols = {}
+        self._symbol_names = []
+        for row in rows:
+            if row[2] not in self._symbols:
+                self._symbols[row[2]] = len(self._symbol_names)
+                self._symbol_names.append(row[2])
+
+        # event_id'ye göre sıralı tut ki searchsorted ile aralık bulunabilsin
+        rows = sorted(rows, key=lambda r: (r[1], r[0]))
+        self.event_ids = np.array([r[1] for r in rows], dtype=np.int64)
+        self.symbol_codes = np.array([self._symbols[r[2]] for r in rows], dtype=np.int16)
+        self.percent_change = np.array([r[3] for r in rows], dtype=np.float64)
+        self.strength = np.array([r[4] if r[4] is not None else 0.5 for r in rows], dtype=np.float32)
+        self.days_after = np.array([r[5] if r[5] is not None else 7 for r in rows], dtype=np.int16)
+        self.price_before = np.array([r[6] for r in rows], dtype=np.float64)
+        self.price_after = np.array([r[7] for r in rows], dtype=np.float64)
+
+    def reload(self):
+        """Tüm korelasyonları tek sorguda yükler"""
+        db = BatchSessionLocal()
+        try:
+            rows = db.query(
+                MarketEventCorrelation.id,
+                MarketEventCorrelation.event_id,
+                MarketEventCorrelation.symbol,
+                MarketEventCorrelation.percent_change,
+                MarketEventCorrelation.correlation_strength,
+                MarketEventCorrelation.days_after,
+                MarketEventCorrelation.price_before,
+                MarketEventCorrelation.price_after
+            ).all()
+        finally:
+            db.close()
+
+        with self._lock:
+            self._set_arrays(rows)
+            self._count = len(rows)
+            self._max_id = max((r[0] for r in rows), default=0)
+            self._last_check = time.monotonic()
+            self._loaded = True
+        logger.info(f"Korelasyon tablosu yüklendi: {len(rows)} kayıt")
+
+    def refresh(self, force: bool = False):
+        """Satır sayısı veya en büyük id değiştiyse tabloyu yeniden yükler"""
+        if not self._loaded:
+            self.reload()
+            return
+
+        now = time.monotonic()
+        if not force and now - self._last_check < REFRESH_INTERVAL:
+            return
+        self._last_check = now
+
+        db = BatchSessionLocal()
+        try:
+            total, max_id = db.query(
+                func.count(MarketEventCorrelation.id), func.max(MarketEventCorrelation.id)
+            ).one()
+        finally:
+            db.close()
+
+        if total != self._count or (max_id or 0) != self._max_id:
+            self.reload()
+
+    def invalidate(self):
+        """Bir sonraki erişimde DB kontrolünü zorlar"""
+        self._last_check = 0.0
+
+    def _gather(self, event_ids: Sequence[int]):
+        """
+        Verilen olayların tüm korelasyon satır indekslerini ve
+        her satırın hangi sorgu elemanına ait olduğunu döndürür
+        """
+        query = np.asarray(event_ids, dtype=np.int64)
+        left = np.searchsorted(self.event_ids, query, side='left')
+        right = np.searchsorted(self.event_ids, query, side='right')
+        counts = right - left
+        total = int(counts.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        owner = np.repeat(np.arange(len(query)), counts)
+        # Her aralığın içindeki ofset: 0..count-1
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        rows = np.repeat(left, counts) + offsets
+        return rows, owner
+
+    def aggregate(self, event_ids: Sequence[int], weights: Sequence[float], symbols: Sequence[str]) -> Dict[str, Dict]:
+        """
+        Benzer olayların korelasyonlarını sembol bazında tek geçişte özetler.
+
+        Returns:
+            {symbol: {'weighted_sum', 'count', 'positive', 'negative'}}
+        """
+        return self.aggregate_batch([event_ids], [weights], symbols)[0]
+
+    def aggregate_batch(self, event_id_lists: Sequence[Sequence[int]], weight_lists: Sequence[Sequence[float]],
+                        symbols: Sequence[str]) -> List[Dict[str, Dict]]:
+        """
+        Birden fazla güncel olayın (her biri kendi benzer olay listesiyle)
+        tüm semboller için özetini tek bir vektörel geçişte hesaplar.
+        """
+        self.refresh()
+
+        with self._lock:
+            result = [
+                {s: {'weighted_sum': 0.0, 'count': 0, 'positive': 0, 'negative': 0} for s in symbols}
+                for _ in event_id_lists
+            ]
+            lengths = np.array([len(ids) for ids in event_id_lists], dtype=np.int64)
+            if not lengths.sum() or not len(self.event_ids):
+                return result
+
+            flat_ids = np.concatenate([np.asarray(ids, dtype=np.int64) for ids in event_id_lists])
+            flat_weights = np.concatenate([np.asarray(w, dtype=np.float64) for w in weight_lists])
+            query_of = np.repeat(np.arange(len(event_id_lists)), lengths)
+
+            rows, owner = self._gather(flat_ids)
+            if not len(rows):
+                return result
+
+            n_symbols = len(self._symbol_names)
+            keys = query_of[owner] * n_symbols + self.symbol_codes[rows]
+            changes = self.percent_change[rows]
+            size = len(event_id_lists) * n_symbols
+
+            weighted_sum = np.bincount(keys, weights=changes * flat_weights[owner], minlength=size)
+            count = np.bincount(keys, minlength=size)
+            positive = np.bincount(keys, weights=(changes > 0), minlength=size)
+            negative = np.bincount(keys, weights=(changes < 0), minlength=size)
+
+            for symbol in symbols:
+                code = self._symbols.get(symbol)
+                if code is None:
+                    continue
+                for q in np.flatnonzero(count[code::n_symbols]).tolist():
+                    key = q * n_symbols + code
+                    result[q][symbol] = {
+                        'weighted_sum': float(weighted_sum[key]),
+                        'count': int(count[key]),
+                        'positive': int(positive[key]),
+                        'negative': int(negative[key])
+                    }
+            return result
+
+    def rows_for_events(self, event_ids: Sequence[int]) -> List[List[Dict]]:
+        """Her olay için tüm korelasyon satırlarını (tüm semboller) döndürür"""
+        self.refresh()
+
+        with self._lock:
+            result = [[] for _ in event_ids]
+            if not len(event_ids) or not len(self.event_ids):
+                return result
+
+            rows, owner = self._gather(event_ids)
+            for row, idx in zip(rows.tolist(), owner.tolist()):
+                result[idx].append({
+                    'symbol': self._symbol_names[self.symbol_codes[row]],
+                    'price_before': float(self.price_before[row]),
+                    'price_after': float(self.price_after[row]),
+                    'percent_change': float(self.percent_change[row]),
+                    'days_after': int(self.days_after[row]),
+                    'correlation_strength': float(self.strength[row])
+                })
+            return result
+
+
+# Global instance
+correlation_store = CorrelationStore()
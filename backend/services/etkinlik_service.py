@@ -1,41 +1,169 @@
-
 import httpx
 import os
-from typing import List, Dict, Any
+import json
+import time
+import asyncio
+import logging
+import secrets
+from redis_client import async_redis_client
+from services.http_client import http_client
+from typing import List, Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
 
 ETKINLIK_API_URL = "https://backend.etkinlik.io/api/v2"
 API_TOKEN = os.getenv("ETKINLIK_API_TOKEN")
 
-async def get_events(limit: int = 10) -> List[Dict[str, Any]]:
+# Önbellek: FRESH_TTL içinde doğrudan döner; sonraki STALE_TTL boyunca eski veri
+# döner ve arka planda yenilenir (stale-while-revalidate)
+FRESH_TTL = int(os.getenv("ETKINLIK_FRESH_TTL", str(5 * 60)))
+STALE_TTL = int(os.getenv("ETKINLIK_STALE_TTL", str(60 * 60)))
+# Başka bir worker upstream'den çekerken en fazla bu kadar beklenir (saniye)
+LOCK_TTL = 15
+LOCK_WAIT = 5
+LOCK_POLL_INTERVAL = 0.1
+# Arka planda sıcak tutulan ilk sayfa (EventBar.jsx)
+WARM_PAGES = [(10, 0)]
+
+# KEYS[1]: kilit; ARGV[1]: kilidi alan worker'ın token'ı
+# Kilit sadece hâlâ bu worker'a aitse silinir (TTL dolup başkası almış olabilir)
+_RELEASE_LOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_release_lock = async_redis_client.register_script(_RELEASE_LOCK)
+
+# (limit, skip) -> devam eden upstream isteği (worker içi single-flight)
+_inflight: Dict[tuple, asyncio.Task] = {}
+
+
+async def _fetch_events(limit: int, skip: int) -> Optional[List[Dict[str, Any]]]:
     """
-    Fetches events from Etkinlik.io API.
+    Fetches events from Etkinlik.io API. Returns None on error so failures are not cached.
     """
     if not API_TOKEN:
         print("Warning: ETKINLIK_API_TOKEN is not set.")
-        return []
+        return None
 
     headers = {
         "X-Etkinlik-Token": API_TOKEN
     }
-    
+
     # Example endpoint: /events
     # Documentation says /events or similar from analysis
     # We used 'https://backend.etkinlik.io/api/v2/events' successfully in curl
-    
+
     url = f"{ETKINLIK_API_URL}/events"
     params = {
-        "take": limit, 
-        "skip": 0
+        "take": limit,
+        "skip": skip
     }
 
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(url, headers=headers, params=params)
-            response.raise_for_status()
-            data = response.json()
-            # The structure depends on API response, usually 'items' or direct list
-            # Based on common practices and curl check earlier (though I didn't see deep output)
-            return data.get('items', []) if isinstance(data, dict) else data
-        except httpx.HTTPError as e:
-            print(f"Error fetching events from Etkinlik.io: {e}")
-            return []
+    try:
+        # Paylaşılan havuzlu istemci: bağlantı yeniden kullanılır, hata durumunda yeniden denenir
+        response = await http_client.get(url, headers=headers, params=params)
+        response.raise_for_status()
+        data = response.json()
+        # The structure depends on API response, usually 'items' or direct list
+        # Based on common practices and curl check earlier (though I didn't see deep output)
+        return data.get('items', []) if isinstance(data, dict) else data
+    except (httpx.HTTPError, ValueError) as e:
+        # ValueError: yanıt geçerli JSON değil
+        print(f"Error fetching events from Etkinlik.io: {e}")
+        return None
+
+
+async def get_events(limit: int = 10, skip: int = 0) -> List[Dict[str, Any]]:
+    """
+    Fetches events from Etkinlik.io API directly (önbelleksiz).
+    """
+    return await _fetch_events(limit, skip) or []
+
+
+def _cache_key(limit: int, skip: int) -> str:
+    return f"etkinlik:events:{limit}:{skip}"
+
+
+async def _read_cache(key: str) -> Optional[Dict]:
+    try:
+        payload = await async_redis_client.get(key)
+    except Exception as e:
+        logger.warning(f"Etkinlik önbelleği okunamadı: {e!r}")
+        return None
+    return json.loads(payload) if payload else None
+
+
+async def _refresh(limit: int, skip: int) -> Optional[List[Dict[str, Any]]]:
+    """
+    Upstream'den çekip önbelleğe yazar. Redis kilidi sayesinde tüm worker'lar
+    arasında aynı sayfa için tek istek gider; kilidi alamayan worker diğerinin
+    yazmasını bekler.
+    """
+    key = _cache_key(limit, skip)
+    lock_key = f"{key}:lock"
+    token = secrets.token_hex(16)
+    try:
+        locked = await async_redis_client.set(lock_key, token, nx=True, ex=LOCK_TTL)
+    except Exception:
+        locked, token = True, None  # Redis yoksa kilitsiz devam et
+
+    if not locked:
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+            entry = await _read_cache(key)
+            if entry is not None and time.time() - entry['fetched_at'] < FRESH_TTL:
+                return entry['items']
+        # Diğer worker yanıt vermedi, kendimiz çekelim
+
+    try:
+        items = await _fetch_events(limit, skip)
+        if items is not None:
+            entry = json.dumps({'fetched_at': time.time(), 'items': items}, ensure_ascii=False)
+            try:
+                await async_redis_client.set(key, entry, ex=FRESH_TTL + STALE_TTL)
+            except Exception as e:
+                logger.warning(f"Etkinlik önbelleği yazılamadı: {e!r}")
+        return items
+    finally:
+        if locked and token is not None:
+            try:
+                await _release_lock(keys=[lock_key], args=[token])
+            except Exception:
+                pass
+
+
+def _single_flight(limit: int, skip: int) -> asyncio.Task:
+    """Aynı sayfa için eşzamanlı istekler tek bir upstream isteğini paylaşır"""
+    flight_key = (limit, skip)
+    task = _inflight.get(flight_key)
+    if task is None:
+        task = asyncio.create_task(_refresh(limit, skip))
+        _inflight[flight_key] = task
+        task.add_done_callback(lambda _: _inflight.pop(flight_key, None))
+    return task
+
+
+async def get_events_cached(limit: int = 10, skip: int = 0) -> List[Dict[str, Any]]:
+    """
+    Önbellekli etkinlik listesi: taze kayıt doğrudan, bayat kayıt anında döner
+    (arka planda yenilenir); kayıt yoksa tek bir upstream isteği beklenir.
+    """
+    entry = await _read_cache(_cache_key(limit, skip))
+    if entry is not None:
+        if time.time() - entry['fetched_at'] >= FRESH_TTL:
+            _single_flight(limit, skip)
+        return entry['items']
+
+    # shield: istemci bağlantıyı kapatsa da paylaşılan istek iptal olmaz
+    items = await asyncio.shield(_single_flight(limit, skip))
+    return items or []
+
+
+async def warm_events_cache():
+    """Scheduler tarafından çağrılır; ilk sayfa süresi dolmadan yenilenir"""
+    for limit, skip in WARM_PAGES:
+        await _single_flight(limit, skip)
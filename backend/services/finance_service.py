@@ -1,37 +1,49 @@
-import pandas as pd
 import yfinance as yf
-from database import engine, SessionLocal
+from database import AsyncSessionLocal
 from models import CurrentMarketRate, CurrentEvent
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from services.market_data_service import SYMBOL_UNIVERSE
+from services.broadcast_service import broadcaster, dumps
+from services.correlation_engine import (
+    correlation_engine, MODES, RESOLUTIONS, DEFAULT_RESOLUTION, DEFAULT_WINDOW, DEFAULT_LAGS
+)
 import datetime
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def analyze_correlation(asset1: str, asset2: str):
-    query = f"""
-    SELECT time, symbol, price 
-    FROM market_data 
-    WHERE symbol IN ('{asset1}', '{asset2}') 
-    ORDER BY time ASC
+# Her tick sonrası güncel kurların yayınlandığı kanal
+RATES_CHANNEL = "market:current_rates"
+
+def analyze_correlation(asset1: str, asset2: str, mode: str = 'pearson',
+                        resolution: str = DEFAULT_RESOLUTION, window: int = DEFAULT_WINDOW,
+                        lags=DEFAULT_LAGS, returns: bool = False, start=None, end=None):
+    """
+    İki sembol arasındaki korelasyonu döndürür.
+    mode: 'pearson' (tek katsayı), 'rolling' (kayan pencere) veya 'lagged' (gecikmeli)
     """
+    if mode not in MODES:
+        return {"error": f"mode must be one of {MODES}"}
+    if resolution not in RESOLUTIONS:
+        return {"error": f"resolution must be one of {RESOLUTIONS}"}
     
     try:
-        df = pd.read_sql(query, engine)
+        result = correlation_engine.correlate(
+            asset1, asset2, mode=mode, resolution=resolution, window=window,
+            lags=lags, returns=returns, start=start, end=end
+        )
         
-        if df.empty:
+        if result['data_points'] == 0:
             return {"error": "No data found"}
-            
-        # Pivot to get columns for each symbol
-        df_pivot = df.pivot(index='time', columns='symbol', values='price')
         
-        # Calculate correlation
-        correlation = df_pivot[asset1].corr(df_pivot[asset2])
+        correlation = result['correlation_score']
         
         insight = ""
-        if correlation > 0.7:
+        if correlation is not None and correlation > 0.7:
             insight = f"Güçlü pozitif ilişki. {asset1} arttığında, {asset2} genellikle onu takip eder."
-        elif correlation < -0.7:
+        elif correlation is not None and correlation < -0.7:
             insight = f"Güçlü ters ilişki. {asset1} arttığında, {asset2} düşer."
         else:
             insight = "Güçlü bir korelasyon tespit edilmedi."
@@ -39,70 +51,115 @@ def analyze_correlation(asset1: str, asset2: str):
         return {
             "asset1": asset1,
             "asset2": asset2,
-            "correlation_score": round(correlation, 4),
             "insight": insight,
-            "data_points": len(df_pivot)
+            **result
         }
         
     except Exception as e:
         return {"error": str(e)}
 
 
-async def get_current_rates(symbols=None):
+def analyze_correlation_matrix(symbols=None, resolution: str = DEFAULT_RESOLUTION,
+                               returns: bool = False, start=None, end=None):
+    """
+    Takip edilen tüm sembollerin (veya verilenlerin) N×N korelasyon matrisini döndürür
+    """
+    if symbols is None:
+        symbols = sorted({info['history_symbol'] for info in SYMBOL_UNIVERSE.values()})
+    if resolution not in RESOLUTIONS:
+        return {"error": f"resolution must be one of {RESOLUTIONS}"}
+    
+    try:
+        return correlation_engine.correlation_matrix(
+            symbols, resolution=resolution, returns=returns, start=start, end=end
+        )
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def _format_rate(rate):
+    return {
+        'symbol': rate.symbol,
+        'name': rate.name,
+        'price': float(rate.price),
+        'daily_change': float(rate.daily_change),
+        'daily_change_percent': float(rate.daily_change_percent),
+        'last_updated': rate.last_updated.isoformat() if rate.last_updated else None
+    }
+
+
+async def get_current_rates(symbols=None, db: AsyncSession = None):
     """
     Database'deki güncel kurları döndürür.
     (Canlı veri çekme işi scheduler.py içindeki fetch_market_data'ya bırakıldı)
+    db verilmezse kendi async session'ını açar.
     """
     if symbols is None:
-        symbols = ['GOLD', 'USDTRY']
+        symbols = list(SYMBOL_UNIVERSE)
     
-    db = SessionLocal()
-    rates_data = []
+    if db is None:
+        async with AsyncSessionLocal() as session:
+            return await get_current_rates(symbols, session)
     
     try:
-        rates = db.query(CurrentMarketRate).filter(CurrentMarketRate.symbol.in_(symbols)).all()
-        
-        for rate in rates:
-            rates_data.append({
-                'symbol': rate.symbol,
-                'name': rate.name,
-                'price': float(rate.price),
-                'daily_change': float(rate.daily_change),
-                'daily_change_percent': float(rate.daily_change_percent),
-                'last_updated': rate.last_updated.isoformat() if rate.last_updated else None
-            })
-        
-        return rates_data
+        result = await db.execute(
+            select(CurrentMarketRate).where(CurrentMarketRate.symbol.in_(symbols))
+        )
+        return [_format_rate(rate) for rate in result.scalars().all()]
         
     except Exception as e:
         logger.error(f"Kur getirme hatası: {str(e)}")
         return []
-    finally:
-        db.close()
 
 
-async def get_market_analysis():
+async def publish_current_rates():
+    """
+    Güncel kur listesini bir kez serileştirip tüm worker'lardaki
+    /stream/current-rates istemcilerine yayınlar
+    """
+    rates = await get_current_rates()
+    if not rates:
+        return 0
+    try:
+        await broadcaster.publish(RATES_CHANNEL, dumps(rates), retain=True)
+    except Exception as e:
+        logger.error(f"Kur yayını hatası: {e!r}")
+        return 0
+    return len(rates)
+
+
+async def current_rates_snapshot():
+    """Yeni bağlanan stream istemcisi için son yayın (yoksa DB'den)"""
+    payload = await broadcaster.last(RATES_CHANNEL)
+    if payload is None:
+        rates = await get_current_rates()
+        payload = dumps(rates) if rates else None
+    return payload
+
+
+async def get_market_analysis(db: AsyncSession = None):
     """
     Komple piyasa analizi döndürür:
     - Güncel kurlar
     - Güncel olaylar ve tahminleri
     - Genel durum özeti
     """
-    db = SessionLocal()
+    if db is None:
+        async with AsyncSessionLocal() as session:
+            return await get_market_analysis(session)
     
     try:
-        # Önce kurları güncelle
-        await get_current_rates()
-        
         # Güncel kurları al
-        rates = db.query(CurrentMarketRate).all()
+        rates = (await db.execute(select(CurrentMarketRate))).scalars().all()
         
         # Son güncel olayları al (en yüksek impact'e göre)
-        recent_events = db.query(CurrentEvent).filter(
-            CurrentEvent.analyzed == 1
-        ).order_by(
-            CurrentEvent.predicted_impact.desc()
-        ).limit(5).all()
+        recent_events = (await db.execute(
+            select(CurrentEvent).where(
+                CurrentEvent.analyzed == 1
+            ).order_by(
+                CurrentEvent.predicted_impact.desc()
+            ).limit(5)
+        )).scalars().all()
         
         # Formatla
         rates_data = []
@@ -150,6 +207,4 @@ async def get_market_analysis():
             'rates': [],
             'events': []
         }
-    finally:
-        db.close()
 
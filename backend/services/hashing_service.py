@@ -0,0 +1,99 @@
+"""
+Hashing Service - Şifre hash'leme/doğrulama için sınırlı iş havuzu
+bcrypt bir doğrulamada ~100-300 ms CPU harcar; event loop'ta çalışırsa o
+worker'daki tüm istekler bekler. İşler ayrı ve sınırlı bir thread havuzunda
+çalışır (bcrypt C kodunda GIL'i bırakır). Bekleyen iş sayısı HASH_QUEUE_LIMIT'i
+aşarsa yeni istek kuyruğa alınmaz, 503 ile hemen reddedilir; böylece giriş
+patlamaları bellek ve gecikme olarak diğer endpoint'lere taşmaz.
+"""
+
+from auth_utils import pwd_context
+from fastapi import HTTPException, status
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+import asyncio
+import logging
+import os
+import threading
+import time
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Eşzamanlı bcrypt işi (varsayılan: çekirdek sayısının yarısı, en az 1)
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+# Çalışan + bekleyen en fazla iş; fazlası reddedilir
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", str(HASH_WORKERS * 16)))
+# Reddedilen isteklere önerilen bekleme (saniye)
+RETRY_AFTER = 1
+
+
+class HashingService:
+
+    def __init__(self, workers: int = HASH_WORKERS, queue_limit: int = HASH_QUEUE_LIMIT):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._pending = 0
+        self._running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.peak_pending = 0
+        self._total_wait = 0.0
+        self._lock = threading.Lock()
+
+    def _timed(self, func, submitted_at: float, *args):
+        with self._lock:
+            self._running += 1
+            self._total_wait += time.perf_counter() - submitted_at
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    async def _submit(self, func, *args):
+        if self._pending >= self.queue_limit:
+            self.rejected += 1
+            logger.warning(f"Hash kuyruğu dolu ({self._pending}), istek reddedildi")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many concurrent login attempts, try again shortly",
+                headers={"Retry-After": str(RETRY_AFTER)},
+            )
+
+        self._pending += 1
+        self.peak_pending = max(self.peak_pending, self._pending)
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self._timed, func, time.perf_counter(), *args)
+        finally:
+            self._pending -= 1
+            self.completed += 1
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(pwd_context.hash, password)
+
+    async def verify_and_update(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """
+        Şifreyi doğrular. Hash eski bir maliyetle (rounds) üretilmişse ikinci
+        değer yeni hash'tir; çağıran kullanıcı kaydını güncellemelidir.
+        """
+        return await self._submit(pwd_context.verify_and_update, password, hashed)
+
+    def stats(self) -> Dict:
+        return {
+            'workers': self.workers,
+            'queue_limit': self.queue_limit,
+            'pending': self._pending,
+            'queue_depth': max(0, self._pending - self._running),
+            'running': self._running,
+            'peak_pending': self.peak_pending,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'avg_wait_ms': round(self._total_wait / self.completed * 1000, 2) if self.completed else 0.0
+        }
+
+
+# Global instance
+hashing_service = HashingService()
@@ -0,0 +1,307 @@
+"""
+HTTP Client - Dış servislere yapılan tüm istekler için ortak, havuzlu istemci
+Uygulama başlarken bir async ve bir sync httpx istemcisi açılır ve kapanışta
+kapatılır; bağlantılar keep-alive ile yeniden kullanıldığından her istekte
+TCP/TLS el sıkışması yapılmaz.
+Her host için ayrı eşzamanlılık sınırı, zaman aşımı, jitter'lı üstel
+geri çekilmeyle yeniden deneme ve circuit breaker uygulanır: art arda
+hata veren bir servis bir süre hiç çağrılmaz, istekler hemen hata alır.
+"""
+
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+import asyncio
+import httpx
+import logging
+import random
+import threading
+import time
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Havuz boyutları (tüm hostlar için toplam)
+MAX_CONNECTIONS = 100
+MAX_KEEPALIVE_CONNECTIONS = 20
+KEEPALIVE_EXPIRY = 30
+# Yeniden deneme geri çekilmesi: min(BACKOFF_CAP, BACKOFF_BASE * 2^deneme) * rastgele[0, 1)
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8.0
+# Yeniden denenecek yanıt kodları
+RETRY_STATUSES = {429, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+USER_AGENT = "MenagerApp/1.0"
+
+
+class CircuitOpenError(httpx.HTTPError):
+    """Host'un circuit breaker'ı açıkken istek gönderilmez"""
+
+
+class HostPolicy:
+    """Bir host için eşzamanlılık, zaman aşımı, yeniden deneme ve breaker ayarları"""
+
+    def __init__(self, max_concurrency: int = 10, timeout: float = 10.0, retries: int = 2,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0, min_interval: float = 0.0):
+        self.max_concurrency = max_concurrency
+        # İki isteğin başlangıcı arasındaki en kısa süre (saniye); 0 = sınırsız
+        self.min_interval = min_interval
+        self.timeout = timeout
+        self.retries = retries
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+
+DEFAULT_POLICY = HostPolicy()
+
+HOST_POLICIES: Dict[str, HostPolicy] = {
+    'backend.etkinlik.io': HostPolicy(max_concurrency=10, timeout=10),
+    'api.openweathermap.org': HostPolicy(max_concurrency=5, timeout=5),
+    # Nominatim kullanım politikası: saniyede en fazla 1 istek
+    'nominatim.openstreetmap.org': HostPolicy(max_concurrency=1, timeout=10, min_interval=1.0),
+    'router.project-osrm.org': HostPolicy(max_concurrency=5, timeout=10),
+    'mekansal.herokuapp.com': HostPolicy(max_concurrency=5, timeout=10),
+}
+
+
+def register_host_policy(host: str, policy: HostPolicy):
+    """Servisler kendi hostları için ayar tanımlar (örn. yapılandırılabilir Ollama adresi)"""
+    HOST_POLICIES[host] = policy
+
+
+class CircuitBreaker:
+
+    def __init__(self, host: str, failure_threshold: int, reset_timeout: float):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Yarı açık: tek bir deneme isteğine izin ver, diğerleri yine beklesin
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info(f"Circuit kapandı: {self.host}")
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning(f"Circuit açıldı: {self.host} ({self.failures} ardışık hata)")
+                self.opened_at = time.monotonic()
+
+
+def _backoff(attempt: int) -> float:
+    # Full jitter: aynı anda hata alan istemciler aynı anda tekrar denemesin
+    return min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt) * random.random()
+
+
+class HttpClient:
+
+    def __init__(self):
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._sync_client: Optional[httpx.Client] = None
+        self._async_limits: Dict[str, asyncio.Semaphore] = {}
+        self._sync_limits: Dict[str, threading.BoundedSemaphore] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        # host -> bir sonraki isteğin en erken başlayabileceği zaman (monotonic)
+        self._next_slot: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    # --- yaşam döngüsü ---
+
+    @staticmethod
+    def _client_options() -> Dict:
+        return {
+            'limits': httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_EXPIRY
+            ),
+            'timeout': httpx.Timeout(DEFAULT_POLICY.timeout),
+            'headers': {'User-Agent': USER_AGENT},
+            'follow_redirects': True
+        }
+
+    def _get_async(self) -> httpx.AsyncClient:
+        if self._async_client is None or self._async_client.is_closed:
+            self._async_client = httpx.AsyncClient(**self._client_options())
+        return self._async_client
+
+    def _get_sync(self) -> httpx.Client:
+        with self._lock:
+            if self._sync_client is None or self._sync_client.is_closed:
+                self._sync_client = httpx.Client(**self._client_options())
+            return self._sync_client
+
+    async def startup(self):
+        self._get_async()
+        self._get_sync()
+        logger.info("HTTP istemci havuzu açıldı")
+
+    async def shutdown(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+        if self._sync_client is not None:
+            self._sync_client.close()
+        logger.info("HTTP istemci havuzu kapatıldı")
+
+    # --- host bazlı durum ---
+
+    @staticmethod
+    def _policy(host: str) -> HostPolicy:
+        return HOST_POLICIES.get(host, DEFAULT_POLICY)
+
+    def _breaker(self, host: str) -> CircuitBreaker:
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            policy = self._policy(host)
+            with self._lock:
+                breaker = self._breakers.setdefault(
+                    host, CircuitBreaker(host, policy.failure_threshold, policy.reset_timeout)
+                )
+        return breaker
+
+    def _async_limit(self, host: str) -> asyncio.Semaphore:
+        semaphore = self._async_limits.get(host)
+        if semaphore is None:
+            semaphore = self._async_limits.setdefault(host, asyncio.Semaphore(self._policy(host).max_concurrency))
+        return semaphore
+
+    def _sync_limit(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            semaphore = self._sync_limits.get(host)
+            if semaphore is None:
+                semaphore = self._sync_limits.setdefault(
+                    host, threading.BoundedSemaphore(self._policy(host).max_concurrency)
+                )
+            return semaphore
+
+    def _reserve_slot(self, host: str) -> float:
+        """min_interval'lı hostlarda isteğin sırasını ayırır, beklenecek süreyi döndürür"""
+        interval = self._policy(host).min_interval
+        if interval <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            start_at = max(now, self._next_slot.get(host, 0.0))
+            self._next_slot[host] = start_at + interval
+        return start_at - now
+
+    def _prepare(self, method: str, url: str, retries: Optional[int], timeout: Optional[float]):
+        host = urlsplit(url).hostname or ''
+        policy = self._policy(host)
+        if retries is None:
+            retries = policy.retries if method.upper() in IDEMPOTENT_METHODS else 0
+        return host, self._breaker(host), retries, timeout if timeout is not None else policy.timeout
+
+    @staticmethod
+    def _check_open(breaker: CircuitBreaker):
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuit open for {breaker.host}")
+
+    # --- istekler ---
+
+    async def request(self, method: str, url: str, *, retries: Optional[int] = None,
+                      timeout: Optional[float] = None, **kwargs) -> httpx.Response:
+        """
+        İsteği havuzlu async istemciyle gönderir. Bağlantı hataları ve
+        RETRY_STATUSES yanıtları yeniden denenir; son yanıt (5xx dahil) döndürülür,
+        bağlantı hatası ise fırlatılır.
+        """
+        host, breaker, retries, timeout = self._prepare(method, url, retries, timeout)
+        client = self._get_async()
+        attempt = 0
+        while True:
+            self._check_open(breaker)
+            try:
+                async with self._async_limit(host):
+                    delay = self._reserve_slot(host)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    response = await client.request(method, url, timeout=timeout, **kwargs)
+            except httpx.TransportError:
+                breaker.record_failure()
+                if attempt >= retries:
+                    raise
+            else:
+                if response.status_code >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                    return response
+            await asyncio.sleep(_backoff(attempt))
+            attempt += 1
+
+    def request_sync(self, method: str, url: str, *, retries: Optional[int] = None,
+                     timeout: Optional[float] = None, **kwargs) -> httpx.Response:
+        """request'in thread'lerden (scheduler işleri, to_thread) kullanılan sync karşılığı"""
+        host, breaker, retries, timeout = self._prepare(method, url, retries, timeout)
+        client = self._get_sync()
+        attempt = 0
+        while True:
+            self._check_open(breaker)
+            try:
+                with self._sync_limit(host):
+                    delay = self._reserve_slot(host)
+                    if delay > 0:
+                        time.sleep(delay)
+                    response = client.request(method, url, timeout=timeout, **kwargs)
+            except httpx.TransportError:
+                breaker.record_failure()
+                if attempt >= retries:
+                    raise
+            else:
+                if response.status_code >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                    return response
+            time.sleep(_backoff(attempt))
+            attempt += 1
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    def get_sync(self, url: str, **kwargs) -> httpx.Response:
+        return self.request_sync("GET", url, **kwargs)
+
+    def post_sync(self, url: str, **kwargs) -> httpx.Response:
+        return self.request_sync("POST", url, **kwargs)
+
+    def stats(self) -> Dict:
+        return {
+            host: {'state': breaker.state, 'consecutive_failures': breaker.failures}
+            for host, breaker in self._breakers.items()
+        }
+
+
+# Global instance
+http_client = HttpClient()
@@ -2,7 +2,7 @@ import cloudscraper
 from bs4 import BeautifulSoup
 import datetime
 import logging
-from database import SessionLocal
+from database import BatchSessionLocal
 from models import UpcomingEvent
 import re
 
@@ -118,7 +118,7 @@ class InvestingService:
         if not events:
             return 0
         
-        db = SessionLocal()
+        db = BatchSessionLocal()
         added_count = 0
         
         try:
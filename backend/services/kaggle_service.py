@@ -4,15 +4,36 @@ Bu servis Kaggle'dan veri setini yükler ve database'e kaydeder.
 """
 
 import kagglehub
+import numpy as np
 import pandas as pd
-from database import SessionLocal
+from concurrent.futures import ProcessPoolExecutor
+from psycopg2.extras import execute_values
+from database import BatchSessionLocal, batch_engine
 from models import HistoricalEvent, MarketEventCorrelation
+from services.similarity_index import historical_event_index
+from services.correlation_store import correlation_store
 import datetime
 import logging
+import os
+from typing import Iterator
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Başlık için sırayla denenecek sütunlar
+TITLE_COLUMNS = ['Economic Data', 'Politics', 'Job report', 'OPEC', 'oil']
+# Açıklamaya eklenen sütunlar
+DESCRIPTION_COLUMNS = ['oil', 'OPEC', 'Inflation', 'Job report']
+EMPTY_TITLE_VALUES = ["", "0", "0.0", "nan", "None"]
+DEFAULT_TITLE = "Piyasa Gelişmesi"
+DEFAULT_DESCRIPTION = "Normal piyasa seyri"
+# Toplu yüklemede tek INSERT içindeki satır sayısı
+BULK_BATCH_SIZE = 5000
+# Akış halinde okumada parça büyüklüğü (satır)
+STREAM_CHUNK_SIZE = 5000
+KAGGLE_DATASET = "waelaletaiwi/egpbd-an-event-based-gold-price-benchmark-dataset"
+KAGGLE_FILE_NAME = "Gold Dataset (Integrated).xlsx"
+
 
 def load_kaggle_dataset():
     """
@@ -23,13 +44,19 @@ def load_kaggle_dataset():
         logger.info("Kaggle dataset indiriliyor...")
         
         # Dataset yolunu al
-        path = kagglehub.dataset_download("waelaletaiwi/egpbd-an-event-based-gold-price-benchmark-dataset")
-        file_path = f"{path}/Gold Dataset (Integrated).xlsx"
+        file_path = download_kaggle_dataset()
         
         logger.info(f"Dataset indirildi: {file_path}")
         
-        # Excel'i oku (Openpyxl gerekebilir)
-        df = pd.read_excel(file_path)
+        # Daha önce dönüştürülmüş kopya varsa Excel'i hiç parse etme
+        cache_path = dataset_cache_path(file_path)
+        if _is_cache_fresh(file_path, cache_path):
+            df = pd.read_parquet(cache_path)
+        else:
+            # Excel'i oku (Openpyxl gerekebilir)
+            df = pd.read_excel(file_path)
+        # Önbellekten ya da Excel'den gelsin, aynı tiplerle döner
+        df = _normalize_chunk(df)
         
         logger.info(f"Dataset yüklendi. Toplam {len(df)} kayıt bulundu.")
         logger.info(f"Sütunlar: {df.columns.tolist()}")
@@ -41,7 +68,198 @@ def load_kaggle_dataset():
         return None
 
 
-def parse_and_store_dataset(df: pd.DataFrame):
+def download_kaggle_dataset() -> str:
+    """Dataset'i kagglehub önbelleğine indirir ve Excel dosyasının yolunu döndürür"""
+    path = kagglehub.dataset_download(KAGGLE_DATASET)
+    return os.path.join(path, KAGGLE_FILE_NAME)
+
+
+def dataset_cache_path(file_path: str) -> str:
+    """Kaynak dosyanın yanında tutulan sütunsal (Parquet) kopyanın yolu"""
+    return os.path.splitext(file_path)[0] + ".parquet"
+
+
+def _is_cache_fresh(file_path: str, cache_path: str) -> bool:
+    return (
+        os.path.exists(cache_path)
+        and (not os.path.exists(file_path) or os.path.getmtime(cache_path) >= os.path.getmtime(file_path))
+    )
+
+
+def _iter_excel_chunks(file_path: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """openpyxl read-only modunda satırları sabit büyüklükte parçalar halinde okur"""
+    from openpyxl import load_workbook
+    
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(name) if name is not None else f"Unnamed: {i}" for i, name in enumerate(header)]
+        
+        buffer = []
+        for row in rows:
+            buffer.append(row)
+            if len(buffer) >= chunk_size:
+                yield pd.DataFrame(buffer, columns=columns)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=columns)
+    finally:
+        workbook.close()
+
+
+def _iter_parquet_chunks(cache_path: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+    import pyarrow.parquet as pq
+    
+    parquet_file = pq.ParquetFile(cache_path)
+    for batch in parquet_file.iter_batches(batch_size=chunk_size):
+        yield _normalize_chunk(batch.to_pandas())
+
+
+# Parquet'ten okunan metin sütunlarının tipi (pandas 3: StringDtype, öncesi: object)
+_TEXT_DTYPE = pd.Series(["", None]).dtype
+
+
+def _normalize_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Parçalar arasında şema sabit kalsın diye sütunları float/tarih/metin olarak sabitler"""
+    normalized = {}
+    for col in chunk.columns:
+        values = chunk[col]
+        if pd.api.types.is_bool_dtype(values) or pd.api.types.is_numeric_dtype(values):
+            normalized[col] = values.astype('float64')
+        elif pd.api.types.is_datetime64_any_dtype(values):
+            # Excel ve Parquet okumaları farklı çözünürlük döndürebilir
+            normalized[col] = values.dt.as_unit('ns')
+        elif pd.api.types.is_string_dtype(values) and values.dtype != object:
+            # Zaten metin (pandas 3 StringDtype): eleman eleman dönüştürmeye gerek yok
+            normalized[col] = values.astype(_TEXT_DTYPE)
+        else:
+            normalized[col] = values.map(
+                lambda v: None if v is None or (isinstance(v, float) and np.isnan(v)) else str(v)
+            ).astype(_TEXT_DTYPE)
+    return pd.DataFrame(normalized, index=chunk.index)
+
+
+class _ParquetCacheWriter:
+    """
+    Akış sırasında gelen (normalize edilmiş) parçaları geçici bir Parquet dosyasına yazar,
+    tamamlanınca asıl yola taşır. Şema uyuşmazlığında önbelleklemeyi bırakır.
+    """
+    
+    def __init__(self, cache_path: str):
+        self.cache_path = cache_path
+        self.tmp_path = cache_path + ".tmp"
+        self.writer = None
+        self.schema = None
+        self.failed = False
+    
+    def write(self, chunk: pd.DataFrame):
+        if self.failed:
+            return
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            
+            if self.writer is None:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                # İlk parçada tamamen boş olan sütunlar metin kabul edilir
+                self.schema = pa.schema([
+                    pa.field(f.name, pa.string()) if pa.types.is_null(f.type) else f
+                    for f in table.schema
+                ])
+                table = table.cast(self.schema)
+                self.writer = pq.ParquetWriter(self.tmp_path, self.schema)
+            else:
+                for field in self.schema:
+                    # Önceki parçalarda metin olan sütun burada sayı/tarih gelmiş olabilir
+                    if pa.types.is_string(field.type) and not pd.api.types.is_string_dtype(chunk[field.name]):
+                        chunk = chunk.copy()
+                        chunk[field.name] = _normalize_chunk(chunk[[field.name]].astype(object))[field.name]
+                table = pa.Table.from_pandas(chunk, schema=self.schema, preserve_index=False)
+            self.writer.write_table(table)
+        except Exception as e:
+            logger.warning(f"Sütunsal önbellek yazılamadı, önbelleksiz devam ediliyor: {str(e)}")
+            self.abort()
+    
+    def close(self):
+        if self.failed or self.writer is None:
+            return
+        self.writer.close()
+        os.replace(self.tmp_path, self.cache_path)
+        logger.info(f"Sütunsal önbellek oluşturuldu: {self.cache_path}")
+    
+    def abort(self):
+        self.failed = True
+        if self.writer is not None:
+            try:
+                self.writer.close()
+            except Exception:
+                pass
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+def iter_dataset_chunks(file_path: str, chunk_size: int = STREAM_CHUNK_SIZE, use_cache: bool = True) -> Iterator[pd.DataFrame]:
+    """
+    Veri setini (xlsx veya csv) sabit büyüklükte DataFrame parçaları halinde döndürür.
+    İlk okumada dosyanın yanına Parquet kopyası yazılır; sonraki okumalar
+    Excel'i parse etmeden doğrudan bu kopyadan akar. Bellek kullanımı parça
+    büyüklüğüyle sınırlıdır.
+    """
+    cache_path = dataset_cache_path(file_path)
+    if use_cache and _is_cache_fresh(file_path, cache_path):
+        logger.info(f"Sütunsal önbellekten okunuyor: {cache_path}")
+        yield from _iter_parquet_chunks(cache_path, chunk_size)
+        return
+    
+    if file_path.lower().endswith(".csv"):
+        chunks = pd.read_csv(file_path, chunksize=chunk_size)
+    else:
+        chunks = _iter_excel_chunks(file_path, chunk_size)
+    
+    cache_writer = _ParquetCacheWriter(cache_path) if use_cache else None
+    completed = False
+    try:
+        for chunk in chunks:
+            # Önbellekli ve önbelleksiz okumalar aynı tipleri görsün
+            chunk = _normalize_chunk(chunk)
+            if cache_writer:
+                cache_writer.write(chunk)
+            yield chunk
+        completed = True
+    finally:
+        if cache_writer:
+            if completed:
+                cache_writer.close()
+            else:
+                cache_writer.abort()
+
+
+def stream_and_store_dataset(file_path: str = None, chunk_size: int = STREAM_CHUNK_SIZE,
+                             source: str = "kaggle_egpbd", batch_size: int = BULK_BATCH_SIZE) -> int:
+    """
+    Veri setini tamamını belleğe almadan parça parça okuyup toplu yükleme yoluyla kaydeder
+    """
+    if file_path is None:
+        file_path = download_kaggle_dataset()
+    
+    stored_count = 0
+    try:
+        for chunk in iter_dataset_chunks(file_path, chunk_size):
+            stored_count += _store_frame_part(chunk, source, batch_size)
+            logger.info(f"{stored_count} kayıt işlendi...")
+    except Exception as e:
+        logger.error(f"Akış halinde kayıt hatası: {str(e)}")
+    
+    historical_event_index.invalidate()
+    correlation_store.invalidate()
+    logger.info(f"Toplam {stored_count} kayıt database'e kaydedildi.")
+    return stored_count
+
+
+def parse_and_store_dataset(df: pd.DataFrame, source: str = "kaggle_egpbd"):
     """
     Pandas DataFrame'i parse edip database'e kaydeder.
     """
@@ -49,7 +267,7 @@ def parse_and_store_dataset(df: pd.DataFrame):
         logger.error("DataFrame boş, işlem yapılamıyor.")
         return 0
     
-    db = SessionLocal()
+    db = BatchSessionLocal()
     stored_count = 0
     
     try:
@@ -85,7 +303,7 @@ def parse_and_store_dataset(df: pd.DataFrame):
                     event_date=event_date,
                     category="ekonomik",
                     impact_score=5.0,
-                    source="kaggle_egpbd"
+                    source=source
                 )
                 
                 db.add(event)
@@ -118,6 +336,8 @@ def parse_and_store_dataset(df: pd.DataFrame):
                 continue
         
         db.commit()
+        historical_event_index.invalidate()
+        correlation_store.invalidate()
         logger.info(f"Toplam {stored_count} kayıt database'e kaydedildi.")
         
     except Exception as e:
@@ -129,6 +349,200 @@ def parse_and_store_dataset(df: pd.DataFrame):
     return stored_count
 
 
+def prepare_events_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    parse_and_store_dataset'teki satır satır dönüşümün sütun bazlı (vektörel) karşılığı.
+    Başlık seçimi, açıklama, tarih ve yüzde değişim tüm DataFrame için bir kerede hesaplanır.
+    """
+    index = df.index
+    
+    # Başlık: ilk anlamlı aday sütun, yoksa varsayılan
+    title = pd.Series(DEFAULT_TITLE, index=index, dtype=object)
+    for col in reversed(TITLE_COLUMNS):
+        if col not in df.columns:
+            continue
+        cleaned = df[col].astype(str).str.strip()
+        valid = df[col].notna() & ~cleaned.isin(EMPTY_TITLE_VALUES)
+        title = cleaned.where(valid, title)
+    
+    # Açıklama: dolu sütunlar "kolon: değer" şeklinde virgülle birleştirilir
+    description = pd.Series("", index=index, dtype=object)
+    for col in DESCRIPTION_COLUMNS:
+        if col not in df.columns:
+            continue
+        text = df[col].astype(str)
+        valid = df[col].notna() & (text.str.strip() != "")
+        part = (col + ": " + text).where(valid, "")
+        separator = np.where((description != "") & (part != ""), ", ", "")
+        description = description + separator + part
+    description = description.where(description != "", DEFAULT_DESCRIPTION)
+    
+    # Tarih: datetime veya metin değerler parse edilir, kalanlar şimdiki zaman
+    now = pd.Timestamp(datetime.datetime.now())
+    if 'Date' in df.columns:
+        dates = df['Date']
+        if not pd.api.types.is_datetime64_any_dtype(dates):
+            parseable = dates.map(lambda v: isinstance(v, (str, datetime.datetime)))
+            dates = pd.to_datetime(dates.where(parseable), errors='coerce', format='mixed')
+        event_date = dates.fillna(now)
+    else:
+        event_date = pd.Series(now, index=index)
+    
+    # Korelasyon: önceki ve sonraki haftanın altın fiyatı
+    price_before = pd.to_numeric(df.get('Gold Price', pd.Series(np.nan, index=index)), errors='coerce')
+    price_after = pd.to_numeric(df.get('Next week gold price', pd.Series(np.nan, index=index)), errors='coerce')
+    has_correlation = price_before.notna() & price_after.notna() & (price_before > 0)
+    percent_change = ((price_after - price_before) / price_before * 100).where(has_correlation, 0.0)
+    
+    return pd.DataFrame({
+        'title': title,
+        'description': description,
+        'event_date': event_date,
+        'price_before': price_before,
+        'price_after': price_after,
+        'percent_change': percent_change,
+        'has_correlation': has_correlation
+    }, index=index)
+
+
+def _init_bulk_worker():
+    """Fork sonrası ebeveynden gelen bağlantıları kullanma"""
+    batch_engine.dispose(close=False)
+
+
+def _store_prepared_frame(frame: pd.DataFrame, source: str, batch_size: int) -> int:
+    """
+    Hazırlanmış çerçeveyi execute_values ile toplu olarak yazar.
+    Olaylar INSERT ... RETURNING id ile eklenir, dönen id'ler korelasyonlara bağlanır.
+    """
+    if frame.empty:
+        return 0
+    
+    created_at = datetime.datetime.utcnow()
+    conn = batch_engine.raw_connection()
+    stored = 0
+    try:
+        cursor = conn.cursor()
+        for start in range(0, len(frame), batch_size):
+            batch = frame.iloc[start:start + batch_size]
+            
+            event_rows = list(zip(
+                batch['title'].tolist(),
+                batch['description'].tolist(),
+                batch['event_date'].dt.to_pydatetime().tolist(),
+                ["ekonomik"] * len(batch),
+                [5.0] * len(batch),
+                [source] * len(batch),
+                [created_at] * len(batch)
+            ))
+            returned = execute_values(
+                cursor,
+                "INSERT INTO historical_events "
+                "(title, description, event_date, category, impact_score, source, created_at) "
+                "VALUES %s RETURNING id",
+                event_rows,
+                page_size=batch_size,
+                fetch=True
+            )
+            event_ids = np.array([row[0] for row in returned], dtype=np.int64)
+            
+            mask = batch['has_correlation'].to_numpy()
+            if mask.any():
+                corr = batch[mask]
+                correlation_rows = list(zip(
+                    event_ids[mask].tolist(),
+                    ["GOLD"] * len(corr),
+                    corr['price_before'].astype(float).tolist(),
+                    corr['price_after'].astype(float).tolist(),
+                    corr['percent_change'].astype(float).tolist(),
+                    [0.8] * len(corr),
+                    [7] * len(corr),
+                    [created_at] * len(corr)
+                ))
+                execute_values(
+                    cursor,
+                    "INSERT INTO market_event_correlations "
+                    "(event_id, symbol, price_before, price_after, percent_change, "
+                    "correlation_strength, days_after, created_at) VALUES %s",
+                    correlation_rows,
+                    page_size=batch_size
+                )
+            
+            conn.commit()
+            stored += len(batch)
+        cursor.close()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    
+    return stored
+
+
+def _store_frame_part(df: pd.DataFrame, source: str, batch_size: int) -> int:
+    return _store_prepared_frame(prepare_events_frame(df), source, batch_size)
+
+
+def bulk_store_dataset(df: pd.DataFrame, source: str = "kaggle_egpbd",
+                       batch_size: int = BULK_BATCH_SIZE, workers: int = 1) -> int:
+    """
+    parse_and_store_dataset'in toplu yükleme karşılığı.
+    workers > 1 ise DataFrame parçalara bölünüp ayrı süreçlerde yazılır.
+    """
+    if df is None or df.empty:
+        logger.error("DataFrame boş, işlem yapılamıyor.")
+        return 0
+    
+    stored_count = 0
+    try:
+        if workers <= 1:
+            stored_count = _store_frame_part(df, source, batch_size)
+        else:
+            # np.array_split pandas 3'te DataFrame yerine ndarray döndürür; iloc ile böl
+            chunk = -(-len(df) // workers)
+            parts = [df.iloc[start:start + chunk] for start in range(0, len(df), chunk)]
+            with ProcessPoolExecutor(max_workers=len(parts), initializer=_init_bulk_worker) as pool:
+                futures = [pool.submit(_store_frame_part, part, source, batch_size) for part in parts]
+                error = None
+                for future in futures:
+                    try:
+                        stored_count += future.result()
+                    except Exception as e:
+                        error = error or e
+                if error is not None:
+                    raise error
+    except Exception as e:
+        # Bazı parçalar commit edilmiş olabilir: sayıyı bildir ve hatayı yukarı ilet
+        logger.error(f"Toplu kayıt hatası ({stored_count} kayıt commit edildi): {str(e)}")
+        raise
+    finally:
+        historical_event_index.invalidate()
+        correlation_store.invalidate()
+    
+    logger.info(f"Toplam {stored_count} kayıt toplu olarak database'e kaydedildi.")
+    return stored_count
+
+
+def delete_dataset_source(source: str) -> int:
+    """Belirli bir kaynaktan gelen olayları ve korelasyonlarını siler"""
+    db = BatchSessionLocal()
+    try:
+        event_ids = db.query(HistoricalEvent.id).filter(HistoricalEvent.source == source)
+        db.query(MarketEventCorrelation).filter(
+            MarketEventCorrelation.event_id.in_(event_ids.scalar_subquery())
+        ).delete(synchronize_session=False)
+        deleted = db.query(HistoricalEvent).filter(
+            HistoricalEvent.source == source
+        ).delete(synchronize_session=False)
+        db.commit()
+        historical_event_index.invalidate()
+        correlation_store.invalidate()
+        return deleted
+    finally:
+        db.close()
+
+
 def parse_date(date_value):
     """Farklı tarih formatlarını parse et"""
     if isinstance(date_value, datetime.datetime):
@@ -154,7 +568,5 @@ def calculate_percent_change(before, after):
 
 
 if __name__ == "__main__":
-    df = load_kaggle_dataset()
-    if df is not None:
-        stored = parse_and_store_dataset(df)
-        print(f"Bitti: {stored} kayıt.")
+    stored = stream_and_store_dataset()
+    print(f"Bitti: {stored} kayıt.")
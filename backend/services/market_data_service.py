@@ -0,0 +1,235 @@
+"""
+Market Data Service - Canlı piyasa verilerinin yfinance üzerinden çekilmesi
+ve toplu olarak yazılması.
+Tüm semboller tek bir yf.download çağrısında toplanır; eksik kalanlar
+sınırlı bir thread havuzunda sembol başına zaman aşımıyla tekrar denenir.
+Tüm engelleyici çağrılar event loop dışında çalışır.
+Yazma tarafında current_market_rates için INSERT ... ON CONFLICT DO UPDATE,
+market_data için çok satırlı INSERT kullanılır; N sembollük bir tick sabit
+sayıda round-trip ile yazılır.
+"""
+
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+import yfinance as yf
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from models import CurrentMarketRate, MarketData
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Format: "UYGULAMA_SEMBOLÜ:YFINANCE_SEMBOLÜ:Görünen Ad" virgülle ayrılmış
+DEFAULT_MARKET_SYMBOLS = "USDTRY:USDTRY=X:Dolar/TL,GOLD:GC=F:Altın (Ons/USD)"
+# market_data tablosunda farklı adla tutulan semboller
+HISTORY_SYMBOL_ALIASES = {"GOLD": "XAUUSD"}
+
+BATCH_TIMEOUT = float(os.getenv("MARKET_FETCH_TIMEOUT", "20"))
+SYMBOL_TIMEOUT = float(os.getenv("MARKET_SYMBOL_TIMEOUT", "10"))
+MAX_FETCH_WORKERS = int(os.getenv("MARKET_FETCH_WORKERS", "8"))
+# Tek INSERT içindeki en fazla satır (backfill'ler için)
+WRITE_BATCH_SIZE = 5000
+
+_executor = ThreadPoolExecutor(max_workers=MAX_FETCH_WORKERS, thread_name_prefix="market-fetch")
+
+
+def parse_symbol_universe(spec: str) -> Dict[str, Dict]:
+    """
+    "USDTRY:USDTRY=X:Dolar/TL,..." biçimindeki tanımı sözlüğe çevirir.
+    Ad verilmezse uygulama sembolü ad olarak kullanılır.
+    """
+    universe = {}
+    for entry in spec.split(","):
+        parts = [p.strip() for p in entry.split(":", 2)]
+        if len(parts) < 2 or not parts[0] or not parts[1]:
+            continue
+        app_symbol, yf_symbol = parts[0], parts[1]
+        universe[app_symbol] = {
+            'yf_symbol': yf_symbol,
+            'name': parts[2] if len(parts) > 2 and parts[2] else app_symbol,
+            'history_symbol': HISTORY_SYMBOL_ALIASES.get(app_symbol, app_symbol)
+        }
+    return universe
+
+
+SYMBOL_UNIVERSE = parse_symbol_universe(os.getenv("MARKET_SYMBOLS") or DEFAULT_MARKET_SYMBOLS)
+
+
+def _last_two_closes(closes: pd.Series) -> Optional[Tuple[float, float]]:
+    closes = closes.dropna()
+    if closes.empty:
+        return None
+    current_price = float(closes.iloc[-1])
+    previous_close = float(closes.iloc[-2]) if len(closes) > 1 else current_price
+    return current_price, previous_close
+
+
+def _download_batch(yf_symbols: List[str]) -> Dict[str, Tuple[float, float]]:
+    """Tüm semboller için son iki günün kapanışını tek istekte çeker"""
+    data = yf.download(
+        yf_symbols, period="2d", group_by="ticker", threads=True,
+        progress=False, auto_adjust=False, timeout=SYMBOL_TIMEOUT
+    )
+    if data is None or data.empty:
+        return {}
+
+    result = {}
+    for yf_symbol in yf_symbols:
+        try:
+            if isinstance(data.columns, pd.MultiIndex):
+                if yf_symbol in data.columns.get_level_values(0):
+                    closes = data[yf_symbol]['Close']
+                else:
+                    closes = data['Close'][yf_symbol]
+            else:
+                closes = data['Close']
+        except KeyError:
+            continue
+        closes_pair = _last_two_closes(closes)
+        if closes_pair:
+            result[yf_symbol] = closes_pair
+    return result
+
+
+def _fetch_single(yf_symbol: str) -> Optional[Tuple[float, float]]:
+    data = yf.Ticker(yf_symbol).history(period="2d", timeout=SYMBOL_TIMEOUT)
+    if data.empty:
+        return None
+    return _last_two_closes(data['Close'])
+
+
+async def _fetch_missing(yf_symbols: List[str]) -> Dict[str, Tuple[float, float]]:
+    """Toplu istekte gelmeyen sembolleri thread havuzunda paralel ve zaman aşımlı çeker"""
+    loop = asyncio.get_running_loop()
+
+    async def fetch(yf_symbol):
+        return await asyncio.wait_for(loop.run_in_executor(_executor, _fetch_single, yf_symbol), SYMBOL_TIMEOUT)
+
+    results = await asyncio.gather(*(fetch(s) for s in yf_symbols), return_exceptions=True)
+
+    fetched = {}
+    for yf_symbol, result in zip(yf_symbols, results):
+        if isinstance(result, Exception):
+            logger.error(f"Error updating {yf_symbol}: {result!r}")
+        elif result:
+            fetched[yf_symbol] = result
+    return fetched
+
+
+async def fetch_quotes(universe: Dict[str, Dict] = None) -> List[Dict]:
+    """
+    Sembol evrenindeki tüm semboller için güncel fiyat ve günlük değişimi döndürür.
+    """
+    if universe is None:
+        universe = SYMBOL_UNIVERSE
+    yf_symbols = [info['yf_symbol'] for info in universe.values()]
+    if not yf_symbols:
+        return []
+
+    loop = asyncio.get_running_loop()
+    try:
+        closes = await asyncio.wait_for(
+            loop.run_in_executor(_executor, _download_batch, yf_symbols), BATCH_TIMEOUT
+        )
+    except Exception as e:
+        logger.error(f"Toplu piyasa verisi çekme hatası: {e!r}")
+        closes = {}
+
+    missing = [s for s in yf_symbols if s not in closes]
+    if missing:
+        closes.update(await _fetch_missing(missing))
+
+    quotes = []
+    for app_symbol, info in universe.items():
+        pair = closes.get(info['yf_symbol'])
+        if not pair:
+            continue
+        current_price, previous_close = pair
+        daily_change = current_price - previous_close
+        quotes.append({
+            'symbol': app_symbol,
+            'history_symbol': info['history_symbol'],
+            'name': info['name'],
+            'price': current_price,
+            'previous_close': previous_close,
+            'daily_change': daily_change,
+            'daily_change_percent': (daily_change / previous_close) * 100 if previous_close > 0 else 0
+        })
+    return quotes
+
+
+def _dedupe(rows: List[Dict], key_fields: Tuple[str, ...]) -> List[Dict]:
+    """
+    Aynı anahtar tek ifadede iki kez geçerse ON CONFLICT DO UPDATE hata verir;
+    her anahtar için son satırı tut
+    """
+    unique = {}
+    for row in rows:
+        unique[tuple(row[f] for f in key_fields)] = row
+    return list(unique.values())
+
+
+def upsert_current_rates(db: Session, rates: List[Dict]) -> int:
+    """
+    current_market_rates satırlarını tek ifadede ekler/günceller.
+    Mevcut satırlarda görünen ad korunur, fiyat alanları güncellenir.
+    """
+    rates = _dedupe(rates, ('symbol',))
+    if not rates:
+        return 0
+
+    stmt = insert(CurrentMarketRate).values(rates)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CurrentMarketRate.symbol],
+        set_={
+            'price': stmt.excluded.price,
+            'daily_change': stmt.excluded.daily_change,
+            'daily_change_percent': stmt.excluded.daily_change_percent,
+            'previous_close': stmt.excluded.previous_close,
+            'last_updated': stmt.excluded.last_updated
+        }
+    )
+    db.execute(stmt)
+    return len(rates)
+
+
+def insert_market_data(db: Session, rows: List[Dict], batch_size: int = WRITE_BATCH_SIZE) -> int:
+    """
+    market_data satırlarını çok satırlı INSERT ile yazar.
+    Aynı (time, symbol) tekrar gelirse hata yerine son değer yazılır.
+    """
+    rows = _dedupe(rows, ('time', 'symbol'))
+    for start in range(0, len(rows), batch_size):
+        stmt = insert(MarketData).values(rows[start:start + batch_size])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[MarketData.time, MarketData.symbol],
+            set_={'price': stmt.excluded.price, 'volume': stmt.excluded.volume}
+        )
+        db.execute(stmt)
+    return len(rows)
+
+
+def store_quotes(db: Session, quotes: List[Dict], now) -> None:
+    """fetch_quotes çıktısını geçmiş ve güncel kur tablolarına yazar (commit çağırana ait)"""
+    insert_market_data(db, [
+        {'time': now, 'symbol': q['history_symbol'], 'price': float(q['price']), 'volume': 0}
+        for q in quotes
+    ])
+    upsert_current_rates(db, [
+        {
+            'symbol': q['symbol'],
+            'name': q['name'],
+            'price': float(q['price']),
+            'daily_change': float(q['daily_change']),
+            'daily_change_percent': float(q['daily_change_percent']),
+            'previous_close': float(q['previous_close']),
+            'last_updated': now
+        }
+        for q in quotes
+    ])
@@ -3,7 +3,7 @@ NewsAPI Service - Güncel ekonomi ve finans haberlerini çeker
 """
 
 from newsapi import NewsApiClient
-from database import SessionLocal
+from database import BatchSessionLocal
 from models import CurrentEvent
 import datetime
 import logging
@@ -86,7 +86,7 @@ class NewsService:
         """
         Haberleri database'e kaydeder
         """
-        db = SessionLocal()
+        db = BatchSessionLocal()
         stored_count = 0
         
         try:
@@ -1,62 +1,239 @@
-from typing import Dict, List
+"""
+Notification Service - Kullanıcı bildirimleri için Redis stream tabanlı kuyruk
+Her kullanıcının bildirimleri kendi stream'inde (en fazla NOTIFICATION_MAXLEN
+kayıt, NOTIFICATION_TTL sonra silinir) tutulur. Teslim edilen son kaydın id'si
+ayrı bir cursor anahtarında saklanır; okuma ve cursor ilerletme tek bir Lua
+script'iyle atomik yapılır, böylece birden fazla worker aynı bildirimi iki kez
+teslim etmez ve okuma maliyeti sadece yeni bildirim sayısı kadardır.
+Yeni bildirim ayrıca kullanıcının pub/sub kanalına haber verilir; açık SSE
+bağlantıları stream'den kaldıkları id'den itibaren okuyup anında iletir.
+"""
+
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 from datetime import datetime
+from redis_client import redis_client, async_redis_client
+from services.broadcast_service import broadcaster, sse_event, dumps, HEARTBEAT_INTERVAL
+import asyncio
+import json
+import re
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
-# In-memory bildirim deposu (gerçek uygulamada WebSocket veya Redis kullanılmalı)
-pending_notifications = {}
+# Kullanıcı başına tutulacak en fazla bildirim
+NOTIFICATION_MAXLEN = int(os.getenv("NOTIFICATION_MAXLEN", "50"))
+# Bildirimler ve cursor bu süre sonra silinir (saniye)
+NOTIFICATION_TTL = int(os.getenv("NOTIFICATION_TTL", str(24 * 60 * 60)))
+# Tek seferde teslim edilecek en fazla bildirim
+FETCH_LIMIT = 100
+# clear_old_notifications sonrası kalan bildirim sayısı
+KEEP_RECENT = 10
+# Alarm tetiklenme kaydı kalkıştan bu kadar sonra silinir (saniye)
+ALARM_FIRED_GRACE = 60 * 60
+
+_ENTRY_ID = re.compile(r"^\d+-\d+$")
+
+# KEYS[1]: stream, KEYS[2]: cursor; ARGV[1]: limit, ARGV[2]: TTL
+# Cursor'dan sonraki kayıtları okur ve cursor'ı son okunan id'ye taşır
+_FETCH_AND_ACK = """
+local cursor = redis.call('GET', KEYS[2]) or '0-0'
+local entries = redis.call('XRANGE', KEYS[1], '(' .. cursor, '+', 'COUNT', ARGV[1])
+if #entries > 0 then
+    redis.call('SET', KEYS[2], entries[#entries][1], 'EX', ARGV[2])
+end
+return entries
+"""
+
+# KEYS[1]: cursor; ARGV[1]: teslim edilen id, ARGV[2]: TTL
+# Cursor'ı sadece ileri taşır (aynı kullanıcının birden fazla bağlantısı olabilir)
+_ADVANCE_CURSOR = """
+local current = redis.call('GET', KEYS[1])
+if current then
+    local cm, cs = string.match(current, '(%d+)-(%d+)')
+    local nm, ns = string.match(ARGV[1], '(%d+)-(%d+)')
+    cm, cs, nm, ns = tonumber(cm), tonumber(cs), tonumber(nm), tonumber(ns)
+    if nm < cm or (nm == cm and ns <= cs) then
+        return 0
+    end
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return 1
+"""
+
+# KEYS[1]: alarm tetiklenme kaydı, KEYS[2]: stream; ARGV[1]: kayıt TTL, ARGV[2]: bildirim,
+# ARGV[3]: stream uzunluğu, ARGV[4]: stream TTL, ARGV[5]: canlı kanal
+# Kayıt yoksa bildirimi ekler ve kaydı yazar. Script atomik çalışır; kayıt
+# XADD başarılı olduktan sonra yazıldığı için ekleme hata verirse kayıt kalmaz
+_CLAIM_AND_ADD = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return false
+end
+local entry_id = redis.call('XADD', KEYS[2], 'MAXLEN', ARGV[3], '*', 'data', ARGV[2])
+redis.call('SET', KEYS[1], 1, 'EX', ARGV[1])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+redis.call('PUBLISH', ARGV[5], 'new')
+return entry_id
+"""
+
+_fetch_and_ack = redis_client.register_script(_FETCH_AND_ACK)
+_claim_and_add = redis_client.register_script(_CLAIM_AND_ADD)
+_fetch_and_ack_async = async_redis_client.register_script(_FETCH_AND_ACK)
+_advance_cursor_async = async_redis_client.register_script(_ADVANCE_CURSOR)
+
+
+def _stream_key(user_id: int) -> str:
+    return f"notifications:{user_id}"
+
+
+def _cursor_key(user_id: int) -> str:
+    return f"notifications:{user_id}:cursor"
+
+
+def live_channel(user_id: int) -> str:
+    """Yeni bildirim geldiğinde açık bağlantılara haber verilen pub/sub kanalı"""
+    return f"notifications:{user_id}:live"
+
+
+def decode_entry(entry_id: str, fields: Dict) -> Dict:
+    return {**json.loads(fields['data']), 'id': entry_id}
+
+
+def _decode_entries(entries) -> List[Dict]:
+    # Lua'dan gelen alanlar [k1, v1, k2, v2, ...] listesi halindedir
+    return [decode_entry(entry_id, dict(zip(fields[::2], fields[1::2]))) for entry_id, fields in entries]
 
-def add_pending_notification(user_id: int, notification_data: Dict):
-    """Bekleyen bildirim ekle"""
-    if user_id not in pending_notifications:
-        pending_notifications[user_id] = []
-    
-    pending_notifications[user_id].append({
+
+def _payload(notification_data: Dict) -> str:
+    return json.dumps({
         **notification_data,
-        'timestamp': datetime.now(),
-        'sent': False
-    })
-    
+        'timestamp': datetime.now().isoformat()
+    }, ensure_ascii=False, default=str)
+
+def add_pending_notification(user_id: int, notification_data: Dict) -> str:
+    """Bekleyen bildirim ekle; stream id'sini döndürür"""
+    payload = _payload(notification_data)
+
+    key = _stream_key(user_id)
+    pipe = redis_client.pipeline()
+    pipe.xadd(key, {'data': payload}, maxlen=NOTIFICATION_MAXLEN, approximate=False)
+    pipe.expire(key, NOTIFICATION_TTL)
+    # Açık SSE bağlantılarını uyandır (içerik stream'den okunur)
+    pipe.publish(live_channel(user_id), "new")
+    entry_id = pipe.execute()[0]
+
     logger.info(f"Notification added for user {user_id}: {notification_data}")
+    return entry_id
 
 def get_pending_notifications(user_id: int) -> List[Dict]:
-    """Kullanıcının bekleyen bildirimlerini getir"""
-    if user_id not in pending_notifications:
+    """Kullanıcının bekleyen bildirimlerini getir ve teslim edildi olarak işaretle"""
+    try:
+        entries = _fetch_and_ack(
+            keys=[_stream_key(user_id), _cursor_key(user_id)],
+            args=[FETCH_LIMIT, NOTIFICATION_TTL]
+        )
+    except Exception as e:
+        logger.error(f"Bildirimler okunamadı (user {user_id}): {e!r}")
         return []
-    
-    # Sadece gönderilmemiş bildirimleri döndür
-    unsent = [n for n in pending_notifications[user_id] if not n.get('sent', False)]
-    
-    # Gönderilmiş olarak işaretle
-    for notification in unsent:
-        notification['sent'] = True
-    
-    return unsent
+    return _decode_entries(entries)
+
+async def get_pending_notifications_async(user_id: int) -> List[Dict]:
+    """get_pending_notifications'ın event loop'u bloklamayan sürümü"""
+    try:
+        entries = await _fetch_and_ack_async(
+            keys=[_stream_key(user_id), _cursor_key(user_id)],
+            args=[FETCH_LIMIT, NOTIFICATION_TTL]
+        )
+    except Exception as e:
+        logger.error(f"Bildirimler okunamadı (user {user_id}): {e!r}")
+        return []
+    return _decode_entries(entries)
+
+async def read_notifications_after(user_id: int, last_id: str, limit: int = FETCH_LIMIT) -> List[Dict]:
+    """Verilen id'den sonraki bildirimleri cursor'a dokunmadan okur"""
+    entries = await async_redis_client.xrange(_stream_key(user_id), min=f"({last_id}", max="+", count=limit)
+    return [decode_entry(entry_id, fields) for entry_id, fields in entries]
+
+async def mark_delivered(user_id: int, entry_id: str):
+    """Polling'e dönülürse aynı bildirim tekrar gelmesin diye cursor'ı ilerletir"""
+    await _advance_cursor_async(keys=[_cursor_key(user_id)], args=[entry_id, NOTIFICATION_TTL])
+
+async def notification_stream(user_id: int, last_event_id: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Kullanıcının bildirimlerini SSE olarak akıtır. Her olay stream id'siyle
+    gönderilir; tarayıcı yeniden bağlanırken Last-Event-ID ile kaldığı yerden devam eder.
+    İlk bağlantıda henüz teslim edilmemiş bildirimlerle başlar.
+    """
+    channel = live_channel(user_id)
+    # Önce abone ol, sonra geçmişi oku: aradaki bildirim kaçmaz
+    queue = await broadcaster.subscribe(channel)
+    try:
+        if last_event_id and not _ENTRY_ID.match(last_event_id):
+            last_event_id = None
+        last_id = last_event_id or await async_redis_client.get(_cursor_key(user_id)) or "0-0"
+        yield sse_event(dumps({'type': 'connected'}), event='status')
+        while True:
+            notifications = await read_notifications_after(user_id, last_id)
+            for notification in notifications:
+                yield sse_event(dumps(notification), event_id=notification['id'])
+            if notifications:
+                last_id = notifications[-1]['id']
+                await mark_delivered(user_id, last_id)
+                if len(notifications) == FETCH_LIMIT:
+                    continue
+
+            try:
+                await asyncio.wait_for(queue.get(), HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield ": heartbeat\n\n"
+    finally:
+        await broadcaster.unsubscribe(channel, queue)
 
 def clear_old_notifications(user_id: int):
     """Eski bildirimleri temizle"""
-    if user_id in pending_notifications:
-        # Son 10 bildirimi tut
-        pending_notifications[user_id] = pending_notifications[user_id][-10:]
+    # Son 10 bildirimi tut
+    try:
+        redis_client.xtrim(_stream_key(user_id), maxlen=KEEP_RECENT, approximate=False)
+    except Exception as e:
+        logger.error(f"Bildirimler temizlenemedi (user {user_id}): {e!r}")
 
-def send_alarm_notification(user_id: int, alarm_data: Dict):
+def _alarm_fired_key(alarm_id: int, departure: datetime) -> str:
+    return f"alarm_fired:{alarm_id}:{departure:%Y%m%d%H%M}"
+
+def queue_alarm_notifications(notifications: List[Tuple[int, int, Dict]]) -> int:
     """
-    Kullanıcıya alarm bildirimi gönder
-    
-    Args:
-        user_id: Kullanıcı ID
-        alarm_data: {
-            'route_number': str,
-            'route_name': str,
-            'departure_location': str,
-            'next_departure': datetime,
-            'minutes_until_departure': int,
-            'travel_time_to_stop': int,
-            'can_catch_message': str
-        }
+    Alarm bildirimlerini (alarm_id, user_id, alarm_data) her kalkış için tam
+    bir kez kuyruğa ekler. Idempotency anahtarı ve stream kaydı tek Lua
+    çağrısında yazılır: anahtar ancak bildirim eklendiyse oluşur, böylece
+    ekleme hatası bildirimi diğer worker'lar için de kaybettirmez.
+    Eklenen bildirim sayısını döndürür.
     """
-    notification = {
+    if not notifications:
+        return 0
+    now = datetime.now()
+    pipe = redis_client.pipeline(transaction=False)
+    for alarm_id, user_id, alarm_data in notifications:
+        departure = alarm_data['next_departure']
+        ttl = max(int((departure - now).total_seconds()), 0) + ALARM_FIRED_GRACE
+        _claim_and_add(
+            keys=[_alarm_fired_key(alarm_id, departure), _stream_key(user_id)],
+            args=[ttl, _payload(build_alarm_notification(alarm_data)), NOTIFICATION_MAXLEN,
+                  NOTIFICATION_TTL, live_channel(user_id)],
+            client=pipe
+        )
+
+    queued = 0
+    for (alarm_id, user_id, _), result in zip(notifications, pipe.execute(raise_on_error=False)):
+        if isinstance(result, Exception):
+            logger.error(f"Alarm bildirimi kuyruğa eklenemedi (alarm {alarm_id}, user {user_id}): {result!r}")
+        elif result:
+            logger.info(f"Alarm notification added for user {user_id} (alarm {alarm_id})")
+            queued += 1
+    return queued
+
+def build_alarm_notification(alarm_data: Dict) -> Dict:
+    """Alarm bilgisinden kullanıcıya gösterilecek bildirimi oluşturur"""
+    return {
         'type': 'transport_alarm',
         'title': f"{alarm_data['route_number']} Numaralı Otobüs",
         'message': f"{alarm_data['route_number']} numaralı araç {alarm_data['departure_location']}'tan yola çıktı!",
@@ -73,7 +250,28 @@ def send_alarm_notification(user_id: int, alarm_data: Dict):
             'travel_time_to_stop': alarm_data['travel_time_to_stop']
         }
     }
-    
-    add_pending_notification(user_id, notification)
-    
+
+def send_alarm_notification(user_id: int, alarm_data: Dict):
+    """
+    Kullanıcıya alarm bildirimi gönder
+
+    Args:
+        user_id: Kullanıcı ID
+        alarm_data: {
+            'route_number': str,
+            'route_name': str,
+            'departure_location': str,
+            'next_departure': datetime,
+            'minutes_until_departure': int,
+            'travel_time_to_stop': int,
+            'can_catch_message': str
+        }
+    """
+    notification = build_alarm_notification(alarm_data)
+
+    try:
+        add_pending_notification(user_id, notification)
+    except Exception as e:
+        logger.error(f"Bildirim kuyruğa eklenemedi (user {user_id}): {e!r}")
+
     return notification
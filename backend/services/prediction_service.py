@@ -3,20 +3,29 @@ Prediction Service - Olay bazlı piyasa etkisi tahmini
 Basit korelasyon analizi kullanır
 """
 
-from database import SessionLocal
-from models import HistoricalEvent, MarketEventCorrelation, CurrentEvent
-from sqlalchemy import func
+from database import SessionLocal, BatchSessionLocal
+from models import CurrentEvent
+from services.similarity_index import historical_event_index
+from services.correlation_store import correlation_store
+from sqlalchemy import update, case
+import datetime
 import logging
+import time
 from typing import Dict, List
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Tahmin yapılan piyasalar
+ANALYSIS_SYMBOLS = ['GOLD', 'USDTRY']
+# Bekleyen olaylar bu büyüklükte parçalar halinde işlenir
+ANALYSIS_CHUNK_SIZE = 200
+
 
 class PredictionService:
     
     def __init__(self):
-        self.db = SessionLocal()
+        self.last_run_stats = {}
     
     def calculate_similarity(self, text1: str, text2: str) -> float:
         """
@@ -42,41 +51,27 @@ class PredictionService:
         """
         Geçmiş olaylar arasından en benzerlerini bulur
         """
+        return self.find_similar_events_batch([current_event], limit=limit)[0]
+    
+    def find_similar_events_batch(self, current_events: List[CurrentEvent], limit=5) -> List[List[Dict]]:
+        """
+        Birden fazla güncel olay için benzer geçmiş olayları tek seferde bulur
+        (bellek içi seyrek indeks üzerinden, bkz. similarity_index)
+        """
         try:
-            historical_events = self.db.query(HistoricalEvent).all()
-            
-            similarities = []
-            for hist_event in historical_events:
-                # Başlık ve kategori benzerliği
-                title_sim = self.calculate_similarity(current_event.title, hist_event.title)
-                
-                # Kategori eşleşmesi bonusu
-                category_bonus = 0.3 if current_event.category == hist_event.category else 0.0
-                
-                total_similarity = title_sim + category_bonus
-                
-                if total_similarity > 0.1:  # Minimum benzerlik eşiği
-                    similarities.append({
-                        'event': hist_event,
-                        'similarity': total_similarity
-                    })
-            
-            # En yüksek benzerlik skoruna göre sırala
-            similarities.sort(key=lambda x: x['similarity'], reverse=True)
-            
-            return similarities[:limit]
-            
+            return historical_event_index.search_batch(current_events, limit=limit)
         except Exception as e:
             logger.error(f"Benzer olay arama hatası: {str(e)}")
-            return []
+            return [[] for _ in current_events]
     
-    def predict_impact(self, current_event: CurrentEvent, symbol='GOLD') -> Dict:
+    def predict_impact(self, current_event: CurrentEvent, symbol='GOLD', similar_events: List[Dict] = None) -> Dict:
         """
         Bir olayın belirli bir piyasa üzerindeki etkisini tahmin eder
         """
         try:
             # Benzer geçmiş olayları bul
-            similar_events = self.find_similar_events(current_event, limit=10)
+            if similar_events is None:
+                similar_events = self.find_similar_events(current_event, limit=10)
             
             if not similar_events:
                 return {
@@ -87,69 +82,14 @@ class PredictionService:
                     'message': 'Benzer geçmiş olay bulunamadı'
                 }
             
-            # Bu olayların piyasa etkilerini topla
-            total_percent_change = 0.0
-            positive_count = 0
-            negative_count = 0
-            correlations_found = 0
-            
-            for item in similar_events:
-                event = item['event']
-                similarity = item['similarity']
-                
-                # Bu olayın market korelasyonlarını bul
-                correlations = self.db.query(MarketEventCorrelation).filter(
-                    MarketEventCorrelation.event_id == event.id,
-                    MarketEventCorrelation.symbol == symbol
-                ).all()
-                
-                for corr in correlations:
-                    # Benzerlik ağırlıklı değişim
-                    weighted_change = corr.percent_change * similarity
-                    total_percent_change += weighted_change
-                    correlations_found += 1
-                    
-                    if corr.percent_change > 0:
-                        positive_count += 1
-                    elif corr.percent_change < 0:
-                        negative_count += 1
-            
-            if correlations_found == 0:
-                return {
-                    'predicted_impact': 0.0,
-                    'confidence': 0.0,
-                    'direction': 'neutral',
-                    'similar_events_count': len(similar_events),
-                    'message': 'Benzer olaylar bulundu ancak piyasa verisi yok'
-                }
-            
-            # Ortalama değişim
-            avg_percent_change = total_percent_change / correlations_found
-            
-            # Yön belirleme
-            if positive_count > negative_count:
-                direction = 'positive'
-            elif negative_count > positive_count:
-                direction = 'negative'
-            else:
-                direction = 'neutral'
+            # Bu olayların piyasa etkilerini önceden yüklenmiş tablodan topla
+            stats = correlation_store.aggregate(
+                [item['event'].id for item in similar_events],
+                [item['similarity'] for item in similar_events],
+                [symbol]
+            )[symbol]
             
-            # Güven skoru (benzer olay sayısı ve korelasyon gücüne göre)
-            confidence = min(1.0, correlations_found / 10.0)
-            
-            # Tahmin edilen etki skoru (0-10 arası)
-            impact_score = abs(avg_percent_change) / 2.0  # Yüzde değişimi skora çevir
-            impact_score = min(10.0, max(0.0, impact_score))
-            
-            return {
-                'predicted_impact': round(impact_score, 2),
-                'confidence': round(confidence, 2),
-                'direction': direction,
-                'avg_percent_change': round(avg_percent_change, 2),
-                'similar_events_count': len(similar_events),
-                'correlations_found': correlations_found,
-                'message': f"{len(similar_events)} benzer olay, {correlations_found} piyasa korelasyonu bulundu"
-            }
+            return self._build_prediction(len(similar_events), stats)
             
         except Exception as e:
             logger.error(f"Tahmin hesaplama hatası: {str(e)}")
@@ -160,48 +100,144 @@ class PredictionService:
                 'error': str(e)
             }
     
-    def analyze_all_pending_events(self):
+    def _build_prediction(self, similar_count: int, stats: Dict) -> Dict:
+        """
+        Korelasyon özetinden (ağırlıklı toplam, sayı, yön sayıları) tahmin sonucunu üretir
+        """
+        correlations_found = stats['count']
+        
+        if correlations_found == 0:
+            return {
+                'predicted_impact': 0.0,
+                'confidence': 0.0,
+                'direction': 'neutral',
+                'similar_events_count': similar_count,
+                'message': 'Benzer olaylar bulundu ancak piyasa verisi yok'
+            }
+        
+        # Ortalama değişim
+        avg_percent_change = stats['weighted_sum'] / correlations_found
+        
+        # Yön belirleme
+        if stats['positive'] > stats['negative']:
+            direction = 'positive'
+        elif stats['negative'] > stats['positive']:
+            direction = 'negative'
+        else:
+            direction = 'neutral'
+        
+        # Güven skoru (benzer olay sayısı ve korelasyon gücüne göre)
+        confidence = min(1.0, correlations_found / 10.0)
+        
+        # Tahmin edilen etki skoru (0-10 arası)
+        impact_score = abs(avg_percent_change) / 2.0  # Yüzde değişimi skora çevir
+        impact_score = min(10.0, max(0.0, impact_score))
+        
+        return {
+            'predicted_impact': round(impact_score, 2),
+            'confidence': round(confidence, 2),
+            'direction': direction,
+            'avg_percent_change': round(avg_percent_change, 2),
+            'similar_events_count': similar_count,
+            'correlations_found': correlations_found,
+            'message': f"{similar_count} benzer olay, {correlations_found} piyasa korelasyonu bulundu"
+        }
+    
+    def analyze_all_pending_events(self, chunk_size=ANALYSIS_CHUNK_SIZE):
         """
-        Henüz analiz edilmemiş tüm güncel olayları analiz eder
+        Henüz analiz edilmemiş tüm güncel olayları parçalar halinde analiz eder.
+        Her parça için benzerlik tek seferde, tüm semboller tek geçişte hesaplanır
+        ve sonuçlar tek bir UPDATE ile yazılır.
         """
+        db = BatchSessionLocal()
+        started = time.perf_counter()
+        analyzed_count = 0
+        chunk_count = 0
+        last_id = 0
+        
         try:
-            pending_events = self.db.query(CurrentEvent).filter(
-                CurrentEvent.analyzed == 0
-            ).all()
-            
-            analyzed_count = 0
-            
-            for event in pending_events:
-                # Her iki piyasa için tahmin yap
-                symbols = ['GOLD', 'USDTRY']
+            while True:
+                chunk = db.query(
+                    CurrentEvent.id, CurrentEvent.title, CurrentEvent.category
+                ).filter(
+                    CurrentEvent.analyzed == 0,
+                    CurrentEvent.id > last_id
+                ).order_by(CurrentEvent.id).limit(chunk_size).all()
                 
-                max_impact = 0.0
-                for symbol in symbols:
-                    prediction = self.predict_impact(event, symbol)
-                    if prediction['predicted_impact'] > max_impact:
-                        max_impact = prediction['predicted_impact']
+                if not chunk:
+                    break
+                last_id = chunk[-1].id
+                
+                impacts = self._score_chunk(chunk)
+                
+                db.execute(
+                    update(CurrentEvent)
+                    .where(CurrentEvent.id.in_(list(impacts)))
+                    .values(
+                        predicted_impact=case(impacts, value=CurrentEvent.id),
+                        analyzed=1
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+                db.commit()
                 
-                # En yüksek etkiyi kaydet
-                event.predicted_impact = max_impact
-                event.analyzed = 1
-                analyzed_count += 1
+                analyzed_count += len(chunk)
+                chunk_count += 1
             
-            self.db.commit()
-            logger.info(f"{analyzed_count} olay analiz edildi.")
+            elapsed = time.perf_counter() - started
+            self.last_run_stats = {
+                'events': analyzed_count,
+                'chunks': chunk_count,
+                'chunk_size': chunk_size,
+                'seconds': round(elapsed, 3),
+                'events_per_sec': round(analyzed_count / elapsed, 1) if elapsed > 0 and analyzed_count else 0.0,
+                'finished_at': datetime.datetime.utcnow().isoformat()
+            }
+            logger.info(
+                f"{analyzed_count} olay analiz edildi "
+                f"({chunk_count} parça, {self.last_run_stats['events_per_sec']} olay/sn)."
+            )
             
             return analyzed_count
             
         except Exception as e:
             logger.error(f"Toplu analiz hatası: {str(e)}")
-            self.db.rollback()
-            return 0
+            db.rollback()
+            return analyzed_count
+        finally:
+            db.close()
+    
+    def _score_chunk(self, events) -> Dict[int, float]:
+        """
+        Bir olay parçası için her olayın semboller arası en yüksek etki skorunu döndürür
+        """
+        similar_batches = self.find_similar_events_batch(events, limit=10)
+        
+        stats_batch = correlation_store.aggregate_batch(
+            [[item['event'].id for item in similar] for similar in similar_batches],
+            [[item['similarity'] for item in similar] for similar in similar_batches],
+            ANALYSIS_SYMBOLS
+        )
+        
+        impacts = {}
+        for event, similar, stats in zip(events, similar_batches, stats_batch):
+            max_impact = 0.0
+            if similar:
+                for symbol in ANALYSIS_SYMBOLS:
+                    prediction = self._build_prediction(len(similar), stats[symbol])
+                    if prediction['predicted_impact'] > max_impact:
+                        max_impact = prediction['predicted_impact']
+            impacts[event.id] = max_impact
+        
+        return impacts
     
     def get_top_impact_events(self, limit=5) -> List[CurrentEvent]:
         """
         En yüksek etkili güncel olayları döndürür
         """
+        db = SessionLocal()
         try:
-            events = self.db.query(CurrentEvent).filter(
+            events = db.query(CurrentEvent).filter(
                 CurrentEvent.analyzed == 1
             ).order_by(
                 CurrentEvent.predicted_impact.desc()
@@ -212,6 +248,8 @@ class PredictionService:
         except Exception as e:
             logger.error(f"Top events sorgusu hatası: {str(e)}")
             return []
+        finally:
+            db.close()
     
     def generate_narrative(self, event_title, percent_change, symbol='GOLD') -> str:
         """
@@ -234,10 +272,6 @@ class PredictionService:
             
         return narrative
 
-    def __del__(self):
-        if hasattr(self, 'db'):
-            self.db.close()
-
 
 # Global instance
 prediction_service = PredictionService()
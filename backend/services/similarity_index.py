@@ -0,0 +1,224 @@
+"""
+Similarity Index - Geçmiş olaylar için bellek içi seyrek token matrisi
+HistoricalEvent.title üzerinden ikili (binary) kelime matrisi tutar ve
+PredictionService'teki Jaccard + kategori bonusu skorunu toplu halde hesaplar.
+"""
+
+from database import BatchSessionLocal
+from models import HistoricalEvent
+from sqlalchemy import func
+import numpy as np
+from scipy import sparse
+import threading
+import time
+import logging
+from typing import Dict, List, Sequence
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CATEGORY_BONUS = 0.3
+MIN_SIMILARITY = 0.1
+# DB'de yeni satır olup olmadığını en fazla bu sıklıkta kontrol et (saniye)
+REFRESH_INTERVAL = 60
+
+
+def tokenize(text: str) -> set:
+    """PredictionService.calculate_similarity ile aynı kelime ayrıştırması"""
+    if not text:
+        return set()
+    return set(text.lower().split())
+
+
+class HistoricalEventIndex:
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._vocab: Dict[str, int] = {}
+        self._categories: Dict[object, int] = {}
+        self._reset()
+
+    def _reset(self):
+        self._vocab.clear()
+        self._categories.clear()
+        self._events: List[HistoricalEvent] = []
+        self._ids = np.empty(0, dtype=np.int64)
+        self._sizes = np.empty(0, dtype=np.int32)
+        self._category_codes = np.empty(0, dtype=np.int32)
+        self._matrix = sparse.csr_matrix((0, 0), dtype=np.int32)
+        self._max_id = 0
+        self._last_check = 0.0
+        self._loaded = False
+
+    def _category_code(self, category) -> int:
+        code = self._categories.get(category)
+        if code is None:
+            code = len(self._categories)
+            self._categories[category] = code
+        return code
+
+    def _append(self, events: Sequence[HistoricalEvent]):
+        """Yeni satırları matrise ekler (sözlük gerekirse genişler)"""
+        if not events:
+            return
+
+        indptr = [0]
+        indices = []
+        sizes = []
+        for event in events:
+            tokens = tokenize(event.title)
+            for token in tokens:
+                col = self._vocab.get(token)
+                if col is None:
+                    col = len(self._vocab)
+                    self._vocab[token] = col
+                indices.append(col)
+            indptr.append(len(indices))
+            sizes.append(len(tokens))
+
+        n_cols = len(self._vocab)
+        block = sparse.csr_matrix(
+            (np.ones(len(indices), dtype=np.int32), np.array(indices, dtype=np.int64), np.array(indptr)),
+            shape=(len(events), n_cols)
+        )
+        existing = self._matrix
+        existing.resize((existing.shape[0], n_cols))
+        self._matrix = sparse.vstack([existing, block], format='csr')
+
+        self._events.extend(events)
+        self._ids = np.concatenate([self._ids, [e.id for e in events]]).astype(np.int64)
+        self._sizes = np.concatenate([self._sizes, sizes]).astype(np.int32)
+        self._category_codes = np.concatenate(
+            [self._category_codes, [self._category_code(e.category) for e in events]]
+        ).astype(np.int32)
+        self._max_id = max(self._max_id, int(self._ids.max()))
+
+    def rebuild(self):
+        """Tüm indeksi veritabanından baştan oluşturur"""
+        db = BatchSessionLocal()
+        try:
+            events = db.query(HistoricalEvent).order_by(HistoricalEvent.id).all()
+            with self._lock:
+                self._reset()
+                self._append(events)
+                self._loaded = True
+                self._last_check = time.monotonic()
+            logger.info(f"Benzerlik indeksi oluşturuldu: {len(events)} olay, {len(self._vocab)} kelime")
+        finally:
+            db.close()
+
+    def refresh(self, force: bool = False):
+        """
+        Yeni eklenen geçmiş olayları indekse ekler.
+        Satır silinmişse (sayı tutmuyorsa) indeksi yeniden kurar.
+        """
+        if not self._loaded:
+            self.rebuild()
+            return
+
+        now = time.monotonic()
+        if not force and now - self._last_check < REFRESH_INTERVAL:
+            return
+
+        db = BatchSessionLocal()
+        try:
+            with self._lock:
+                self._last_check = now
+                total, max_id = db.query(func.count(HistoricalEvent.id), func.max(HistoricalEvent.id)).one()
+                if total == len(self._events) and (max_id or 0) == self._max_id:
+                    return
+
+                new_events = db.query(HistoricalEvent).filter(
+                    HistoricalEvent.id > self._max_id
+                ).order_by(HistoricalEvent.id).all()
+
+                if total != len(self._events) + len(new_events):
+                    logger.info("Geçmiş olay sayısı tutarsız, benzerlik indeksi yeniden kuruluyor.")
+                    rebuild_needed = True
+                else:
+                    self._append(new_events)
+                    rebuild_needed = False
+                    logger.info(f"Benzerlik indeksine {len(new_events)} yeni olay eklendi.")
+        finally:
+            db.close()
+
+        if rebuild_needed:
+            self.rebuild()
+
+    def invalidate(self):
+        """Bir sonraki sorguda DB kontrolünü zorlar"""
+        self._last_check = 0.0
+
+    def _query_matrix(self, titles: Sequence[str]):
+        indptr = [0]
+        indices = []
+        sizes = []
+        for title in titles:
+            tokens = tokenize(title)
+            known = [self._vocab[t] for t in tokens if t in self._vocab]
+            indices.extend(known)
+            indptr.append(len(indices))
+            sizes.append(len(tokens))
+        matrix = sparse.csr_matrix(
+            (np.ones(len(indices), dtype=np.int32), np.array(indices, dtype=np.int64), np.array(indptr)),
+            shape=(len(titles), len(self._vocab))
+        )
+        return matrix, np.array(sizes, dtype=np.int32)
+
+    def search_batch(self, events: Sequence, limit: int = 5) -> List[List[Dict]]:
+        """
+        Birden fazla güncel olay için en benzer geçmiş olayları döndürür.
+        Kesişim sayıları tek bir seyrek matris çarpımıyla hesaplanır.
+        Skor: Jaccard(başlık) + aynı kategori için 0.3 bonus.
+        """
+        self.refresh()
+
+        with self._lock:
+            n_hist = len(self._events)
+            if not events or n_hist == 0:
+                return [[] for _ in events]
+
+            query_matrix, query_sizes = self._query_matrix([e.title for e in events])
+            intersections = (query_matrix @ self._matrix.T).tocsr()
+
+            results = []
+            for row, event in enumerate(events):
+                scores = np.zeros(n_hist, dtype=np.float64)
+
+                start, end = intersections.indptr[row], intersections.indptr[row + 1]
+                cols = intersections.indices[start:end]
+                inter = intersections.data[start:end].astype(np.float64)
+                if query_sizes[row] > 0 and len(cols):
+                    union = query_sizes[row] + self._sizes[cols] - inter
+                    scores[cols] = inter / union
+
+                category_code = self._categories.get(event.category)
+                if category_code is not None:
+                    scores[self._category_codes == category_code] += CATEGORY_BONUS
+
+                results.append(self._top_k(scores, limit))
+
+            return results
+
+    def _top_k(self, scores: np.ndarray, limit: int) -> List[Dict]:
+        """
+        Eşiği geçen en yüksek skorlu ilk `limit` olayı seçer.
+        Eşit skorlarda eski davranıştaki gibi id sırası korunur.
+        """
+        candidates = np.flatnonzero(scores > MIN_SIMILARITY)
+        if len(candidates) > limit:
+            cand_scores = scores[candidates]
+            kth = np.partition(cand_scores, len(cand_scores) - limit)[len(cand_scores) - limit]
+            above = candidates[cand_scores > kth]
+            ties = candidates[cand_scores == kth][:limit - len(above)]
+            candidates = np.concatenate([above, ties])
+
+        order = np.lexsort((candidates, -scores[candidates]))
+        return [
+            {'event': self._events[i], 'similarity': float(scores[i])}
+            for i in candidates[order]
+        ]
+
+
+# Global instance
+historical_event_index = HistoricalEventIndex()
@@ -1,11 +1,13 @@
 import json
 import logging
 import datetime
-import requests
-from database import SessionLocal
-from models import MarketSummary, CurrentMarketRate, CurrentEvent, UpcomingEvent, HistoricalEvent, MarketEventCorrelation
+from urllib.parse import urlsplit
+from database import BatchSessionLocal
+from models import MarketSummary, CurrentMarketRate, CurrentEvent, UpcomingEvent, HistoricalEvent
 from services.prediction_service import prediction_service
+from services.correlation_store import correlation_store
 from services.trading_economics_service import trading_economics_service
+from services.http_client import http_client, register_host_policy, HostPolicy
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -17,6 +19,10 @@ class SummaryService:
         self.ollama_url = os.getenv("OLLAMA_URL", "http://ollama:11434/api/generate")
         self.model = "llama3" # Kullanıcı makinesinde hangi model varsa, varsayılan llama3
         logger.info(f"Ollama URL configured: {self.ollama_url}")
+        # Yerel LLM: tek seferde bir üretim, uzun zaman aşımı
+        register_host_policy(urlsplit(self.ollama_url).hostname or '', HostPolicy(
+            max_concurrency=1, timeout=180, retries=0, failure_threshold=3, reset_timeout=60
+        ))
 
     def _call_ollama(self, prompt):
         """Ollama API'sine istek atar."""
@@ -31,7 +37,7 @@ class SummaryService:
                 }
             }
             # LLM detaylı analiz için daha fazla zamana ihtiyaç duyabilir
-            response = requests.post(self.ollama_url, json=payload, timeout=180)
+            response = http_client.post_sync(self.ollama_url, json=payload)
             if response.status_code == 200:
                 return response.json().get("response", "")
             else:
@@ -46,7 +52,7 @@ class SummaryService:
         Her saat başı piyasa verilerini, haberleri ve gelecek olayları birleştirerek 
         Ollama (LLM) destekli özet oluşturur.
         """
-        db = SessionLocal()
+        db = BatchSessionLocal()
         try:
             # 1. Güncel kurları al
             rates = db.query(CurrentMarketRate).all()
@@ -67,38 +73,29 @@ class SummaryService:
             news_snapshot = []
             detailed_correlations = []
             
-            for news in top_news:
-                similar_events = prediction_service.find_similar_events(news, limit=3)  # Daha fazla benzer olay
-                
+            similar_batches = prediction_service.find_similar_events_batch(top_news, limit=3)  # Daha fazla benzer olay
+            
+            for news, similar_events in zip(top_news, similar_batches):
                 if similar_events:
-                    # Her benzer olay için korelasyonları topla
+                    # Her benzer olay için korelasyonları önceden yüklenmiş tablodan topla
                     event_analysis = {
                         'current_title': news.title,
                         'historical_matches': []
                     }
                     
-                    for sim_item in similar_events:
+                    correlation_rows = correlation_store.rows_for_events([item['event'].id for item in similar_events])
+                    
+                    for sim_item, correlations in zip(similar_events, correlation_rows):
                         hist_event = sim_item['event']
                         similarity_score = sim_item['similarity']
                         
-                        # Korelasyonları detaylı al
-                        correlations = db.query(MarketEventCorrelation).filter(
-                            MarketEventCorrelation.event_id == hist_event.id
-                        ).all()
-                        
-                        if correlations:
-                            for corr in correlations:
-                                event_analysis['historical_matches'].append({
-                                    'date': hist_event.event_date.strftime('%d.%m.%Y'),
-                                    'title': hist_event.title,
-                                    'similarity': round(similarity_score * 100, 1),
-                                    'symbol': corr.symbol,
-                                    'price_before': corr.price_before,
-                                    'price_after': corr.price_after,
-                                    'percent_change': corr.percent_change,
-                                    'days_after': corr.days_after,
-                                    'correlation_strength': corr.correlation_strength
-                                })
+                        for corr in correlations:
+                            event_analysis['historical_matches'].append({
+                                'date': hist_event.event_date.strftime('%d.%m.%Y'),
+                                'title': hist_event.title,
+                                'similarity': round(similarity_score * 100, 1),
+                                **corr
+                            })
                     
                     if event_analysis['historical_matches']:
                         detailed_correlations.append(event_analysis)
@@ -0,0 +1,287 @@
+"""
+TimescaleDB Service - market_data hypertable'ı için sürekli toplamalar (continuous aggregates)
+1 saatlik, 1 günlük ve 1 haftalık OHLC görünümlerini oluşturur, yeniler ve
+grafik sorguları için uygun çözünürlüğü seçer. Ayrıca native sıkıştırma ve
+ham veri saklama (retention) politikalarını yönetir.
+"""
+
+from database import batch_engine
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+import datetime
+import logging
+import os
+from typing import Dict, List, Optional
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# İnceden kabaya sıralı; refresh policy aralıkları bucket büyüklüğüne göre seçildi
+AGGREGATE_RESOLUTIONS = {
+    '1h': {
+        'view': 'market_data_1h',
+        'bucket': '1 hour',
+        'seconds': 3600,
+        'start_offset': '3 days',
+        'end_offset': '1 hour',
+        'schedule_interval': '30 minutes'
+    },
+    '1d': {
+        'view': 'market_data_1d',
+        'bucket': '1 day',
+        'seconds': 86400,
+        'start_offset': '30 days',
+        'end_offset': '1 hour',
+        'schedule_interval': '1 hour'
+    },
+    '1w': {
+        'view': 'market_data_1w',
+        'bucket': '7 days',
+        'seconds': 7 * 86400,
+        'start_offset': '90 days',
+        'end_offset': '1 hour',
+        'schedule_interval': '1 day'
+    }
+}
+
+DEFAULT_MAX_POINTS = 1000
+
+# Bu yaştan eski chunk'lar sıkıştırılır (gün)
+COMPRESS_AFTER_DAYS = int(os.getenv("MARKET_DATA_COMPRESS_AFTER_DAYS", "7"))
+# Ham tick'ler bu yaştan sonra silinir (gün); boş bırakılırsa silinmez
+RETENTION_DAYS = int(os.getenv("MARKET_DATA_RETENTION_DAYS") or 0) or None
+
+
+def _autocommit_connection():
+    # Continuous aggregate oluşturma/yenileme transaction bloğu içinde çalışamaz
+    return batch_engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+
+
+def ensure_hypertable(conn):
+    conn.execute(text(
+        "SELECT create_hypertable('market_data', 'time', if_not_exists => TRUE, migrate_data => TRUE);"
+    ))
+
+
+def _existing_aggregates(conn) -> set:
+    rows = conn.execute(text(
+        "SELECT view_name FROM timescaledb_information.continuous_aggregates "
+        "WHERE hypertable_name = 'market_data'"
+    )).fetchall()
+    return {row[0] for row in rows}
+
+
+def ensure_continuous_aggregates():
+    """
+    OHLC continuous aggregate'lerini ve otomatik yenileme politikalarını kurar.
+    Yeni oluşturulan görünümler mevcut verinin tamamıyla bir kez doldurulur.
+    """
+    with _autocommit_connection() as conn:
+        ensure_hypertable(conn)
+        existing = _existing_aggregates(conn)
+
+        for resolution, config in AGGREGATE_RESOLUTIONS.items():
+            view = config['view']
+            if view not in existing:
+                conn.execute(text(f"""
+                    CREATE MATERIALIZED VIEW IF NOT EXISTS {view}
+                    WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+                    SELECT time_bucket(INTERVAL '{config['bucket']}', time) AS bucket,
+                           symbol,
+                           first(price, time) AS open,
+                           max(price) AS high,
+                           min(price) AS low,
+                           last(price, time) AS close,
+                           avg(price) AS avg_price,
+                           count(*) AS sample_count
+                    FROM market_data
+                    GROUP BY bucket, symbol
+                    WITH NO DATA;
+                """))
+                conn.execute(text(f"CALL refresh_continuous_aggregate('{view}', NULL, NULL);"))
+                logger.info(f"Continuous aggregate oluşturuldu: {view}")
+
+            conn.execute(text(f"""
+                SELECT add_continuous_aggregate_policy('{view}',
+                    start_offset => INTERVAL '{config['start_offset']}',
+                    end_offset => INTERVAL '{config['end_offset']}',
+                    schedule_interval => INTERVAL '{config['schedule_interval']}',
+                    if_not_exists => TRUE);
+            """))
+
+
+def ensure_compression_policy(compress_after_days: int = COMPRESS_AFTER_DAYS):
+    """
+    market_data için native sıkıştırmayı (symbol'e göre segmentli, zamana göre sıralı)
+    açar ve belirtilen yaştan eski chunk'ları sıkıştıran politikayı kurar.
+    """
+    with _autocommit_connection() as conn:
+        enabled = conn.execute(text(
+            "SELECT compression_enabled FROM timescaledb_information.hypertables "
+            "WHERE hypertable_name = 'market_data'"
+        )).scalar()
+
+        # Sıkıştırılmış chunk varken ayarlar değiştirilemez; sadece ilk seferde ayarla
+        if not enabled:
+            conn.execute(text("""
+                ALTER TABLE market_data SET (
+                    timescaledb.compress,
+                    timescaledb.compress_segmentby = 'symbol',
+                    timescaledb.compress_orderby = 'time DESC'
+                );
+            """))
+            logger.info("market_data için sıkıştırma açıldı.")
+
+        # Yapılandırma değişmiş olabilir; politikayı her seferinde yeniden kur
+        conn.execute(text("SELECT remove_compression_policy('market_data', if_exists => TRUE);"))
+        conn.execute(text(
+            f"SELECT add_compression_policy('market_data', INTERVAL '{int(compress_after_days)} days');"
+        ))
+
+
+def ensure_retention_policy(retention_days=RETENTION_DAYS):
+    """
+    Ham tick'ler için saklama politikasını kurar (None ise kaldırır).
+    Continuous aggregate'ler yoksa veya saklama süresi aggregate yenileme
+    aralığından kısaysa, toplanmış veri kaybolmasın diye politika kurulmaz.
+    """
+    with _autocommit_connection() as conn:
+        conn.execute(text("SELECT remove_retention_policy('market_data', if_exists => TRUE);"))
+        if not retention_days:
+            return
+
+        missing = {c['view'] for c in AGGREGATE_RESOLUTIONS.values()} - _existing_aggregates(conn)
+        if missing:
+            logger.warning(f"Retention kurulmadı, eksik continuous aggregate'ler: {sorted(missing)}")
+            return
+
+        longest_refresh_days = max(
+            int(c['start_offset'].split()[0]) for c in AGGREGATE_RESOLUTIONS.values()
+        )
+        if retention_days <= longest_refresh_days:
+            logger.warning(
+                f"Retention ({retention_days} gün) aggregate yenileme aralığından "
+                f"({longest_refresh_days} gün) kısa olamaz, kurulmadı."
+            )
+            return
+
+        conn.execute(text(
+            f"SELECT add_retention_policy('market_data', INTERVAL '{int(retention_days)} days');"
+        ))
+        logger.info(f"market_data retention politikası: {retention_days} gün")
+
+
+def setup_timescale():
+    """Hypertable, continuous aggregate, sıkıştırma ve retention kurulumunu sırayla yapar"""
+    ensure_continuous_aggregates()
+    ensure_compression_policy()
+    ensure_retention_policy()
+
+
+def get_storage_stats(db: Session) -> Dict:
+    """market_data için toplam boyut, sıkıştırma oranları ve chunk bazlı boyutları döndürür"""
+    size = db.execute(text("SELECT * FROM hypertable_detailed_size('market_data')")).mappings().first()
+    compression = db.execute(text(
+        "SELECT * FROM hypertable_compression_stats('market_data')"
+    )).mappings().first()
+
+    chunks = db.execute(text("""
+        SELECT c.chunk_name, c.range_start, c.range_end, c.is_compressed,
+               s.total_bytes,
+               cs.before_compression_total_bytes,
+               cs.after_compression_total_bytes
+        FROM timescaledb_information.chunks c
+        LEFT JOIN chunks_detailed_size('market_data') s ON s.chunk_name = c.chunk_name
+        LEFT JOIN chunk_compression_stats('market_data') cs ON cs.chunk_name = c.chunk_name
+        WHERE c.hypertable_name = 'market_data'
+        ORDER BY c.range_start
+    """)).mappings().all()
+
+    def ratio(before, after):
+        return round(before / after, 2) if before and after else None
+
+    before_total = compression['before_compression_total_bytes'] if compression else None
+    after_total = compression['after_compression_total_bytes'] if compression else None
+
+    return {
+        'total_bytes': size['total_bytes'] if size else 0,
+        'table_bytes': size['table_bytes'] if size else 0,
+        'index_bytes': size['index_bytes'] if size else 0,
+        'total_chunks': len(chunks),
+        'compressed_chunks': sum(1 for c in chunks if c['is_compressed']),
+        'before_compression_bytes': before_total,
+        'after_compression_bytes': after_total,
+        'compression_ratio': ratio(before_total, after_total),
+        'compress_after_days': COMPRESS_AFTER_DAYS,
+        'retention_days': RETENTION_DAYS,
+        'chunks': [{
+            'chunk_name': c['chunk_name'],
+            'range_start': c['range_start'].isoformat() if c['range_start'] else None,
+            'range_end': c['range_end'].isoformat() if c['range_end'] else None,
+            'is_compressed': c['is_compressed'],
+            'total_bytes': c['total_bytes'],
+            'before_compression_bytes': c['before_compression_total_bytes'],
+            'after_compression_bytes': c['after_compression_total_bytes'],
+            'compression_ratio': ratio(c['before_compression_total_bytes'], c['after_compression_total_bytes'])
+        } for c in chunks]
+    }
+
+
+def refresh_continuous_aggregates(start: Optional[datetime.datetime] = None,
+                                  end: Optional[datetime.datetime] = None):
+    """Backfill sonrası verilen aralığı (varsayılan: tamamı) tüm görünümlerde yeniden hesaplar"""
+    with _autocommit_connection() as conn:
+        for config in AGGREGATE_RESOLUTIONS.values():
+            conn.execute(
+                text(f"CALL refresh_continuous_aggregate('{config['view']}', "
+                     "CAST(:start AS TIMESTAMPTZ), CAST(:end AS TIMESTAMPTZ));"),
+                {'start': start, 'end': end}
+            )
+
+
+def choose_resolution(start: datetime.datetime, end: datetime.datetime, max_points: int) -> str:
+    """
+    Aralığı nokta bütçesini aşmadan gösterebilen en ayrıntılı çözünürlüğü seçer;
+    hiçbiri sığmıyorsa en kaba çözünürlük kullanılır.
+    """
+    span = max((end - start).total_seconds(), 0)
+    for resolution, config in AGGREGATE_RESOLUTIONS.items():
+        if span / config['seconds'] <= max_points:
+            return resolution
+    return list(AGGREGATE_RESOLUTIONS)[-1]
+
+
+def get_ohlc(db: Session, symbol: str, start: datetime.datetime, end: datetime.datetime,
+             max_points: int = DEFAULT_MAX_POINTS, resolution: Optional[str] = None) -> Dict:
+    """Önceden toplanmış OHLC verisini döndürür"""
+    if resolution is None:
+        resolution = choose_resolution(start, end, max_points)
+    config = AGGREGATE_RESOLUTIONS[resolution]
+
+    rows = db.execute(text(f"""
+        SELECT bucket, open, high, low, close, avg_price, sample_count
+        FROM {config['view']}
+        WHERE symbol = :symbol
+          AND bucket >= time_bucket(INTERVAL '{config['bucket']}', CAST(:start AS TIMESTAMPTZ))
+          AND bucket <= :end
+        ORDER BY bucket ASC
+    """), {'symbol': symbol, 'start': start, 'end': end}).fetchall()
+
+    points: List[Dict] = [{
+        'time': row.bucket.isoformat(),
+        'open': row.open,
+        'high': row.high,
+        'low': row.low,
+        'close': row.close,
+        'avg_price': row.avg_price,
+        'sample_count': row.sample_count
+    } for row in rows]
+
+    return {
+        'symbol': symbol,
+        'resolution': resolution,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'points': points,
+        'count': len(points)
+    }
@@ -1,25 +1,48 @@
 import os
 import json
-import redis
+import asyncio
 import datetime
-import requests
-
-# Connect to Redis
-REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
-r = redis.from_url(REDIS_URL, decode_responses=True)
+from redis_client import async_redis_client as r
+from services.http_client import http_client
 
 OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
 
-def get_weather_data(location="Istanbul"):
+# Redis cache TTLs (seconds); geocode results are kept without expiry
+WEATHER_TTL = 10 * 60
+ACTIVE_BUSES_TTL = 60
+ROUTE_TTL = 7 * 24 * 60 * 60
+# Coordinates are snapped to 3 decimals (~100 m) so nearby points share a route entry
+COORD_PRECISION = 3
+# Route durations are bucketed by hour of day
+ROUTE_BUCKET_MINUTES = 60
+
+
+async def _cached(key: str, ttl, fetch):
     """
-    Fetches real weather data if API key is present, else returns mock.
+    Reads `key` from Redis, otherwise awaits fetch() and stores the result.
+    None results (errors, fallbacks) are not cached; Redis errors fall through to fetch().
     """
-    if not OPENWEATHER_API_KEY:
-        return {"condition": "Rain", "temp": 12, "traffic_load": "High", "source": "Mock"}
-    
     try:
-        url = f"http://api.openweathermap.org/data/2.5/weather?q={location}&appid={OPENWEATHER_API_KEY}&units=metric"
-        response = requests.get(url, timeout=5)
+        payload = await r.get(key)
+        if payload is not None:
+            return json.loads(payload)
+    except Exception as e:
+        print(f"Transit cache read error: {e}")
+
+    value = await fetch()
+    if value is not None:
+        try:
+            await r.set(key, json.dumps(value), ex=ttl)
+        except Exception as e:
+            print(f"Transit cache write error: {e}")
+    return value
+
+
+async def _fetch_weather(location):
+    try:
+        url = "http://api.openweathermap.org/data/2.5/weather"
+        params = {"q": location, "appid": OPENWEATHER_API_KEY, "units": "metric"}
+        response = await http_client.get(url, params=params)
         if response.status_code == 200:
             data = response.json()
             condition = data["weather"][0]["main"]
@@ -27,16 +50,25 @@ def get_weather_data(location="Istanbul"):
             return {"condition": condition, "temp": temp, "traffic_load": "Normal", "source": "API"}
     except Exception as e:
         print(f"Weather API Error: {e}")
-        
-    return {"condition": "Clear", "temp": 20, "traffic_load": "Normal", "source": "Fallback"}
+    return None
 
-def get_active_buses():
+async def get_weather_data(location="Istanbul"):
     """
-    Fetches active bus locations from data.ibb.gov.tr wrapper API.
+    Fetches real weather data if API key is present, else returns mock.
     """
+    if not OPENWEATHER_API_KEY:
+        return {"condition": "Rain", "temp": 12, "traffic_load": "High", "source": "Mock"}
+
+    weather = await _cached(f"transit:weather:{location.lower()}", WEATHER_TTL, lambda: _fetch_weather(location))
+    if weather is not None:
+        return weather
+
+    return {"condition": "Clear", "temp": 20, "traffic_load": "Normal", "source": "Fallback"}
+
+async def _fetch_active_buses():
     try:
         url = "https://mekansal.herokuapp.com/api/filo"
-        response = requests.get(url, timeout=5)
+        response = await http_client.get(url)
         if response.status_code == 200:
             data = response.json()
             # data is a FeatureCollection
@@ -44,79 +76,117 @@ def get_active_buses():
             return len(features)
     except Exception as e:
         print(f"Bus API Error: {e}")
-    return 0
+    return None
+
+async def get_active_buses():
+    """
+    Fetches active bus locations from data.ibb.gov.tr wrapper API.
+    """
+    count = await _cached("transit:active_buses", ACTIVE_BUSES_TTL, _fetch_active_buses)
+    return count or 0
+
+async def _fetch_coords(location):
+    try:
+        # User-Agent (required by Nominatim) is set on the shared client
+        url = "https://nominatim.openstreetmap.org/search"
+        res = await http_client.get(url, params={"q": location, "format": "json", "limit": 1})
+        if res.status_code == 200 and len(res.json()) > 0:
+            data = res.json()[0]
+            return [float(data['lon']), float(data['lat'])]
+    except Exception as e:
+        print(f"Geocoding Error: {e}")
+    return None
+
+async def get_coords(location):
+    """
+    Geocodes a location string. Results are cached permanently (place names don't move).
+    """
+    key = f"transit:geocode:{' '.join(location.lower().split())}"
+    coords = await _cached(key, None, lambda: _fetch_coords(location))
+    return tuple(coords) if coords else (None, None)
+
+async def _fetch_route_minutes(lon1, lat1, lon2, lat2):
+    try:
+        # OSRM Route
+        osrm_url = f"http://router.project-osrm.org/route/v1/driving/{lon1},{lat1};{lon2},{lat2}?overview=false"
+        res = await http_client.get(osrm_url)
+        if res.status_code == 200:
+            routes = res.json().get("routes", [])
+            if routes:
+                duration_seconds = routes[0]["duration"]
+                return round(duration_seconds / 60)
+    except Exception as e:
+        print(f"OSRM Error: {e}")
+    return None
 
-def recommend_alarm(user_id: int):
+async def get_route_minutes(lon1, lat1, lon2, lat2, at: datetime.datetime = None):
+    """
+    Driving time in minutes between two points, cached per snapped coordinate
+    pair and time-of-day bucket.
+    """
+    at = at or datetime.datetime.now()
+    bucket = (at.hour * 60 + at.minute) // ROUTE_BUCKET_MINUTES
+    snapped = [round(value, COORD_PRECISION) for value in (lon1, lat1, lon2, lat2)]
+    key = "transit:route:{},{};{},{}:{}".format(*snapped, bucket)
+    return await _cached(key, ROUTE_TTL, lambda: _fetch_route_minutes(*snapped))
+
+async def _get_route(origin, destination, at):
+    # 1. Geocode Origin and Destination
+    (lon1, lat1), (lon2, lat2) = await asyncio.gather(get_coords(origin), get_coords(destination))
+    if lon1 and lon2:
+        return await get_route_minutes(lon1, lat1, lon2, lat2, at)
+    return None
+
+async def recommend_alarm(user_id: int):
     # In future, fetch user specifics from DB:
     # user = db.query(User).get(user_id)
     target_arrival = "08:00"
     base_travel_time = 30 # minutes
     prep_time = 45 # minutes
-    
-    # Dynamic Data Check
-    context = get_weather_data()
-    
+
     # Calculate Travel Time using OSRM
     origin = "Besiktas, Istanbul" # Mock user location
     destination = "Maslak, Istanbul" # Mock user destination
-    
-    # 1. Geocode Origin and Destination
-    def get_coords(location):
-        try:
-            # User-Agent is required by Nominatim
-            headers = {'User-Agent': 'MenagerApp/1.0'}
-            url = f"https://nominatim.openstreetmap.org/search?q={location}&format=json&limit=1"
-            res = requests.get(url, headers=headers)
-            if res.status_code == 200 and len(res.json()) > 0:
-                data = res.json()[0]
-                return float(data['lon']), float(data['lat'])
-        except Exception as e:
-            print(f"Geocoding Error: {e}")
-        return None, None
 
-    lon1, lat1 = get_coords(origin)
-    lon2, lat2 = get_coords(destination)
-    
+    # The commute happens around the target arrival, so route durations are bucketed by it
+    travel_at = datetime.datetime.combine(
+        datetime.date.today(), datetime.datetime.strptime(target_arrival, "%H:%M").time()
+    )
+
+    # Weather, fleet and route lookups are independent: run them concurrently
+    context, active_buses, route_minutes = await asyncio.gather(
+        get_weather_data(), get_active_buses(), _get_route(origin, destination, travel_at)
+    )
+
     base_travel_time = 30 # Default fallback
     route_source = "Fallback"
-    
-    if lon1 and lon2:
-        try:
-            # OSRM Route
-            osrm_url = f"http://router.project-osrm.org/route/v1/driving/{lon1},{lat1};{lon2},{lat2}?overview=false"
-            res = requests.get(osrm_url)
-            if res.status_code == 200:
-                routes = res.json().get("routes", [])
-                if routes:
-                    duration_seconds = routes[0]["duration"]
-                    base_travel_time = round(duration_seconds / 60)
-                    route_source = "OpenStreetMap (OSRM)"
-        except Exception as e:
-            print(f"OSRM Error: {e}")
+
+    if route_minutes is not None:
+        base_travel_time = route_minutes
+        route_source = "OpenStreetMap (OSRM)"
 
     weather_delay = 0
     reasons = []
-    
+
     # Basit durum eşleştirmesi
     bad_conditions = ["Rain", "Snow", "Thunderstorm", "Drizzle"]
     if context["condition"] in bad_conditions:
         weather_delay += 15
         reasons.append(f"Hava durumu: {context['condition']} (+15dk)")
-        
+
     if context["traffic_load"] == "High":
         weather_delay += 10
         reasons.append("Trafik Yoğun (Simüle Edilmiş) (+10dk)")
-        
+
     total_minutes_needed = base_travel_time + prep_time + weather_delay
-    
+
     # Calculate Wakeup Time
     # Assuming target_arrival is today 08:00
     arrival_dt = datetime.datetime.strptime(target_arrival, "%H:%M")
     wakeup_dt = arrival_dt - datetime.timedelta(minutes=total_minutes_needed)
     recommended_wakeup = wakeup_dt.strftime("%H:%M")
-    
+
     # Check Active Buses
-    active_buses = get_active_buses()
     if active_buses > 0:
         reasons.append(f"Toplu Taşıma Aktif: Yolda {active_buses} otobüs var")
 
@@ -1,9 +1,15 @@
 from datetime import datetime, timedelta
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple
+from bisect import bisect_left, bisect_right
 import json
+import threading
 from sqlalchemy.orm import Session
 from models import TransportRoute, UserTransportAlarm
 
+ALL_DAYS_MASK = 0b1111111
+# next_departures / departures_in_window en fazla bu kadar gün ileri bakar
+MAX_LOOKAHEAD_DAYS = 7
+
 def parse_departure_times(route: TransportRoute) -> List[str]:
     """Otobüs kalkış saatlerini parse et"""
     try:
@@ -11,6 +17,128 @@ def parse_departure_times(route: TransportRoute) -> List[str]:
     except:
         return []
 
+
+class CompiledTimetable:
+    """
+    Bir hattın derlenmiş sefer tablosu: gün içi dakikaların sıralı dizisi
+    ve aktif günlerin bit maskesi (bit 0 = Pazartesi)
+    """
+    __slots__ = ('minutes', 'day_mask')
+
+    def __init__(self, minutes: Tuple[int, ...], day_mask: int):
+        self.minutes = minutes
+        self.day_mask = day_mask
+
+    def is_active(self, weekday: int) -> bool:
+        return bool(self.day_mask >> weekday & 1)
+
+
+def compile_timetable(departure_times_raw: str, active_days_raw: str) -> CompiledTimetable:
+    """JSON kolonlarını bir kez parse edip derlenmiş tabloya çevirir"""
+    minutes = set()
+    try:
+        departure_times = json.loads(departure_times_raw)
+    except:
+        departure_times = []
+    for time_str in departure_times:
+        try:
+            hour, minute = map(int, time_str.split(':'))
+            if 0 <= hour < 24 and 0 <= minute < 60:
+                minutes.add(hour * 60 + minute)
+        except:
+            continue
+
+    try:
+        active_days = json.loads(active_days_raw)
+        day_mask = 0
+        for day in active_days:
+            if isinstance(day, int) and 0 <= day <= 6:
+                day_mask |= 1 << day
+    except:
+        day_mask = ALL_DAYS_MASK  # Hata varsa tüm günler aktif kabul et
+
+    return CompiledTimetable(tuple(sorted(minutes)), day_mask)
+
+
+# route_id -> ((departure_times, active_days), CompiledTimetable)
+_timetables: Dict[int, Tuple[Tuple[str, str], CompiledTimetable]] = {}
+_timetables_lock = threading.Lock()
+
+def get_timetable(route: TransportRoute) -> CompiledTimetable:
+    """
+    Hattın derlenmiş tablosunu döndürür. Kolonların ham değeri imza olarak
+    saklanır; hat güncellendiğinde tablo bir sonraki erişimde yeniden derlenir.
+    """
+    signature = (route.departure_times, route.active_days)
+    cached = _timetables.get(route.id)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    timetable = compile_timetable(route.departure_times, route.active_days)
+    if route.id is not None:
+        with _timetables_lock:
+            _timetables[route.id] = (signature, timetable)
+    return timetable
+
+def to_local_naive(moment: datetime) -> datetime:
+    """Saat dilimli zamanı yerel saate çevirir; kalkış tablosu yerel, naive saatlerle çalışır"""
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone().replace(tzinfo=None)
+
+def _minute_of_day(moment: datetime) -> int:
+    return moment.hour * 60 + moment.minute
+
+def _at_minute(day: datetime, minute: int) -> datetime:
+    return datetime.combine(day.date(), datetime.min.time()) + timedelta(minutes=minute)
+
+def next_departures(route: TransportRoute, count: int = 5, current_time: datetime = None) -> List[datetime]:
+    """Şu andan sonraki ilk `count` kalkış (gerekirse sonraki günlere geçer)"""
+    if current_time is None:
+        current_time = datetime.now()
+    timetable = get_timetable(route)
+    if not timetable.minutes or not timetable.day_mask:
+        return []
+
+    result = []
+    for offset in range(MAX_LOOKAHEAD_DAYS + 1):
+        day = current_time + timedelta(days=offset)
+        if not timetable.is_active(day.weekday()):
+            continue
+        # Bugün için sadece bu dakikadan sonraki kalkışlar
+        start = bisect_right(timetable.minutes, _minute_of_day(current_time)) if offset == 0 else 0
+        for minute in timetable.minutes[start:start + count - len(result)]:
+            result.append(_at_minute(day, minute))
+        if len(result) >= count:
+            break
+    return result
+
+def departures_in_window(route: TransportRoute, start: datetime, end: datetime) -> List[datetime]:
+    """[start, end) aralığındaki tüm kalkışlar (en fazla MAX_LOOKAHEAD_DAYS gün)"""
+    timetable = get_timetable(route)
+    start, end = to_local_naive(start), to_local_naive(end)
+    end = min(end, start + timedelta(days=MAX_LOOKAHEAD_DAYS))
+    if not timetable.minutes or end <= start:
+        return []
+
+    result = []
+    day = datetime.combine(start.date(), datetime.min.time())
+    while day < end:
+        if timetable.is_active(day.weekday()):
+            # Dakika sınırları: start'tan sonraki ilk tam dakika, end'den önceki son
+            low = 0
+            if day.date() == start.date():
+                first = _minute_of_day(start) + (1 if start.second or start.microsecond else 0)
+                low = bisect_left(timetable.minutes, first)
+            high = len(timetable.minutes)
+            if day.date() == end.date():
+                last = _minute_of_day(end) + (1 if end.second or end.microsecond else 0)
+                high = bisect_left(timetable.minutes, last)
+            for minute in timetable.minutes[low:high]:
+                result.append(_at_minute(day, minute))
+        day += timedelta(days=1)
+    return result
+
 def calculate_next_bus(route: TransportRoute, current_time: datetime = None) -> Optional[Dict]:
     """
     Bir sonraki otobüs zamanını hesaplar
@@ -25,43 +153,17 @@ def calculate_next_bus(route: TransportRoute, current_time: datetime = None) ->
     if current_time is None:
         current_time = datetime.now()
     
-    # Bugünün günü
-    current_day = current_time.weekday()  # 0=Monday, 6=Sunday
-    
-    # Aktif günleri kontrol et
-    try:
-        active_days = json.loads(route.active_days)
-        if current_day not in active_days:
-            return None
-    except:
-        pass  # Hata varsa tüm günler aktif kabul et
-    
-    # Kalkış saatlerini parse et
-    departure_times = parse_departure_times(route)
-    if not departure_times:
+    # Aktif günleri ve kalkış saatlerini derlenmiş tablodan kontrol et
+    timetable = get_timetable(route)
+    if not timetable.is_active(current_time.weekday()):
         return None
     
-    # Bugünün tarihi
-    today = current_time.date()
-    
-    # Gelecekteki ilk kalkış saatini bul
-    next_departures = []
-    for time_str in departure_times:
-        try:
-            hour, minute = map(int, time_str.split(':'))
-            departure_datetime = datetime.combine(today, datetime.min.time().replace(hour=hour, minute=minute))
-            
-            # Eğer bu saat geçmemişse ekle
-            if departure_datetime > current_time:
-                next_departures.append(departure_datetime)
-        except:
-            continue
-    
-    if not next_departures:
+    # Gelecekteki ilk kalkış: bu dakikadan sonraki ilk değer (sadece bugün)
+    index = bisect_right(timetable.minutes, _minute_of_day(current_time))
+    if index == len(timetable.minutes):
         return None
     
-    # En yakın zamanı seç
-    next_departure = min(next_departures)
+    next_departure = _at_minute(current_time, timetable.minutes[index])
     time_until = next_departure - current_time
     
     return {
@@ -107,20 +209,23 @@ def should_trigger_alarm(
     should_trigger = minutes_until_bus <= total_minutes_needed and minutes_until_bus > 0
     
     if should_trigger:
-        alarm_data = {
-            'route_number': route.route_number,
-            'route_name': route.route_name,
-            'departure_location': route.departure_location,
-            'arrival_location': route.arrival_location,
-            'next_departure': next_bus['next_departure'],
-            'minutes_until_departure': minutes_until_bus,
-            'travel_time_to_stop': travel_time,
-            'can_catch_message': f"{travel_time} dakika içinde çıkarsan otobüse yetişebilirsin!"
-        }
-        return True, alarm_data
+        return True, build_alarm_data(route, next_bus['next_departure'], minutes_until_bus, travel_time)
     
     return False, None
 
+def build_alarm_data(route: TransportRoute, departure: datetime, minutes_until_bus: int, travel_time: int) -> Dict:
+    """send_alarm_notification'a verilen alarm bilgisi"""
+    return {
+        'route_number': route.route_number,
+        'route_name': route.route_name,
+        'departure_location': route.departure_location,
+        'arrival_location': route.arrival_location,
+        'next_departure': departure,
+        'minutes_until_departure': minutes_until_bus,
+        'travel_time_to_stop': travel_time,
+        'can_catch_message': f"{travel_time} dakika içinde çıkarsan otobüse yetişebilirsin!"
+    }
+
 def get_time_to_catch_bus(
     alarm: UserTransportAlarm, 
     next_bus_time: datetime,
@@ -148,24 +253,21 @@ def get_time_to_catch_bus(
 
 def get_user_alarms_with_next_buses(db: Session, user_id: int) -> List[Dict]:
     """
-    Kullanıcının tüm alarmlarını ve bir sonraki otobüs bilgilerini getirir
+    Kullanıcının tüm alarmlarını ve bir sonraki otobüs bilgilerini getirir.
+    Alarmlar hatlarıyla tek sorguda yüklenir; sonraki otobüs derlenmiş
+    sefer tablosundan hesaplanır.
     """
-    alarms = db.query(UserTransportAlarm).filter(
+    rows = db.query(UserTransportAlarm, TransportRoute).join(
+        TransportRoute, TransportRoute.id == UserTransportAlarm.route_id
+    ).filter(
         UserTransportAlarm.user_id == user_id,
         UserTransportAlarm.alarm_enabled == 1
-    ).all()
+    ).order_by(UserTransportAlarm.id).all()
     
     result = []
     current_time = datetime.now()
     
-    for alarm in alarms:
-        route = db.query(TransportRoute).filter(
-            TransportRoute.id == alarm.route_id
-        ).first()
-        
-        if not route:
-            continue
-        
+    for alarm, route in rows:
         next_bus = calculate_next_bus(route, current_time)
         
         alarm_info = {
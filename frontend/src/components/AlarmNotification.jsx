@@ -14,31 +14,60 @@ const AlarmNotification = () => {
       });
     }
 
-    // Her 30 saniyede bir bildirimleri kontrol et (10sn yerine)
-    const interval = setInterval(checkNotifications, 30000);
-    checkNotifications(); // İlk çalıştırma
+    let interval = null;
+    let source = null;
+
+    // Stream kullanılamazsa 30 saniyelik yoklamaya dön
+    const startPolling = () => {
+      if (interval) return;
+      checkNotifications();
+      interval = setInterval(checkNotifications, 30000);
+    };
+
+    const token = localStorage.getItem('token');
+    if (window.EventSource && token) {
+      // Bildirimler anında gelir; tarayıcı kopan bağlantıyı Last-Event-ID ile kendisi sürdürür
+      source = new EventSource(
+        `${api.defaults.baseURL}/notifications/stream?token=${encodeURIComponent(token)}`
+      );
+      source.onmessage = (event) => {
+        handleNotifications([JSON.parse(event.data)]);
+      };
+      source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED) {
+          startPolling();
+        }
+      };
+    } else {
+      startPolling();
+    }
 
-    return () => clearInterval(interval);
+    return () => {
+      if (source) source.close();
+      if (interval) clearInterval(interval);
+    };
   }, []);
 
-  const checkNotifications = async () => {
-    try {
-      const response = await api.get('/notifications');
-      const newNotifications = response.data.notifications || [];
+  const handleNotifications = (newNotifications) => {
+    if (newNotifications.length > 0) {
+      setNotifications(prev => [...newNotifications, ...prev].slice(0, 5));
 
-      if (newNotifications.length > 0) {
-        setNotifications(prev => [...newNotifications, ...prev].slice(0, 5));
+      // Tarayıcı bildirimi gönder
+      newNotifications.forEach(notif => {
+        if (permission === 'granted' && notif.type === 'transport_alarm') {
+          showBrowserNotification(notif);
+        }
+      });
 
-        // Tarayıcı bildirimi gönder
-        newNotifications.forEach(notif => {
-          if (permission === 'granted' && notif.type === 'transport_alarm') {
-            showBrowserNotification(notif);
-          }
-        });
+      // Ses çal (isteğe bağlı)
+      playNotificationSound();
+    }
+  };
 
-        // Ses çal (isteğe bağlı)
-        playNotificationSound();
-      }
+  const checkNotifications = async () => {
+    try {
+      const response = await api.get('/notifications');
+      handleNotifications(response.data.notifications || []);
     } catch (error) {
       console.error('Notification check error:', error);
     }
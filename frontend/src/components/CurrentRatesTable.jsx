@@ -19,9 +19,39 @@ export default function CurrentRatesTable() {
     };
 
     useEffect(() => {
-        fetchRates();
-        const interval = setInterval(fetchRates, 60000);
-        return () => clearInterval(interval);
+        let interval = null;
+        let source = null;
+
+        // Sunucu her güncellemede yeni listeyi gönderir; EventSource yoksa veya
+        // bağlantı kurulamazsa eski 60 saniyelik yoklamaya dönülür
+        const startPolling = () => {
+            if (interval) return;
+            fetchRates();
+            interval = setInterval(fetchRates, 60000);
+        };
+
+        if (window.EventSource) {
+            source = new EventSource(`${api.defaults.baseURL}/market-analysis/stream/current-rates`);
+            source.onmessage = (event) => {
+                setRates(JSON.parse(event.data));
+                setLoading(false);
+            };
+            source.onerror = () => {
+                // Hiç mesaj alınamadıysa stream kullanılamıyor demektir
+                if (source.readyState === EventSource.CLOSED) {
+                    startPolling();
+                }
+            };
+            // İlk mesaj gecikirse boş ekran kalmasın
+            fetchRates();
+        } else {
+            startPolling();
+        }
+
+        return () => {
+            if (source) source.close();
+            if (interval) clearInterval(interval);
+        };
     }, []);
 
     if (loading) {